@@ -0,0 +1,338 @@
+# Imports
+import argparse
+import contextlib
+import datetime
+import json
+import os
+import platform
+import shutil
+import statistics
+import tempfile
+import time
+import numpy as np
+import pandas as pd
+import constants
+import data_clean
+import data_relevant
+import score_calculation
+import score_optimization
+import score_statistics
+
+# Number of playoff teams and the rounds won by each seed's bracket spot (Cup winner first)
+PLAYOFF_ROUNDS_WON = [4, 3, 2, 2, 1, 1, 1, 1, 0, 0, 0, 0, 0, 0, 0, 0]
+
+# Extra columns written to the synthetic files so they are as wide as the MoneyPuck exports
+EXTRA_SKATER_COLUMNS = 100
+EXTRA_GOALIE_COLUMNS = 30
+
+# Situations each player has a row for in the MoneyPuck exports
+SKATER_SITUATIONS = ['other', 'all', '5on5', '4on5', '5on4']
+GOALIE_SITUATIONS = ['other', 'all', '5on5', '4on5', '5on4']
+
+
+# ====================================================================================================
+# FUNCTIONS FOR GENERATING A SYNTHETIC LEAGUE
+# ====================================================================================================
+
+def get_league_seasons(num_seasons: int, last_year: int = 2024) -> list:
+
+    # Seasons counting back from the last one, newest first like constants.SEASONS
+    return [f'{year}-{year + 1}' for year in range(last_year, last_year - num_seasons, -1)]
+
+
+def generate_league(folder: str, num_seasons: int, num_teams: int, seed: int = 0) -> dict:
+
+    rng = np.random.default_rng(seed)
+    seasons = get_league_seasons(num_seasons)
+    teams = [f'T{number:02d}' for number in range(num_teams)]
+    team_names = {f'Team {team_abbrev}': team_abbrev for team_abbrev in teams}
+    team_results = {}
+
+    os.makedirs(os.path.join(folder, 'raw_data', 'team_data'), exist_ok=True)
+    os.makedirs(os.path.join(folder, 'raw_data', 'standings_data'), exist_ok=True)
+
+    for season in seasons:
+        skater_frames = []
+        goalie_frames = []
+
+        for team_number, team_abbrev in enumerate(teams):
+            # Roster of skaters (forwards and defensemen) with a row per situation
+            num_skaters = int(rng.integers(24, 32))
+            games_played = rng.choice([82, 82, 81, 75, 60, 40, 15, 3], size=num_skaters).astype(float)
+            is_defense = rng.random(num_skaters) < 0.35
+            skaters = pd.DataFrame({
+                'playerId': team_number * 100 + np.arange(num_skaters),
+                'season': int(season[:4]),
+                'name': [f'{team_abbrev} Skater {number}' for number in range(num_skaters)],
+                'team': team_abbrev,
+                'position': np.where(is_defense, 'D', rng.choice(['C', 'L', 'R'], size=num_skaters)),
+                'games_played': games_played,
+                'icetime': games_played * rng.uniform(500, 1500, size=num_skaters),
+                'gameScore': games_played * rng.normal(0.5, 0.3, size=num_skaters),
+            })
+            skater_frames.append(pd.concat([skaters.assign(situation=situation) for situation in SKATER_SITUATIONS]))
+
+            # Goalies, one of which starts most games
+            games_played = np.array([55.0, 25.0, 4.0])
+            goalies = pd.DataFrame({
+                'playerId': team_number * 100 + 90 + np.arange(3),
+                'season': int(season[:4]),
+                'name': [f'{team_abbrev} Goalie {number}' for number in range(3)],
+                'team': team_abbrev,
+                'position': 'G',
+                'games_played': games_played,
+                'icetime': games_played * 3600.0,
+                'xGoals': games_played * rng.normal(2.8, 0.3, size=3),
+                'goals': np.round(games_played * rng.normal(2.7, 0.3, size=3)),
+            })
+            goalie_frames.append(pd.concat([goalies.assign(situation=situation) for situation in GOALIE_SITUATIONS]))
+
+        # Pad the files with the unused stat columns of the MoneyPuck exports
+        skaters_df = pd.concat(skater_frames, ignore_index=True)
+        goalies_df = pd.concat(goalie_frames, ignore_index=True)
+        skaters_df = skaters_df.join(pd.DataFrame(rng.random((len(skaters_df), EXTRA_SKATER_COLUMNS))).add_prefix('stat_'))
+        goalies_df = goalies_df.join(pd.DataFrame(rng.random((len(goalies_df), EXTRA_GOALIE_COLUMNS))).add_prefix('stat_'))
+
+        team_data_path = os.path.join(folder, 'raw_data', 'team_data', season)
+        skaters_df.to_csv(f'{team_data_path}_skaters.csv', index=False)
+        goalies_df.to_csv(f'{team_data_path}_goalies.csv', index=False)
+        pd.DataFrame({'team': teams, 'name': teams, 'situation': 'all', 'games_played': 82}).to_csv(
+            f'{team_data_path}_teams.csv', index=False)
+
+        # Standings list the full team names in a random order, like the Hockey Reference exports
+        standings_order = rng.permutation(teams)
+        pd.DataFrame({
+            'Rk': np.arange(1, num_teams + 1),
+            'Unnamed: 1': [f'Team {team_abbrev}' for team_abbrev in standings_order],
+            'Overall': '41-30-11',
+        }).to_csv(os.path.join(folder, 'raw_data', 'standings_data', f'{season}.csv'), index=False)
+
+        # Randomly seed the playoff bracket
+        playoff_teams = rng.permutation(teams)[:len(PLAYOFF_ROUNDS_WON)]
+        team_results[season] = dict(zip(playoff_teams.tolist(), PLAYOFF_ROUNDS_WON))
+
+    league = {
+        'seasons': seasons,
+        'teams': teams,
+        'team_names': team_names,
+        'team_results': team_results,
+    }
+
+    return league
+
+
+@contextlib.contextmanager
+def use_league(folder: str, league: dict = None):
+
+    # Constants the pipeline reads when it runs (the real league's constants are kept when no league is given)
+    replaced = {}
+    if league is not None:
+        replaced = {
+            'SEASONS': league['seasons'],
+            'TEAM_ABBREVIATIONS': league['teams'],
+            'TEAM_NAME_MAP': league['team_names'],
+            'TEAM_RESULTS': league['team_results'],
+        }
+    originals = {name: getattr(constants, name) for name in replaced}
+
+    # Run from the league's folder so every relative data path points into it
+    cwd = os.getcwd()
+    try:
+        for name, value in replaced.items():
+            setattr(constants, name, value)
+        os.chdir(folder)
+        for folder_name in ('relevant_data', 'scores'):
+            os.makedirs(folder_name, exist_ok=True)
+        clear_loaded_data()
+        yield
+    finally:
+        os.chdir(cwd)
+        for name, value in originals.items():
+            setattr(constants, name, value)
+        clear_loaded_data()
+
+
+def clear_loaded_data() -> None:
+
+    # Forget the team abbreviations and the data the optimizer loaded for the last league
+    data_relevant.get_season_abbreviations.cache_clear()
+    score_optimization.load_scoring_data.cache_clear()
+    score_optimization.get_evaluation_index.cache_clear()
+
+
+
+# ====================================================================================================
+# FUNCTIONS FOR TIMING EACH STAGE OF THE PIPELINE
+# ====================================================================================================
+
+def time_stage(stage, repeat: int) -> dict:
+
+    # The first run includes one time costs (building the raw data cache, loading files), so it is kept apart
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        stage()
+        times.append(time.perf_counter() - start)
+
+    timing = {
+        'first': times[0],
+        'min': min(times),
+        'median': statistics.median(times),
+        'times': times,
+    }
+
+    return timing
+
+
+def run_objective_trial() -> float:
+
+    try:
+        import optuna
+    except ImportError:
+        # Without Optuna the trial's evaluation is timed directly
+        return score_optimization.evaluate_weights(constants.SCORE_WEIGHTS)['score']
+
+    return score_optimization.objective(optuna.trial.FixedTrial(constants.SCORE_WEIGHTS))
+
+
+def benchmark_stages(seasons: list, repeat: int) -> dict:
+
+    stages = {}
+
+    # Normalizing the raw data files (every run after the first finds them already normalized)
+    stages['clean'] = time_stage(lambda: (data_clean.fix_team_abbreviations(seasons),
+                                          data_clean.abbreviate_standings_teams(seasons)), repeat)
+
+    # Feature extraction, one team at a time through get_scoring_data and for every team season at once
+    stages['features_per_team'] = time_stage(
+        lambda: [data_relevant.get_season_scoring_data(season) for season in seasons], repeat)
+    stages['features'] = time_stage(lambda: data_relevant.get_all_scoring_data(seasons), repeat)
+    scoring_data = data_relevant.get_all_scoring_data(seasons)
+    scoring_data.to_csv('relevant_data/scoring_data.csv', index=False)
+
+    # Scoring every team season one at a time through get_contender_score and every season's ranking at once
+    scoring_index = score_calculation.index_scoring_data(scoring_data)
+    team_seasons = list(zip(scoring_data['Season'], scoring_data['Team']))
+    stages['contender_score'] = time_stage(
+        lambda: [score_calculation.get_contender_score(team_abbrev, season, scoring_index)
+                 for season, team_abbrev in team_seasons], repeat)
+    stages['season_scores'] = time_stage(lambda: score_calculation.calculate_season_scores(scoring_data, seasons), repeat)
+    for season, df in score_calculation.calculate_season_scores(scoring_data, seasons).items():
+        df.to_csv(f'scores/{season}_scores.csv', index=False)
+
+    # One optimizer trial (the first one also loads the scoring data and builds the evaluation index)
+    stages['objective'] = time_stage(run_objective_trial, repeat)
+
+    # Rank statistics from the saved scores files
+    stages['statistics'] = time_stage(
+        lambda: score_statistics.get_rank_tables(score_statistics.load_season_scores(seasons)), repeat)
+
+    return stages
+
+
+def benchmark_real_data(repeat: int) -> dict:
+
+    if not os.path.isdir('raw_data'):
+        return None
+
+    # Work on a copy so the real data's caches and outputs are left as they are
+    with tempfile.TemporaryDirectory() as folder:
+        shutil.copytree('raw_data', os.path.join(folder, 'raw_data'))
+        with use_league(folder):
+            stages = benchmark_stages(constants.SEASONS, repeat)
+
+    run = {
+        'data': 'real',
+        'seasons': len(constants.SEASONS),
+        'teams': len(constants.TEAM_ABBREVIATIONS),
+        'stages': stages,
+    }
+
+    return run
+
+
+def benchmark_synthetic_data(num_seasons: int, num_teams: int, repeat: int, seed: int = 0) -> dict:
+
+    with tempfile.TemporaryDirectory() as folder:
+        league = generate_league(folder, num_seasons, num_teams, seed)
+        with use_league(folder, league):
+            stages = benchmark_stages(league['seasons'], repeat)
+
+    run = {
+        'data': 'synthetic',
+        'seasons': num_seasons,
+        'teams': num_teams,
+        'seed': seed,
+        'stages': stages,
+    }
+
+    return run
+
+
+def run_benchmarks(sizes: list, repeat: int = 3, real: bool = True, seed: int = 0) -> dict:
+
+    runs = []
+
+    if real:
+        run = benchmark_real_data(repeat)
+        if run is None:
+            print("No raw_data folder found, skipping the real data benchmark")
+        else:
+            runs.append(run)
+
+    for num_seasons, num_teams in sizes:
+        runs.append(benchmark_synthetic_data(num_seasons, num_teams, repeat, seed))
+
+    results = {
+        'created': datetime.datetime.now(datetime.timezone.utc).isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'pandas': pd.__version__,
+        'platform': platform.platform(),
+        'repeat': repeat,
+        'runs': runs,
+    }
+
+    return results
+
+
+def print_results(results: dict) -> None:
+
+    for run in results['runs']:
+        print(f"\n=== {run['data'].upper()} DATA: {run['seasons']} seasons x {run['teams']} teams ===")
+        print(f"{'Stage':<20} {'First (s)':>12} {'Min (s)':>12} {'Median (s)':>12}")
+        print("-" * 59)
+        for stage, timing in run['stages'].items():
+            print(f"{stage:<20} {timing['first']:>12.4f} {timing['min']:>12.4f} {timing['median']:>12.4f}")
+
+
+def parse_size(size: str) -> tuple:
+
+    # Sizes are given as SEASONSxTEAMS, like 100x32
+    num_seasons, num_teams = size.lower().split('x')
+
+    return int(num_seasons), int(num_teams)
+
+
+def parse_args() -> argparse.Namespace:
+
+    parser = argparse.ArgumentParser(description='Time each stage of the pipeline on real and synthetic data.')
+    parser.add_argument('--sizes', nargs='*', type=parse_size, default=[(17, 32)],
+                        help='synthetic leagues to benchmark, as SEASONSxTEAMS (e.g. 17x32 100x32)')
+    parser.add_argument('--repeat', type=int, default=3, help='number of times each stage is run')
+    parser.add_argument('--no-real', action='store_true', help='skip the benchmark on the real data')
+    parser.add_argument('--seed', type=int, default=0, help='seed of the synthetic league generator')
+    parser.add_argument('--output', default='benchmarks/results.json', help='JSON file the results are written to')
+
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    results = run_benchmarks(args.sizes, args.repeat, not args.no_real, args.seed)
+    print_results(results)
+
+    os.makedirs(os.path.dirname(args.output) or '.', exist_ok=True)
+    with open(args.output, 'w') as file:
+        json.dump(results, file, indent=4)
+    print(f"\nResults written to {args.output}")
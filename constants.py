@@ -71,6 +71,26 @@ SEA_SEASONS = ['2024-2025', '2023-2024', '2022-2023', '2021-2022']
 # Seasons the Utah Hockey Club played in the league
 UTA_SEASONS = ['2024-2025']
 
+# Conferences can't be read from the data: the Hockey Reference standings files are the league-wide table (rank,
+# team and records) and the MoneyPuck files only name the team, so the playoff bracket's sides are listed here
+
+# Teams in the Eastern Conference since the 2013-2014 realignment (every other team plays in the Western Conference)
+EAST_TEAMS = [
+    'BOS', 'BUF', 'CAR', 'CBJ', 'DET', 'FLA', 'MTL', 'NJD',
+    'NYI', 'NYR', 'OTT', 'PHI', 'PIT', 'TBL', 'TOR', 'WSH'
+]
+
+# Seasons before the 2013-2014 realignment and the conference each team that changed conferences played in then
+PRE_REALIGNMENT_SEASONS = ['2012-2013', '2011-2012', '2010-2011', '2009-2010', '2008-2009']
+PRE_REALIGNMENT_CONFERENCES = {'CBJ': 'West', 'DET': 'West', 'WPG': 'East'}
+
+# Teams on the eastern side of the playoff bracket in seasons played in temporary divisions (in 2020-2021 the East
+# and Central division winners met in one semifinal, the North and West division winners in the other)
+DIVISION_SEASON_EAST_TEAMS = {
+    '2020-2021': ['BOS', 'BUF', 'NJD', 'NYI', 'NYR', 'PHI', 'PIT', 'WSH',
+                  'CAR', 'CHI', 'CBJ', 'DAL', 'DET', 'FLA', 'NSH', 'TBL'],
+}
+
 
 # Z-score constants (mean and standard deviations for player average games scores/ goalie GSAx)
 Z_STATS = {
@@ -108,6 +128,18 @@ Z_STATS = {
     }
 }
 
+# Scoring data column holding each group's stat (in the order groups are added to contender scores)
+SCORE_GROUP_COLUMNS = {
+    'one_three_f': '1-3 F Avg Game Score',
+    'four_six_f': '4-6 F Avg Game Score',
+    'seven_nine_f': '7-9 F Avg Game Score',
+    'ten_twelve_f': '9-12 F Avg Game Score',
+    'one_two_d': '1-2 D Avg Game Score',
+    'three_four_d': '3-4 D Avg Game Score',
+    'five_six_d': '5-6 D Avg Game Score',
+    'goalie_gsax': 'Starting Goalie Avg GSAx',
+}
+
 # Factor weights for increasing contender scores
 SCORE_WEIGHTS = {
     'one_three_f': 4.65,
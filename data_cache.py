@@ -0,0 +1,469 @@
+# Imports
+import argparse
+import contextlib
+import hashlib
+import json
+import os
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+import numpy as np
+import pandas as pd
+from pandas.api.types import union_categoricals
+import constants
+import instrumentation
+
+# Folder that holds the binary copies of the raw data files
+CACHE_DIR = 'cache'
+
+# Folders of the raw data files as downloaded and of their normalized copies (made by data_clean) that are read
+RAW_DATA_DIR = 'raw_data'
+NORMALIZED_DATA_DIR = 'normalized_data'
+
+# Columns of each raw data set that are used by the pipeline
+SKATER_COLUMNS = ['team', 'position', 'situation', 'games_played', 'icetime', 'gameScore']
+GOALIE_COLUMNS = ['team', 'situation', 'games_played', 'xGoals', 'goals']
+STANDINGS_COLUMNS = ['Rk', 'Team']
+
+# Compact types of the raw data columns (games played is a whole number, so a 32 bit float holds it exactly)
+COLUMN_DTYPES = {
+    'team': 'category',
+    'position': 'category',
+    'situation': 'category',
+    'games_played': 'float32',
+    'icetime': 'float64',
+    'gameScore': 'float64',
+    'xGoals': 'float64',
+    'goals': 'float64',
+}
+
+# Situations kept from the raw data files (every other situation's rows are dropped while reading)
+SITUATIONS = ['all']
+
+# Rows parsed at a time, so a large export is never fully held in memory before it is filtered
+CHUNK_ROWS = 100_000
+
+# Version of the cache layout, so caches written by older code are rebuilt
+CACHE_VERSION = 2
+
+# Raw data sets loaded for every season
+DATA_SETS = ['skaters', 'goalies', 'standings']
+
+# Pools the season files can be loaded with (threads share the parsed frames, processes parse in parallel
+# without the GIL but send the frames back pickled)
+LOAD_EXECUTORS = {
+    'thread': ThreadPoolExecutor,
+    'process': ProcessPoolExecutor,
+}
+
+
+# ====================================================================================================
+# FUNCTIONS FOR GETTING THE PATHS OF RAW DATA FILES
+# ====================================================================================================
+
+def team_data_path(season: str, data_set: str, data_dir: str = NORMALIZED_DATA_DIR) -> str:
+    return f'{data_dir}/team_data/{season}_{data_set}.csv'
+
+
+def standings_path(season: str, data_dir: str = NORMALIZED_DATA_DIR) -> str:
+    return f'{data_dir}/standings_data/{season}.csv'
+
+
+def set_cache_dir(cache_dir: str) -> None:
+    global CACHE_DIR
+    CACHE_DIR = cache_dir
+
+
+@contextlib.contextmanager
+def use_cache_dir(cache_dir: str):
+
+    # Read and write the cached copies in another folder until the block ends
+    previous_cache_dir = CACHE_DIR
+    set_cache_dir(cache_dir)
+    try:
+        yield
+    finally:
+        set_cache_dir(previous_cache_dir)
+
+
+def cache_path(file_path: str) -> str:
+
+    # Mirror the raw data file's path inside the cache folder
+    name = os.path.splitext(os.path.normpath(file_path))[0].replace(os.sep, '__')
+
+    return os.path.join(CACHE_DIR, name)
+
+
+
+# ====================================================================================================
+# FUNCTIONS FOR WRITING FILES SAFELY AND CHECKING WHETHER FILES CHANGED
+# ====================================================================================================
+
+@contextlib.contextmanager
+def atomic_write(file_path: str):
+
+    # Write to a temporary file first so an interrupted write never leaves a broken file behind, with a new
+    # temporary file for every write so writers running at the same time (in other threads or processes) never
+    # write over each other's (the extension is kept, since NumPy adds its own to paths without it)
+    folder = os.path.dirname(file_path) or '.'
+    os.makedirs(folder, exist_ok=True)
+    root, extension = os.path.splitext(os.path.basename(file_path))
+    file_descriptor, tmp_path = tempfile.mkstemp(prefix=f'{root}.', suffix=f'.tmp{extension}', dir=folder)
+    os.close(file_descriptor)
+    try:
+        yield tmp_path
+        os.replace(tmp_path, file_path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def write_json(file_path: str, data, indent: int = 4) -> None:
+    with atomic_write(file_path) as tmp_path, open(tmp_path, 'w') as file:
+        json.dump(data, file, indent=indent)
+
+
+def get_file_hash(file_path: str) -> str:
+
+    # Hash the file in blocks so large exports are never fully held in memory
+    sha256 = hashlib.sha256()
+    with open(file_path, 'rb') as file:
+        for block in iter(lambda: file.read(1 << 20), b''):
+            sha256.update(block)
+
+    return sha256.hexdigest()
+
+
+def get_file_fingerprint(file_path: str, saved: dict = None) -> dict:
+
+    # An unchanged modification time and size means the file was not touched, so its saved hash is reused
+    # instead of reading the whole file again
+    stat = os.stat(file_path)
+    fingerprint = {'mtime_ns': stat.st_mtime_ns, 'size': stat.st_size}
+    if saved is not None and saved.get('mtime_ns') == stat.st_mtime_ns and saved.get('size') == stat.st_size:
+        fingerprint['sha256'] = saved['sha256']
+    else:
+        fingerprint['sha256'] = get_file_hash(file_path)
+
+    return fingerprint
+
+
+
+# ====================================================================================================
+# FUNCTIONS FOR READING AND WRITING CACHED COPIES OF RAW DATA FILES
+# ====================================================================================================
+
+
+def load_cache_meta(file_path: str) -> dict:
+
+    meta_path = os.path.join(cache_path(file_path), 'meta.json')
+    if not os.path.exists(meta_path):
+        return None
+
+    with open(meta_path) as file:
+        meta = json.load(file)
+
+    return meta
+
+
+def write_cache_meta(file_path: str, meta: dict) -> None:
+
+    write_json(os.path.join(cache_path(file_path), 'meta.json'), meta, indent=None)
+
+
+def is_cache_valid(file_path: str, meta: dict, columns: list) -> bool:
+
+    if meta is None or meta.get('version') != CACHE_VERSION:
+        return False
+
+    # The cache has to hold the rows of the same situations
+    if meta.get('situations') != SITUATIONS:
+        return False
+
+    # The cache has to hold every requested column
+    if not set(columns) <= set(meta['columns']) | set(meta['missing_columns']):
+        return False
+
+    # Only trust the cache if the source's contents are the same
+    fingerprint = get_file_fingerprint(file_path, meta)
+    if fingerprint['sha256'] != meta['sha256']:
+        return False
+
+    # The source was touched without changing its contents, so its new modification time and size are kept
+    if any(meta[key] != value for key, value in fingerprint.items()):
+        meta.update(fingerprint)
+        write_cache_meta(file_path, meta)
+
+    return True
+
+
+def read_csv(file_path: str, **kwargs) -> pd.DataFrame:
+
+    # Parse a whole file that isn't cached, counted like the files the cached reads parse
+    instrumentation.count_csv_read(file_path)
+
+    return pd.read_csv(file_path, **kwargs)
+
+
+def read_csv_chunks(file_path: str, columns: list) -> pd.DataFrame:
+
+    # Parse only the needed columns of the source file, a chunk of rows at a time with compact types
+    instrumentation.count_csv_read(file_path)
+    chunks = []
+    dtypes = {column: dtype for column, dtype in COLUMN_DTYPES.items() if column in columns}
+    for chunk in pd.read_csv(file_path, usecols=lambda column: column in columns, dtype=dtypes, chunksize=CHUNK_ROWS):
+
+        # Drop the rows of other situations before keeping the chunk
+        if 'situation' in chunk.columns:
+            chunk = chunk[chunk['situation'].isin(SITUATIONS)]
+        chunks.append(chunk)
+
+    # A file without any chunks to read gives an empty frame of its header's columns with their compact types
+    if not chunks:
+        return pd.read_csv(file_path, usecols=lambda column: column in columns, dtype=dtypes, nrows=0)
+
+    # Each chunk has its own categories, so every chunk's text columns are given the same sorted categories
+    # before they are combined (chunks with different categories would be combined into object columns)
+    for column in chunks[0].columns:
+        if isinstance(chunks[0][column].dtype, pd.CategoricalDtype):
+            categories = union_categoricals([chunk[column] for chunk in chunks], sort_categories=True).categories
+            dtype = pd.CategoricalDtype(categories)
+            chunks = [chunk.assign(**{column: chunk[column].astype(dtype)}) for chunk in chunks]
+
+    df = pd.concat(chunks, ignore_index=True)
+    for column in df.columns:
+        if isinstance(df[column].dtype, pd.CategoricalDtype):
+            df[column] = df[column].cat.remove_unused_categories()
+
+    return df
+
+
+@instrumentation.instrument
+def write_cache(file_path: str, columns: list) -> pd.DataFrame:
+
+    df = read_csv_chunks(file_path, columns)
+
+    # Store each column as its own array so reads can skip the columns they don't need
+    arrays = {}
+    for column in df.columns:
+        if isinstance(df[column].dtype, pd.CategoricalDtype):
+            # Categorical columns are stored as their integer codes into their categories
+            arrays[f'{column}.codes'] = df[column].cat.codes.to_numpy().astype(np.int32)
+            arrays[f'{column}.values'] = np.asarray(df[column].cat.categories, dtype=str)
+        elif pd.api.types.is_numeric_dtype(df[column]):
+            arrays[column] = df[column].to_numpy()
+        else:
+            # Other text columns are stored as small integer codes into their sorted unique values
+            codes, uniques = pd.factorize(df[column], sort=True)
+            arrays[f'{column}.codes'] = codes.astype(np.int32)
+            arrays[f'{column}.values'] = np.asarray(uniques, dtype=str)
+
+    meta = {
+        'version': CACHE_VERSION,
+        'source': file_path,
+        **get_file_fingerprint(file_path),
+        'situations': SITUATIONS,
+        'columns': list(df.columns),
+        'missing_columns': [column for column in columns if column not in df.columns],
+    }
+
+    # The columns are written before the meta file that marks them as valid
+    with atomic_write(os.path.join(cache_path(file_path), 'columns.npz')) as tmp_path:
+        np.savez(tmp_path, **arrays)
+    write_cache_meta(file_path, meta)
+
+    return df
+
+
+def read_cache(file_path: str, columns: list) -> pd.DataFrame:
+
+    # Only the requested columns are loaded from the archive
+    data = {}
+    with np.load(os.path.join(cache_path(file_path), 'columns.npz')) as arrays:
+        for column in columns:
+            if column in arrays.files:
+                data[column] = arrays[column]
+            elif f'{column}.codes' in arrays.files:
+                # Text columns are read back as categoricals, with missing values keeping the code -1
+                data[column] = pd.Categorical.from_codes(arrays[f'{column}.codes'],
+                                                         categories=arrays[f'{column}.values'].astype(object))
+
+    return pd.DataFrame(data)
+
+
+@instrumentation.instrument
+def read_raw_csv(file_path: str, columns: list) -> pd.DataFrame:
+
+    # The normalized copies only exist once data_clean has been run on the raw data files
+    if not os.path.exists(file_path) and file_path.startswith(f'{NORMALIZED_DATA_DIR}/'):
+        raise FileNotFoundError(f"No normalized copy of the raw data file: {file_path!r} "
+                                f"(run `python data_clean.py` first)")
+
+    # Build the cached copy the first time the file is read or whenever it changes
+    meta = load_cache_meta(file_path)
+    if not is_cache_valid(file_path, meta, columns):
+
+        # Keep the columns other readers already cached so they don't rebuild it again
+        cache_columns = list(columns)
+        if meta is not None:
+            cache_columns = list(dict.fromkeys(meta['columns'] + cache_columns))
+
+        write_cache(file_path, cache_columns)
+
+    return read_cache(file_path, columns)
+
+
+def read_skaters(season: str, columns: list = SKATER_COLUMNS) -> pd.DataFrame:
+    return read_raw_csv(team_data_path(season, 'skaters'), columns)
+
+
+def read_goalies(season: str, columns: list = GOALIE_COLUMNS) -> pd.DataFrame:
+    return read_raw_csv(team_data_path(season, 'goalies'), columns)
+
+
+def read_standings(season: str, columns: list = STANDINGS_COLUMNS) -> pd.DataFrame:
+    return read_raw_csv(standings_path(season), columns)
+
+
+
+# ====================================================================================================
+# FUNCTIONS FOR LOADING EVERY SEASON'S RAW DATA CONCURRENTLY
+# ====================================================================================================
+
+def read_data_set(season: str, data_set: str) -> pd.DataFrame:
+
+    # Each data set is its own file with its own cached copy, so files can be read at the same time
+    readers = {'skaters': read_skaters, 'goalies': read_goalies, 'standings': read_standings}
+
+    return readers[data_set](season)
+
+
+@instrumentation.instrument
+def load_seasons(seasons: list = None, data_sets: list = DATA_SETS, workers: int = None,
+                 executor: str = 'thread') -> dict:
+
+    if seasons is None:
+        seasons = constants.SEASONS
+
+    if executor not in LOAD_EXECUTORS:
+        raise ValueError(f"Invalid executor: {executor!r} (expected one of {', '.join(LOAD_EXECUTORS)})")
+
+    # Every file is a separate task, so a season's files are also read at the same time
+    tasks = [(season, data_set) for season in seasons for data_set in data_sets]
+
+    # A single worker reads the files one after another without starting a pool
+    if workers == 1 or len(tasks) < 2:
+        frames = [read_data_set(season, data_set) for season, data_set in tasks]
+    else:
+        # The pool's threads record their spans under this function's span (worker processes aren't recorded)
+        read_task = read_data_set if executor == 'process' else instrumentation.within_current_span(read_data_set)
+        # Worker processes that import the module again are handed the cache folder in use
+        with LOAD_EXECUTORS[executor](max_workers=workers, initializer=set_cache_dir, initargs=(CACHE_DIR,)) as pool:
+            frames = list(pool.map(read_task, *zip(*tasks)))
+
+    # Map every season to its frames, in the order the seasons and data sets were given
+    season_frames = {season: {} for season in seasons}
+    for (season, data_set), df in zip(tasks, frames):
+        season_frames[season][data_set] = df
+
+    return season_frames
+
+
+def check_load_parity(seasons: list = None, workers: int = None, executor: str = 'thread') -> None:
+
+    if seasons is None:
+        seasons = constants.SEASONS
+
+    # Load every season's files one after another and concurrently
+    sequential_frames = load_seasons(seasons, workers=1)
+    concurrent_frames = load_seasons(seasons, workers=workers, executor=executor)
+
+    # Both ways of loading must give the same frames for every season
+    assert list(concurrent_frames) == list(sequential_frames)
+    for season, frames in sequential_frames.items():
+        assert list(concurrent_frames[season]) == list(frames)
+        for data_set, df in frames.items():
+            pd.testing.assert_frame_equal(concurrent_frames[season][data_set], df, check_exact=True)
+
+
+
+# ====================================================================================================
+# FUNCTION FOR REPORTING COLD AND WARM CACHE LOAD TIMES
+# ====================================================================================================
+
+def report_load_times(seasons: list = None, workers: int = None, executor: str = 'thread') -> dict:
+
+    if seasons is None:
+        seasons = constants.SEASONS
+
+    # Parsing the text files directly, as the pipeline did before the cache
+    start = time.perf_counter()
+    for season in seasons:
+        read_csv(team_data_path(season, 'skaters'))
+        read_csv(team_data_path(season, 'goalies'))
+        read_csv(standings_path(season))
+    csv_time = time.perf_counter() - start
+
+    # The cold and warm loads use their own empty cache folders (on the same disk as the cache), so the cache
+    # already built is left as it is
+    with tempfile.TemporaryDirectory(prefix='load_times.', dir=os.path.dirname(os.path.abspath(CACHE_DIR))) as tmp_dir:
+
+        # Cold load: the cache is empty, so every file is parsed and written to the cache
+        with use_cache_dir(os.path.join(tmp_dir, 'sequential')):
+            start = time.perf_counter()
+            load_seasons(seasons, workers=1)
+            cold_time = time.perf_counter() - start
+
+            # Warm load: every file is read back from the cache
+            start = time.perf_counter()
+            load_seasons(seasons, workers=1)
+            warm_time = time.perf_counter() - start
+
+        # The same cold and warm loads with the files read concurrently
+        with use_cache_dir(os.path.join(tmp_dir, 'concurrent')):
+            start = time.perf_counter()
+            load_seasons(seasons, workers=workers, executor=executor)
+            concurrent_cold_time = time.perf_counter() - start
+
+            start = time.perf_counter()
+            load_seasons(seasons, workers=workers, executor=executor)
+            concurrent_warm_time = time.perf_counter() - start
+
+    load_times = {
+        'csv': csv_time,
+        'cold': cold_time,
+        'warm': warm_time,
+        'concurrent_cold': concurrent_cold_time,
+        'concurrent_warm': concurrent_warm_time,
+    }
+
+    print(f"Full CSV load: {csv_time:.3f}s")
+    print(f"Cold cache load: {cold_time:.3f}s")
+    print(f"Warm cache load: {warm_time:.3f}s")
+    print(f"Concurrent cold cache load ({executor} pool): {concurrent_cold_time:.3f}s")
+    print(f"Concurrent warm cache load ({executor} pool): {concurrent_warm_time:.3f}s")
+
+    return load_times
+
+
+def parse_args() -> argparse.Namespace:
+
+    parser = argparse.ArgumentParser(description='Report how long loading every season\'s raw data files takes.')
+    parser.add_argument('--workers', type=int, default=None,
+                        help='number of files read at the same time (default: one per processor)')
+    parser.add_argument('--executor', choices=list(LOAD_EXECUTORS), default='thread',
+                        help='pool the files are read with')
+    parser.add_argument('--check', action='store_true',
+                        help='also check the concurrent load gives the same frames as a sequential one')
+
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    instrumentation.enable_from_env()
+    report_load_times(workers=args.workers, executor=args.executor)
+
+    if args.check:
+        check_load_parity(workers=args.workers, executor=args.executor)
+        print("Concurrent load matches the sequential load")
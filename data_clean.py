@@ -1,52 +1,187 @@
-
 # Imports
+import functools
+import hashlib
+import json
+import os
+import shutil
 import pandas as pd
 import constants
+import data_cache
+import instrumentation
+
+# Inconsistent abbreviations used in the MoneyPuck exports and the abbreviations they are replaced by
+REPLACEMENTS = {
+    'L.A': 'LAK',
+    'N.J': 'NJD',
+    'S.J': 'SJS',
+    'T.B': 'TBL'
+}
+
+# Columns of each team data set that hold team abbreviations
+TEAM_COLUMNS = {
+    'skaters': ['team'],
+    'goalies': ['team'],
+    'teams': ['team', 'name'],
+}
+
+# Checksums of every raw file and the normalized file made from it
+MANIFEST_PATH = os.path.join(data_cache.NORMALIZED_DATA_DIR, 'manifest.json')
+
+
+# ====================================================================================================
+# FUNCTIONS FOR TRACKING WHICH RAW FILES ARE ALREADY NORMALIZED
+# ====================================================================================================
+
+def get_rules_hash() -> str:
+
+    # Normalized files are made again whenever the rules used to make them change
+    rules = json.dumps([REPLACEMENTS, TEAM_COLUMNS, constants.TEAM_NAME_MAP], sort_keys=True)
+
+    return hashlib.sha256(rules.encode()).hexdigest()
+
+
+def load_manifest() -> dict:
+
+    if not os.path.exists(MANIFEST_PATH):
+        return {}
+
+    with open(MANIFEST_PATH) as file:
+        manifest = json.load(file)
+
+    return manifest
+
+
+def save_manifest(manifest: dict) -> None:
+    data_cache.write_json(MANIFEST_PATH, manifest)
+
+
+def is_normalized(raw_path: str, normalized_path: str, entry: dict, rules_hash: str) -> bool:
+
+    # Entries of manifests written before the files were fingerprinted are normalized again
+    if entry is None or entry.get('rules') != rules_hash or 'raw' not in entry or not os.path.exists(normalized_path):
+        return False
+
+    # The normalized file must still be the one that was written, and the raw file must still have the
+    # contents it had when it was normalized
+    for path, key in ((normalized_path, 'normalized'), (raw_path, 'raw')):
+        fingerprint = data_cache.get_file_fingerprint(path, entry[key])
+        if fingerprint['sha256'] != entry[key]['sha256']:
+            return False
+        entry[key] = fingerprint
+
+    return True
+
+
+def normalize_file(raw_path: str, normalize, manifest: dict, rules_hash: str) -> bool:
+
+    normalized_path = os.path.join(data_cache.NORMALIZED_DATA_DIR,
+                                   os.path.relpath(raw_path, data_cache.RAW_DATA_DIR))
+    if is_normalized(raw_path, normalized_path, manifest.get(raw_path), rules_hash):
+        return False
+
+    # Read every value as text so the values that are not replaced are written back exactly as they were
+    df = data_cache.read_csv(raw_path, dtype=str, keep_default_na=False)
+    normalized_df = normalize(df)
+
+    # Copy the raw file as is when nothing in it had to change
+    with data_cache.atomic_write(normalized_path) as tmp_path:
+        if normalized_df is None:
+            shutil.copyfile(raw_path, tmp_path)
+        else:
+            normalized_df.to_csv(tmp_path, index=False)
+
+    manifest[raw_path] = {
+        'rules': rules_hash,
+        'raw': data_cache.get_file_fingerprint(raw_path),
+        'normalized': data_cache.get_file_fingerprint(normalized_path),
+    }
+
+    return True
+
+
 
 # ====================================================================================================
-# SCRIPT TO FIX INCONSISTENT TEAM ABBREVIATIONS IN RAW DATA FILES
+# FUNCTION TO FIX INCONSISTENT TEAM ABBREVIATIONS IN RAW DATA FILES
 # ====================================================================================================
 
-for season in constants.SEASONS:
-    for data_set in ['skaters', 'goalies', 'teams']:
+def normalize_team_data(df: pd.DataFrame, team_columns: list) -> pd.DataFrame:
+
+    # Replace inconsistent abbreviations in the team columns only
+    team_columns = [column for column in team_columns if column in df.columns]
+    if not df[team_columns].isin(list(REPLACEMENTS)).any().any():
+        return None
+
+    for column in team_columns:
+        df[column] = df[column].replace(REPLACEMENTS)
+
+    return df
+
 
-        # Load the CSV file
-        file_path = f'raw_data/team_data/{season}_{data_set}.csv'
-        df = pd.read_csv(file_path)
+def fix_team_abbreviations(seasons: list = None) -> list:
 
-        # Define replacements for inconsistent abreviations
-        replacements = {
-            'L.A': 'LAK',
-            'N.J': 'NJD',
-            'S.J': 'SJS',
-            'T.B': 'TBL'
-        }
+    if seasons is None:
+        seasons = constants.SEASONS
 
-        # Replace values across the entire DataFrame
-        df = df.replace(replacements, regex=False)
+    manifest = load_manifest()
+    rules_hash = get_rules_hash()
+    normalized_files = []
 
-        # Save updated CSV file
-        df.to_csv(file_path, index=False)
+    for season in seasons:
+        for data_set in ['skaters', 'goalies', 'teams']:
+            file_path = data_cache.team_data_path(season, data_set, data_cache.RAW_DATA_DIR)
+            normalize = functools.partial(normalize_team_data, team_columns=TEAM_COLUMNS[data_set])
+            if normalize_file(file_path, normalize, manifest, rules_hash):
+                normalized_files.append(file_path)
+
+    save_manifest(manifest)
+
+    return normalized_files
 
 
 
 # ====================================================================================================
-# SCRIPT TO CHANGE TEAM NAMES TO THEIR ABREVIATIONS IN STANDINGS FILES
+# FUNCTION TO CHANGE TEAM NAMES TO THEIR ABREVIATIONS IN STANDINGS FILES
 # ====================================================================================================
 
-for season in constants.SEASONS:
+def normalize_standings(df: pd.DataFrame) -> pd.DataFrame:
 
-    # Load the CSV file
-    file_path = f'raw_data/standings_data/{season}.csv'
-    df = pd.read_csv(file_path, header=0)
+    # Nothing has to change once the 2nd column is 'Team' and holds abbreviations
+    if df.columns[1] == 'Team' and not df['Team'].isin(list(constants.TEAM_NAME_MAP)).any():
+        return None
 
     # Rename the 2nd column to 'Team'
-    if df.columns[1] != 'Team':
-        df.columns.values[1] = 'Team'
+    df.columns = [*df.columns[:1], 'Team', *df.columns[2:]]
 
     # Replace full names with abbreviations
-    df['Team'] = df['Team'].map(constants.TEAM_NAME_MAP).fillna(df['Team'])  
+    df['Team'] = df['Team'].map(constants.TEAM_NAME_MAP).fillna(df['Team'])
+
+    return df
+
+
+def abbreviate_standings_teams(seasons: list = None) -> list:
+
+    if seasons is None:
+        seasons = constants.SEASONS
+
+    manifest = load_manifest()
+    rules_hash = get_rules_hash()
+    normalized_files = []
+
+    for season in seasons:
+        file_path = data_cache.standings_path(season, data_cache.RAW_DATA_DIR)
+        if normalize_file(file_path, normalize_standings, manifest, rules_hash):
+            normalized_files.append(file_path)
+
+    save_manifest(manifest)
+
+    return normalized_files
+
+
+def main() -> None:
+    instrumentation.enable_from_env()
+    normalized_files = fix_team_abbreviations() + abbreviate_standings_teams()
+    print(f"Normalized {len(normalized_files)} file(s) into {data_cache.NORMALIZED_DATA_DIR}")
 
-    # Save updated CSV file
-    df.to_csv(file_path, index=False)
 
+if __name__ == '__main__':
+    main()
@@ -1,65 +1,199 @@
-
 # Imports
+import argparse
+import numpy as np
 import pandas as pd
+import constants
+import data_cache
+import data_relevant
+import instrumentation
+
+# Playoff results, from losing in the first round (0) to winning the Cup (4)
+RESULT_LEVELS = range(5)
+
+# Each tuple represents (team data set name, rounds won, whether teams that won more rounds are included)
+COHORTS = [
+    ('All Teams', 0, True),
+    ('Teams that didn\'t win a round', 0, False),
+    *[cohort for rounds_won in RESULT_LEVELS[1:-1] for cohort in (
+        (f'Teams that won at least {rounds_won} round(s)', rounds_won, True),
+        (f'Teams that won only {rounds_won} round(s)', rounds_won, False))],
+    (f'Teams that won at least {RESULT_LEVELS[-1]} round(s)', RESULT_LEVELS[-1], True),
+]
+
+# Running counts, means and sums of squared differences behind the measures, kept between updates
+STATE_PATH = 'relevant_data/measures_state.npz'
+
 
 # ====================================================================================================
-# SCRIPT FOR GATHERING MEANS AND STANDARD DEVIATIONS OF CONTENDER'S RELEVANT DATA TO USE IN SCORING
+# FUNCTIONS FOR ACCUMULATING MEANS AND STANDARD DEVIATIONS BY PLAYOFF RESULT
 # ====================================================================================================
 
-# Load the scoring data
-df = pd.read_csv('relevant_data/scoring_data.csv')
-
-# Initialize list to store all averages
-measures_data = []
-
-# Loop for calculating averages for different minimum number of playoff round wins
-loop_count = 0
-for rounds_won in [0, 0, 1, 1, 2, 2, 3, 3, 4]:
-
-    # Get filtered data of teams who won the minimum number of playoff wins
-    if loop_count == 0:
-        team_data_set = df[df['Result'] >= rounds_won]
-        team_data_set_str = 'All Teams'
-    elif loop_count == 1:
-        team_data_set = df[df['Result'] == rounds_won]
-        team_data_set_str = 'Teams that didn\'t win a round'
-    elif loop_count % 2 == 0:
-        team_data_set = df[df['Result'] >= rounds_won]
-        team_data_set_str = f'Teams that won at least {rounds_won} round(s)'
-    else:
-        team_data_set = df[df['Result'] == rounds_won]
-        team_data_set_str = f'Teams that won only {rounds_won} round(s)'
-
-    # Create columns, calculating averages and standard deviations
-    averages = {
-        'Team Data Set': team_data_set_str,
-        'Teams Used': team_data_set.shape[0],
-
-        'MEAN 1-3 F Avg Game Score': round(team_data_set['1-3 F Avg Game Score'].mean(), 3),
-        'MEAN 4-6 F Avg Game Score': round(team_data_set['4-6 F Avg Game Score'].mean(), 3),
-        'MEAN 7-9 F Avg Game Score': round(team_data_set['7-9 F Avg Game Score'].mean(), 3),
-        'MEAN 9-12 F Avg Game Score': round(team_data_set['9-12 F Avg Game Score'].mean(), 3),
-        'MEAN 1-2 D Avg Game Score': round(team_data_set['1-2 D Avg Game Score'].mean(), 3),
-        'MEAN 3-4 D Avg Game Score': round(team_data_set['3-4 D Avg Game Score'].mean(), 3),
-        'MEAN 5-6 D Avg Game Score': round(team_data_set['5-6 D Avg Game Score'].mean(), 3),
-        'MEAN Starting Goalie Avg GSAx': round(team_data_set['Starting Goalie Avg GSAx'].mean(), 3),
-
-        'STD 1-3 F Avg Game Score': round(team_data_set['1-3 F Avg Game Score'].std(), 3),
-        'STD 4-6 F Avg Game Score': round(team_data_set['4-6 F Avg Game Score'].std(), 3),
-        'STD 7-9 F Avg Game Score': round(team_data_set['7-9 F Avg Game Score'].std(), 3),
-        'STD 9-12 F Avg Game Score': round(team_data_set['9-12 F Avg Game Score'].std(), 3),
-        'STD 1-2 D Avg Game Score': round(team_data_set['1-2 D Avg Game Score'].std(), 3),
-        'STD 3-4 D Avg Game Score': round(team_data_set['3-4 D Avg Game Score'].std(), 3),
-        'STD 5-6 D Avg Game Score': round(team_data_set['5-6 D Avg Game Score'].std(), 3),
-        'STD Starting Goalie Avg GSAx': round(team_data_set['Starting Goalie Avg GSAx'].std(), 3),
+@instrumentation.instrument
+def get_result_accumulators(df: pd.DataFrame) -> dict:
+
+    columns = list(constants.SCORE_GROUP_COLUMNS.values())
+
+    # Get the count, mean and variance of every stat for every playoff result in one grouped pass
+    grouped = df[df['Result'].isin(RESULT_LEVELS)].groupby('Result')
+    stats = grouped[columns].agg(['count', 'mean', 'var']).reindex(RESULT_LEVELS)
+    counts = stats.xs('count', axis=1, level=1).fillna(0).to_numpy()
+
+    # Accumulators hold (playoff results x stats) arrays, with empty groups given a mean and spread of 0
+    accumulators = {
+        'rows': grouped.size().reindex(RESULT_LEVELS, fill_value=0).to_numpy(),
+        'count': counts,
+        'mean': np.where(counts > 0, stats.xs('mean', axis=1, level=1).to_numpy(), 0.0),
+        'm2': np.where(counts > 1, stats.xs('var', axis=1, level=1).to_numpy() * (counts - 1), 0.0),
+    }
+
+    return accumulators
+
+
+def merge_accumulators(a: dict, b: dict) -> dict:
+
+    # Combine the counts, means and sums of squared differences of two sets of teams (Chan et al.'s update)
+    count = a['count'] + b['count']
+    safe_count = np.where(count > 0, count, 1)
+    delta = b['mean'] - a['mean']
+
+    merged = {
+        'rows': a['rows'] + b['rows'],
+        'count': count,
+        'mean': np.where(count > 0, a['mean'] + delta * b['count'] / safe_count, 0.0),
+        'm2': np.where(count > 0, a['m2'] + b['m2'] + delta ** 2 * a['count'] * b['count'] / safe_count, 0.0),
     }
 
+    return merged
+
+
+def get_cohort_accumulators(accumulators: dict) -> dict:
+
+    # Teams that won at least k rounds are the running merge of the results from the Cup (4) down to k
+    at_least = {key: values.copy() for key, values in accumulators.items()}
+    for result in reversed(RESULT_LEVELS[:-1]):
+        merged = merge_accumulators({key: values[result + 1] for key, values in at_least.items()},
+                                    {key: values[result] for key, values in accumulators.items()})
+        for key, values in merged.items():
+            at_least[key][result] = values
+
+    # Stack every cohort's accumulator in the order of COHORTS
+    rows = [result for _, result, _ in COHORTS]
+    is_at_least = np.array([at_least_more for _, _, at_least_more in COHORTS])
+
+    cohorts = {}
+    for key, values in accumulators.items():
+        mask = is_at_least.reshape((-1,) + (1,) * (values.ndim - 1))
+        cohorts[key] = np.where(mask, at_least[key][rows], values[rows])
+
+    return cohorts
+
+
+
+# ====================================================================================================
+# FUNCTION FOR GATHERING MEANS AND STANDARD DEVIATIONS OF CONTENDER'S RELEVANT DATA TO USE IN SCORING
+# ====================================================================================================
+
+def get_measures_data(df: pd.DataFrame = None, accumulators: dict = None) -> pd.DataFrame:
+
+    if accumulators is None:
+        accumulators = get_result_accumulators(df)
+
+    cohorts = get_cohort_accumulators(accumulators)
+    columns = list(constants.SCORE_GROUP_COLUMNS.values())
+
+    # Turn the accumulators into means and sample standard deviations (undefined for fewer than 1 or 2 teams)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        means = np.where(cohorts['count'] > 0, cohorts['mean'], np.nan)
+        stds = np.sqrt(cohorts['m2'] / (cohorts['count'] - 1))
+    stds[cohorts['count'] < 2] = np.nan
+
+    measures_data = pd.DataFrame({
+        'Team Data Set': [name for name, _, _ in COHORTS],
+        'Teams Used': cohorts['rows'],
+        **{f'MEAN {column}': np.round(means[:, index], 3) for index, column in enumerate(columns)},
+        **{f'STD {column}': np.round(stds[:, index], 3) for index, column in enumerate(columns)},
+    })
+
+    return measures_data
+
+
+def get_z_stats(accumulators: dict) -> dict:
+
+    # The z score constants are the measures of all playoff teams
+    measures = get_measures_data(accumulators=accumulators).iloc[0]
+
+    z_stats = {
+        group: {'mean': float(measures[f'MEAN {column}']), 'std': float(measures[f'STD {column}'])}
+        for group, column in constants.SCORE_GROUP_COLUMNS.items()
+    }
+
+    return z_stats
+
+
+
+# ====================================================================================================
+# FUNCTIONS FOR SAVING AND UPDATING THE ACCUMULATORS ONE SEASON AT A TIME
+# ====================================================================================================
+
+def save_state(accumulators: dict, seasons: list, state_path: str = STATE_PATH) -> None:
+
+    with data_cache.atomic_write(state_path) as tmp_path:
+        np.savez(tmp_path, seasons=np.asarray(seasons, dtype=str), **accumulators)
+
+
+def load_state(state_path: str = STATE_PATH) -> tuple:
+
+    with np.load(state_path) as state:
+        seasons = state['seasons'].tolist()
+        accumulators = {key: state[key] for key in ('rows', 'count', 'mean', 'm2')}
+
+    return accumulators, seasons
+
+
+def add_seasons(seasons: list, state_path: str = STATE_PATH) -> tuple:
+
+    # Only the new seasons' teams are scored and merged into the saved accumulators
+    accumulators, saved_seasons = load_state(state_path)
+    new_seasons = [season for season in seasons if season not in saved_seasons]
+    if new_seasons:
+        new_accumulators = get_result_accumulators(data_relevant.get_all_scoring_data(new_seasons))
+        accumulators = merge_accumulators(accumulators, new_accumulators)
+        saved_seasons = saved_seasons + new_seasons
+        save_state(accumulators, saved_seasons, state_path)
+
+    return accumulators, saved_seasons
+
+
+def parse_args() -> argparse.Namespace:
+
+    parser = argparse.ArgumentParser(description='Gather the means and standard deviations of the scoring data.')
+    parser.add_argument('--add-seasons', nargs='+', default=None,
+                        help='merge these seasons into the saved measures instead of recomputing every season')
+
+    return parser.parse_args()
+
+
+def main() -> None:
+    args = parse_args()
+    instrumentation.enable_from_env()
+
+    if args.add_seasons is None:
+        # Load the scoring data and accumulate every season from scratch
+        df = data_cache.read_csv('relevant_data/scoring_data.csv')
+        accumulators = get_result_accumulators(df)
+        save_state(accumulators, df['Season'].unique().tolist())
+    else:
+        accumulators, _ = add_seasons(args.add_seasons)
 
-    measures_data.append(averages)
+        # Print the updated z score constants to copy into constants.Z_STATS
+        print("\nUpdated Z_STATS:")
+        for group, stats in get_z_stats(accumulators).items():
+            print(f"'{group}': {{'mean': {stats['mean']:.3f}, 'std': {stats['std']:.3f}}},")
 
-    loop_count += 1
+    # Save CSV file
+    AVG_df = get_measures_data(accumulators=accumulators)
+    AVG_df.to_csv('relevant_data/measures_data.csv', index=False)
 
 
-# Save CSV file
-AVG_df = pd.DataFrame(measures_data)
-AVG_df.to_csv('relevant_data/measures_data.csv', index=False)
\ No newline at end of file
+if __name__ == '__main__':
+    main()
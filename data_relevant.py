@@ -1,23 +1,114 @@
-
 # Imports
+import argparse
+import functools
+import numpy as np
 import pandas as pd
 import constants
+import data_cache
+import instrumentation
+
+# Scoring data columns filled by each forward line (0-3) and defense pair (4-6)
+LINE_COLUMNS = [
+    '1-3 F Avg Game Score',
+    '4-6 F Avg Game Score',
+    '7-9 F Avg Game Score',
+    '9-12 F Avg Game Score',
+    '1-2 D Avg Game Score',
+    '3-4 D Avg Game Score',
+    '5-6 D Avg Game Score',
+]
+
+# Column data types of the scoring data
+SCORING_DATA_DTYPES = {
+    'Season': str,
+    'Team': str,
+    'Result': 'int64',
+    **{column: 'float64' for column in LINE_COLUMNS},
+    'Starting Goalie Avg GSAx': 'float64',
+}
+
 
 # ====================================================================================================
-# FUNCTION FOR GATHERING DATA TO USE FOR SCORING TEAMS
+# FUNCTIONS FOR LOADING A SEASON'S RAW DATA
 # ====================================================================================================
 
-def get_scoring_data(season: str, team_abbrev: str) -> pd.Series:
+@instrumentation.instrument
+def load_season_data(season: str) -> dict:
+
+    # Load raw data once for the whole season
+    skaters_df = data_cache.read_skaters(season)
+    goalies_df = data_cache.read_goalies(season)
+
+    # Only the all situations rows are used for scoring
+    skaters_df = skaters_df[skaters_df['situation'] == 'all']
+    goalies_df = goalies_df[goalies_df['situation'] == 'all']
+
+    # The cache keeps games played as 32 bit floats, so it is cast back to 64 bits to divide icetime, game
+    # scores and GSAx by it with the same float64 arithmetic as the baseline (giving the same per game values)
+    skaters_df = skaters_df.astype({'games_played': 'float64'})
+    goalies_df = goalies_df.astype({'games_played': 'float64'})
+
+    # Group the players by team so each team's rows can be looked up directly
+    season_data = {
+        'skaters': dict(tuple(skaters_df.groupby('team', observed=True))),
+        'goalies': dict(tuple(goalies_df.groupby('team', observed=True))),
+    }
+
+    return season_data
+
+
+@functools.lru_cache(maxsize=None)
+def get_season_abbreviations(season: str) -> dict:
+
+    # Abbreviation each current team played under in the season (teams that did not exist yet are left out),
+    # built from the team change rules once per season. Teams that joined the league keep playing after the
+    # seasons listed for them, so seasons newer than the constants get the current teams
+    season_abbreviations = {}
+
+    for team_abbrev in constants.TEAM_ABBREVIATIONS:
+        # Account for league team changes across seasons
+        if team_abbrev == 'WPG' and season in constants.ATL_SEASONS:
+            season_abbreviations[team_abbrev] = 'ATL'
+        elif team_abbrev == 'VGK' and season < min(constants.VGK_SEASONS):
+            continue
+        elif team_abbrev == 'SEA' and season < min(constants.SEA_SEASONS):
+            continue
+        elif team_abbrev == 'UTA' and season < min(constants.UTA_SEASONS):
+            season_abbreviations[team_abbrev] = 'ARI'
+        else:
+            season_abbreviations[team_abbrev] = team_abbrev
+
+    return season_abbreviations
+
+
+def get_franchise_abbreviations(seasons: list) -> dict:
+    return {season: get_season_abbreviations(season) for season in seasons}
+
+
+def get_season_teams(season: str) -> list:
+
+    # Abbreviations of the teams that played in the season
+    return list(get_season_abbreviations(season).values())
 
-    # Load raw data
-    skaters_df = pd.read_csv(f'raw_data/team_data/{season}_skaters.csv')
-    goalies_df = pd.read_csv(f'raw_data/team_data/{season}_goalies.csv')
+
+
+# ====================================================================================================
+# FUNCTIONS FOR GATHERING DATA TO USE FOR SCORING TEAMS
+# ====================================================================================================
+
+@instrumentation.instrument
+def get_scoring_data(season: str, team_abbrev: str, season_data: dict = None) -> pd.Series:
+
+    # Load raw data if it was not already loaded for the season
+    if season_data is None:
+        season_data = load_season_data(season)
+
+    team_skaters_df = season_data['skaters'][team_abbrev]
+    team_goalies_df = season_data['goalies'][team_abbrev]
 
 
     # Get dataframe of forwards of the given team
-    forward_df = skaters_df[(skaters_df['team'] == team_abbrev) &
-                           (skaters_df['position'] != 'D') &
-                           (skaters_df['situation'] == 'all')]
+    forward_df = team_skaters_df[team_skaters_df['position'] != 'D']
     
     # Get the top 12 forwards
     forward_df = forward_df.sort_values(by="games_played", ascending=False).reset_index(drop=True)
@@ -40,9 +131,7 @@ def get_scoring_data(season: str, team_abbrev: str) -> pd.Series:
 
     
     # Get dataframe of defensemen of the given team
-    defense_df = skaters_df[(skaters_df['team'] == team_abbrev) & 
-                            (skaters_df['position'] == 'D') &
-                            (skaters_df['situation'] == 'all')]
+    defense_df = team_skaters_df[team_skaters_df['position'] == 'D']
     
     # Get the top 6 defensemen
     defense_df = defense_df.sort_values(by="games_played", ascending=False).reset_index(drop=True)
@@ -63,8 +152,7 @@ def get_scoring_data(season: str, team_abbrev: str) -> pd.Series:
 
 
     # Get dataframe of goalies of the given team
-    goalie_df = goalies_df[(goalies_df['team'] == team_abbrev) &
-                           (goalies_df['situation'] == 'all')]
+    goalie_df = team_goalies_df
 
     # Get the starting goalie of the given team    
     goalie_df = goalie_df.sort_values(by="games_played", ascending=False).reset_index(drop=True)
@@ -96,44 +184,200 @@ def get_scoring_data(season: str, team_abbrev: str) -> pd.Series:
     return data_row
 
 
+@instrumentation.instrument
+def get_season_scoring_data(season: str) -> pd.DataFrame:
+
+    # Load the season's raw data a single time and reuse it for every team
+    season_data = load_season_data(season)
+
+    rows = [get_scoring_data(season, team_abbrev, season_data) for team_abbrev in get_season_teams(season)]
+
+    return build_scoring_data(rows)
+
+
+def build_scoring_data(rows: list) -> pd.DataFrame:
+
+    # Build the frame once from the collected rows, one typed column at a time
+    scoring_data = pd.DataFrame({column: [row[column] for row in rows] for column in SCORING_DATA_DTYPES})
+    scoring_data = scoring_data.astype(SCORING_DATA_DTYPES)
+
+    return scoring_data
+
+
 
 # ====================================================================================================
-# SCRIPT TO GET SCORING DATA FOR TEAMS OVER MULTIPLE SEASONS
+# FUNCTIONS FOR GATHERING SCORING DATA FOR EVERY TEAM AND SEASON AT ONCE
 # ====================================================================================================
 
-# Initialize scoring data dataframe
-scoring_data = pd.DataFrame(columns=[
-    'Season', 
-    'Team', 
-    'Result',
-    '1-3 F Avg Game Score', 
-    '4-6 F Avg Game Score', 
-    '7-9 F Avg Game Score', 
-    '9-12 F Avg Game Score',
-    '1-2 D Avg Game Score', 
-    '3-4 D Avg Game Score', 
-    '5-6 D Avg Game Score', 
-    'Starting Goalie Avg GSAx'
-])
-
-# Loop to iterate through the seasons and collect the relevant data for each team
-for season in constants.SEASONS:
-    for team_abbrev in constants.TEAM_ABBREVIATIONS:
+def get_sort_ranks(df: pd.DataFrame, group_keys: list, column: str) -> np.ndarray:
 
-        # Account for teams that have not been in the league for every relevant season 
-        if team_abbrev == 'WPG' and season in (constants.ATL_SEASONS):
-            team_abbrev = 'ATL'
-        if team_abbrev == 'VGK' and season not in(constants.VGK_SEASONS):
-            continue
-        if team_abbrev == 'SEA' and season not in(constants.SEA_SEASONS):
-            continue
-        if team_abbrev == 'UTA' and season not in(constants.UTA_SEASONS):
-            team_abbrev = 'ARI'
+    # Rank the rows of every group by the column, highest first, keeping tied rows in the order they are listed
+    positions = np.arange(len(df))
+    sorted_df = df[group_keys + [column]].assign(position=positions)
+    sorted_df = sorted_df.sort_values(by=group_keys + [column], ascending=[True] * len(group_keys) + [False],
+                                      kind='stable')
+    ranks = np.empty(len(df), dtype=np.int64)
+    ranks[sorted_df['position'].to_numpy()] = sorted_df.groupby(group_keys, observed=True).cumcount().to_numpy()
+
+    # The per team path sorts with pandas' default quicksort, which doesn't keep tied rows in the order they are
+    # listed, so the groups with a tie are ranked again the way it sorts them: pandas sorts the reversed values
+    # with quicksort and reverses the order it gets back (the values are never missing, so every value is
+    # sorted). Groups of the same size are sorted together
+    is_tied = df.duplicated(subset=group_keys + [column], keep=False).to_numpy()
+    if is_tied.any():
+        group_ids = df.groupby(group_keys, observed=True, sort=False).ngroup().to_numpy()
+        tied_positions = np.flatnonzero(np.isin(group_ids, group_ids[is_tied]))
+        tied_positions = tied_positions[np.argsort(group_ids[tied_positions], kind='stable')]
+        group_starts = np.flatnonzero(np.diff(group_ids[tied_positions], prepend=-1))
+        group_sizes = np.diff(group_starts, append=len(tied_positions))
+        values = df[column].to_numpy(dtype='float64')
+        for size in np.unique(group_sizes):
+            group_positions = tied_positions[group_starts[group_sizes == size, None] + np.arange(size)]
+            reversed_values = values[group_positions][:, ::-1]
+            order = size - 1 - np.argsort(reversed_values, axis=1, kind='quicksort')[:, ::-1]
+            ranks[np.take_along_axis(group_positions, order, axis=1)] = np.arange(size)
+
+    return ranks
+
+
+@instrumentation.instrument
+def get_line_scores(skaters_df: pd.DataFrame) -> pd.DataFrame:
+
+    # Only the all situations rows are used for scoring
+    skaters_df = skaters_df[skaters_df['situation'] == 'all'].copy()
+    skaters_df['is_defense'] = skaters_df['position'] == 'D'
+    group_keys = ['Season', 'team', 'is_defense']
+
+    # Put each team's forwards and defensemen together, in the order they are listed in the raw data
+    skaters_df = skaters_df.sort_values(by=group_keys, kind='stable').reset_index(drop=True)
+
+    # Rank each team's forwards and defensemen by games played and keep the top 12 forwards and top 6 defensemen
+    skaters_df['games_played_rank'] = get_sort_ranks(skaters_df, group_keys, 'games_played')
+    skaters_df = skaters_df[skaters_df['games_played_rank'] < np.where(skaters_df['is_defense'], 6, 12)]
+
+    # Rank the kept players by average icetime, listed in games played order like the per team sort sees them
+    skaters_df = skaters_df.sort_values(by=group_keys + ['games_played_rank'], kind='stable').reset_index(drop=True)
+    skaters_df['icetime/games_played'] = skaters_df['icetime'] / skaters_df['games_played']
+    icetime_rank = get_sort_ranks(skaters_df, group_keys, 'icetime/games_played')
+
+    # Label each player with their line (forwards in blocks of 3, defensemen in blocks of 2) and their spot in it
+    is_defense = skaters_df['is_defense'].to_numpy()
+    lines = np.where(is_defense, 4 + icetime_rank // 2, icetime_rank // 3)
+    spots = np.where(is_defense, icetime_rank % 2, icetime_rank % 3)
+
+    # Lay out every player's average game score by team, line and spot (team seasons x lines x spots)
+    teams = skaters_df.groupby(['Season', 'team'], observed=True)
+    avg_game_scores = np.full((teams.ngroups, len(LINE_COLUMNS), 3), np.nan)
+    avg_game_scores[teams.ngroup().to_numpy(), lines, spots] = (skaters_df['gameScore'] / skaters_df['games_played']).to_numpy()
+
+    # Get the average game scores of every line, adding the players up in icetime order like the per team
+    # mean does so both ways give exactly the same numbers
+    is_player = ~np.isnan(avg_game_scores)
+    line_totals = np.zeros(avg_game_scores.shape[:2])
+    for spot in range(avg_game_scores.shape[2]):
+        line_totals += np.where(is_player[:, :, spot], avg_game_scores[:, :, spot], 0)
+    with np.errstate(invalid='ignore'):
+        line_averages = line_totals / is_player.sum(axis=2)
+
+    line_scores = pd.DataFrame(line_averages, index=teams.size().index, columns=LINE_COLUMNS)
+
+    return line_scores
+
+
+@instrumentation.instrument
+def get_goalie_scores(goalies_df: pd.DataFrame) -> pd.Series:
+
+    # Get the starting goalie (most games played) of every team
+    goalies_df = goalies_df[goalies_df['situation'] == 'all'].reset_index(drop=True)
+    games_played_rank = get_sort_ranks(goalies_df, ['Season', 'team'], 'games_played')
+    starting_goalies = goalies_df[games_played_rank == 0].set_index(['Season', 'team']).sort_index()
+
+    # Get the starting goalies' GSAx per Game
+    goalie_scores = (starting_goalies['xGoals'] - starting_goalies['goals']) / starting_goalies['games_played']
+    goalie_scores.name = 'Starting Goalie Avg GSAx'
+
+    return goalie_scores
+
+
+@instrumentation.instrument
+def get_all_scoring_data(seasons: list = None, season_frames: dict = None) -> pd.DataFrame:
+
+    if seasons is None:
+        seasons = constants.SEASONS
+
+    # Load the seasons' raw data files concurrently unless they were already loaded
+    if season_frames is None:
+        season_frames = data_cache.load_seasons(seasons, ['skaters', 'goalies'])
+
+    # Combine every season's raw data into single frames
+    skaters_df = pd.concat([season_frames[season]['skaters'].assign(Season=season)
+                            for season in seasons], ignore_index=True)
+    goalies_df = pd.concat([season_frames[season]['goalies'].assign(Season=season)
+                            for season in seasons], ignore_index=True)
+
+    # Get the team seasons to score
+    teams = [(season, team_abbrev) for season in seasons for team_abbrev in get_season_teams(season)]
+
+    return get_teams_scoring_data(teams, skaters_df, goalies_df)
+
+
+def get_teams_scoring_data(teams: list, skaters_df: pd.DataFrame, goalies_df: pd.DataFrame) -> pd.DataFrame:
+
+    # Get the given team seasons along with their playoff results
+    scoring_data = pd.DataFrame(teams, columns=['Season', 'Team'])
+    scoring_data['Result'] = [constants.TEAM_RESULTS.get(season, {}).get(team_abbrev, -1) for season, team_abbrev in teams]
+
+    # Join the line and goalie scores of every team season
+    features = get_line_scores(skaters_df).join(get_goalie_scores(goalies_df), how='outer')
+    features.index = features.index.set_names(['Season', 'Team'])
+    scoring_data = scoring_data.join(features, on=['Season', 'Team'])
+    scoring_data = scoring_data.astype(SCORING_DATA_DTYPES)
+
+    return scoring_data
+
+
+def check_scoring_data_parity(seasons: list = None) -> None:
+
+    if seasons is None:
+        seasons = constants.SEASONS
+
+    # Build the scoring data both per team and all at once
+    per_team_data = pd.concat([get_season_scoring_data(season) for season in seasons], ignore_index=True)
+    all_at_once_data = get_all_scoring_data(seasons)
+
+    # Both ways of building the scoring data must give the same rows in the same order
+    pd.testing.assert_frame_equal(all_at_once_data, per_team_data, check_exact=True)
+
+
+
+# ====================================================================================================
+# FUNCTION TO SAVE SCORING DATA FOR TEAMS OVER MULTIPLE SEASONS
+# ====================================================================================================
+
+def parse_args() -> argparse.Namespace:
+
+    parser = argparse.ArgumentParser(description='Gather the scoring data of every team in every season.')
+    parser.add_argument('--check', action='store_true',
+                        help='also check the all-seasons engine gives exactly the same scoring data as the per team path')
+
+    return parser.parse_args()
+
+
+def main() -> None:
+    args = parse_args()
+    instrumentation.enable_from_env()
+
+    # Build the scoring data for every team in every season at once
+    scoring_data = get_all_scoring_data()
+
+    # Save relevant data as a CSV file
+    save_path = f'relevant_data/scoring_data.csv'
+    scoring_data.to_csv(save_path, index=False)
 
-        data_row = get_scoring_data(season, team_abbrev)
+    if args.check:
+        check_scoring_data_parity()
+        print("All-seasons scoring data matches the per team scoring data")
 
-        scoring_data = pd.concat([scoring_data, data_row.to_frame().T], ignore_index=True)
 
-# Save relevant data as a CSV file
-save_path = f'relevant_data/scoring_data.csv'
-scoring_data.to_csv(save_path, index=False)
\ No newline at end of file
+if __name__ == '__main__':
+    main()
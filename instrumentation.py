@@ -0,0 +1,336 @@
+# Imports
+import atexit
+import contextlib
+import functools
+import json
+import math
+import os
+import sys
+import threading
+import time
+import numpy as np
+
+try:
+    import resource
+except ImportError:
+    # Peak memory is only available where the resource module is (not on Windows)
+    resource = None
+
+# Environment variable that turns the instrumentation on, holding the path the profile is written to when the
+# program exits ('1' writes it to DEFAULT_PROFILE_PATH)
+PROFILE_ENV_VAR = 'CONTENDER_PROFILE'
+DEFAULT_PROFILE_PATH = 'profiles/profile.json'
+
+# Durations of every span name are counted in log spaced bins instead of being kept call by call, so a long
+# optimization run holds the same memory per span name however many calls it makes (16 bins per doubling put
+# every percentile within about 2% of the exact one)
+BINS_PER_DOUBLING = 16
+NUM_BINS = 64 * BINS_PER_DOUBLING
+
+# Most spans kept in the trace, so a long optimization run doesn't hold every call in memory (the totals of
+# every call are always kept)
+MAX_TRACE_EVENTS = 1_000_000
+
+# Everything recorded while the instrumentation is on (only the main process is recorded, worker processes
+# started by process pools are not)
+PROFILE = {
+    'enabled': False,
+    'output_path': None,
+    'start_ns': None,
+    'durations': {},
+    'stacks': {},
+    'counters': {},
+    'events': [],
+}
+
+# Every thread keeps its own stack of open spans, since the season files are loaded by a thread pool, along with
+# the span of the thread that handed it its work (so pool threads' spans are recorded under that span)
+SPAN_STACKS = threading.local()
+PROFILE_LOCK = threading.Lock()
+
+
+# ====================================================================================================
+# FUNCTIONS FOR TURNING THE INSTRUMENTATION ON AND OFF
+# ====================================================================================================
+
+def enable(output_path: str = None) -> None:
+
+    if PROFILE['enabled']:
+        return
+
+    PROFILE.update({
+        'enabled': True,
+        'output_path': output_path,
+        'start_ns': time.perf_counter_ns(),
+        'durations': {},
+        'stacks': {},
+        'counters': {},
+        'events': [],
+    })
+
+    # Write the profile once the program is done
+    if output_path is not None:
+        atexit.register(write_profile, output_path)
+
+
+def disable() -> None:
+
+    if not PROFILE['enabled']:
+        return
+
+    PROFILE['enabled'] = False
+
+
+def enable_from_env() -> None:
+
+    # The environment variable holds the profile path, or just turns the instrumentation on (scripts call this when
+    # they start, so importing a module never turns it on)
+    value = os.environ.get(PROFILE_ENV_VAR, '')
+    if value and value != '0':
+        enable(DEFAULT_PROFILE_PATH if value == '1' else value)
+
+
+
+# ====================================================================================================
+# FUNCTIONS FOR RECORDING SPANS AND COUNTS
+# ====================================================================================================
+
+def get_span_stack() -> list:
+    if not hasattr(SPAN_STACKS, 'stack'):
+        SPAN_STACKS.stack = []
+        SPAN_STACKS.parent = None
+    return SPAN_STACKS.stack
+
+
+def get_stack_names() -> list:
+
+    # Names of every open span of the thread, starting with the spans of the thread that handed it its work
+    stack = get_span_stack()
+    parent_names = SPAN_STACKS.parent[0] if SPAN_STACKS.parent is not None else []
+
+    return parent_names + [frame[0] for frame in stack]
+
+
+def within_current_span(func):
+
+    # Run the function in other threads as if it were called inside the span open now, so the spans it opens
+    # are stacked under that span and their time is not also counted as that span's own time
+    stack = get_span_stack()
+    if not PROFILE['enabled'] or not stack:
+        return func
+
+    parent = (get_stack_names(), stack[-1])
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        get_span_stack()
+        previous_parent, SPAN_STACKS.parent = SPAN_STACKS.parent, parent
+        try:
+            return func(*args, **kwargs)
+        finally:
+            SPAN_STACKS.parent = previous_parent
+
+    return wrapper
+
+
+def start_span(name: str) -> None:
+
+    # Each open span holds its name, start time and the time spent in the spans it opened
+    get_span_stack().append([name, time.perf_counter_ns(), 0])
+
+
+def end_span(**args) -> None:
+
+    end_ns = time.perf_counter_ns()
+    stack = get_span_stack()
+    name, start_ns, child_ns = stack.pop()
+    duration_ns = end_ns - start_ns
+
+    # The self time of the span's full call stack (what flame graphs stack up)
+    stack_key = ';'.join(get_stack_names() + [name])
+
+    with PROFILE_LOCK:
+        # Time spent in the spans of other threads is taken off the self time of the span that handed them the
+        # work (spans running side by side can add up to more than it lasted, so its self time stops at zero)
+        if stack:
+            stack[-1][2] += duration_ns
+        elif SPAN_STACKS.parent is not None:
+            SPAN_STACKS.parent[1][2] += duration_ns
+
+        add_duration(name, duration_ns)
+        PROFILE['stacks'][stack_key] = PROFILE['stacks'].get(stack_key, 0) + max(duration_ns - child_ns, 0)
+
+        # Spans in the Chrome trace event format, in microseconds since the instrumentation was turned on
+        if len(PROFILE['events']) < MAX_TRACE_EVENTS:
+            PROFILE['events'].append({
+                'name': name,
+                'ph': 'X',
+                'ts': (start_ns - PROFILE['start_ns']) / 1000,
+                'dur': duration_ns / 1000,
+                'pid': os.getpid(),
+                'tid': threading.get_ident(),
+                **({'args': args} if args else {}),
+            })
+
+
+def add_duration(name: str, duration_ns: int) -> None:
+
+    # Called with the profile lock held
+    durations = PROFILE['durations'].get(name)
+    if durations is None:
+        durations = PROFILE['durations'][name] = {'calls': 0, 'total_ns': 0, 'max_ns': 0,
+                                                  'bins': np.zeros(NUM_BINS, dtype=np.int64)}
+
+    durations['calls'] += 1
+    durations['total_ns'] += duration_ns
+    durations['max_ns'] = max(durations['max_ns'], duration_ns)
+    durations['bins'][min(int(math.log2(max(duration_ns, 1)) * BINS_PER_DOUBLING), NUM_BINS - 1)] += 1
+
+
+def add_count(name: str, value: int) -> None:
+    with PROFILE_LOCK:
+        PROFILE['counters'][name] = PROFILE['counters'].get(name, 0) + value
+
+
+def count_csv_read(file_path: str) -> None:
+
+    # Count a CSV file parsed by the repo's read helpers and the bytes in it (a single check when the
+    # instrumentation is off)
+    if PROFILE['enabled']:
+        add_count('csv_reads', 1)
+        add_count('csv_bytes', os.path.getsize(file_path))
+
+
+def get_peak_memory_mb() -> float:
+
+    # Peak resident memory of the process so far (reported in kilobytes on Linux and bytes on macOS)
+    if resource is None:
+        return None
+
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1 << 20) if sys.platform == 'darwin' else peak / (1 << 10)
+
+
+@contextlib.contextmanager
+def span(name: str):
+
+    if not PROFILE['enabled']:
+        yield
+        return
+
+    # Stages also record the peak memory reached by the time they finish
+    start_span(name)
+    try:
+        yield
+    finally:
+        end_span(peak_memory_mb=get_peak_memory_mb())
+
+
+def instrument(func):
+
+    # Name functions by their file so the names are the same when a module is run as a script
+    name = f"{os.path.splitext(os.path.basename(func.__code__.co_filename))[0]}.{func.__qualname__}"
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+
+        # A single check when the instrumentation is off
+        if not PROFILE['enabled']:
+            return func(*args, **kwargs)
+
+        start_span(name)
+        try:
+            return func(*args, **kwargs)
+        finally:
+            end_span()
+
+    return wrapper
+
+
+
+# ====================================================================================================
+# FUNCTIONS FOR SUMMARIZING AND WRITING THE PROFILE
+# ====================================================================================================
+
+def get_latency_percentiles(durations_ms: list) -> dict:
+
+    durations_ms = np.asarray(durations_ms, dtype=float)
+    if not len(durations_ms):
+        return {}
+
+    p50, p90, p99 = np.percentile(durations_ms, [50, 90, 99])
+    latency_percentiles = {'p50_ms': p50, 'p90_ms': p90, 'p99_ms': p99, 'max_ms': durations_ms.max()}
+
+    return {key: round(float(value), 3) for key, value in latency_percentiles.items()}
+
+
+def get_binned_percentiles(durations: dict) -> dict:
+
+    # Each percentile is the middle of the bin holding it (on the log scale), and no more than the longest call
+    cumulative_calls = np.cumsum(durations['bins'])
+    percentile_ranks = np.ceil(np.array([0.5, 0.9, 0.99]) * durations['calls'])
+    bins = np.searchsorted(cumulative_calls, percentile_ranks)
+    p50, p90, p99 = np.minimum(2 ** ((bins + 0.5) / BINS_PER_DOUBLING), durations['max_ns']) / 1e6
+    latency_percentiles = {'p50_ms': p50, 'p90_ms': p90, 'p99_ms': p99, 'max_ms': durations['max_ns'] / 1e6}
+
+    return {key: round(float(value), 3) for key, value in latency_percentiles.items()}
+
+
+def get_summary() -> dict:
+
+    functions = {}
+    for name, durations in PROFILE['durations'].items():
+        functions[name] = {
+            'calls': durations['calls'],
+            'total_s': round(durations['total_ns'] / 1e9, 6),
+            'mean_ms': round(durations['total_ns'] / durations['calls'] / 1e6, 3),
+            **get_binned_percentiles(durations),
+        }
+
+    summary = {
+        'wall_s': round((time.perf_counter_ns() - PROFILE['start_ns']) / 1e9, 6),
+        'peak_memory_mb': get_peak_memory_mb(),
+        'counters': dict(PROFILE['counters']),
+        'functions': dict(sorted(functions.items(), key=lambda item: -item[1]['total_s'])),
+    }
+
+    return summary
+
+
+def print_summary(summary: dict, file=sys.stderr) -> None:
+
+    counters = summary['counters']
+    print("\n=== PROFILE ===", file=file)
+    print(f"Wall time: {summary['wall_s']:.3f}s", file=file)
+    if summary['peak_memory_mb'] is not None:
+        print(f"Peak memory: {summary['peak_memory_mb']:.1f} MB", file=file)
+    print(f"Raw data CSV files parsed: {counters.get('csv_reads', 0)} "
+          f"({counters.get('csv_bytes', 0) / (1 << 20):.1f} MB)", file=file)
+
+    print(f"\n{'Function':<52} {'Calls':>8} {'Total (s)':>10} {'Mean (ms)':>10} {'p50 (ms)':>10} {'p99 (ms)':>10}",
+          file=file)
+    print("-" * 105, file=file)
+    for name, stats in summary['functions'].items():
+        print(f"{name:<52} {stats['calls']:>8} {stats['total_s']:>10.3f} {stats['mean_ms']:>10.3f} "
+              f"{stats['p50_ms']:>10.3f} {stats['p99_ms']:>10.3f}", file=file)
+
+
+def write_profile(output_path: str = DEFAULT_PROFILE_PATH) -> dict:
+
+    summary = get_summary()
+    os.makedirs(os.path.dirname(output_path) or '.', exist_ok=True)
+
+    # A Chrome trace (opens in chrome://tracing or Perfetto) with the summary alongside the spans
+    with open(output_path, 'w') as file:
+        json.dump({'traceEvents': PROFILE['events'], 'displayTimeUnit': 'ms', 'summary': summary}, file)
+
+    # Collapsed stacks with self times in microseconds (opens in speedscope or flamegraph.pl)
+    folded_path = f'{os.path.splitext(output_path)[0]}.folded'
+    with open(folded_path, 'w') as file:
+        for stack_key, self_ns in sorted(PROFILE['stacks'].items()):
+            file.write(f"{stack_key} {self_ns // 1000}\n")
+
+    print_summary(summary)
+    print(f"\nProfile written to {output_path} and {folded_path}", file=sys.stderr)
+
+    return summary
@@ -0,0 +1,271 @@
+# Imports
+import argparse
+import contextlib
+import hashlib
+import io
+import json
+import os
+import time
+import constants
+import data_cache
+import data_clean
+import data_measures
+import data_relevant
+import instrumentation
+import score_calculation
+import score_statistics
+
+# Fingerprints of every stage's last run, kept with the stages' outputs rather than in the raw data cache (which
+# can be cleared at any time)
+STATE_PATH = 'relevant_data/pipeline.json'
+
+# Printed statistics report of the last run, shown again when the statistics stage is skipped
+STATISTICS_PATH = 'relevant_data/statistics.txt'
+
+# Constants the abbreviation every team played under in each season is built from
+FRANCHISE_CONSTANTS = ['TEAM_ABBREVIATIONS', 'ATL_SEASONS', 'VGK_SEASONS', 'SEA_SEASONS', 'UTA_SEASONS']
+
+
+# ====================================================================================================
+# FUNCTIONS FOR RUNNING EACH STAGE OF THE PIPELINE
+# ====================================================================================================
+
+def run_clean() -> None:
+    data_clean.fix_team_abbreviations(constants.SEASONS)
+    data_clean.abbreviate_standings_teams(constants.SEASONS)
+
+
+def run_relevant() -> None:
+    scoring_data = data_relevant.get_all_scoring_data(constants.SEASONS)
+    scoring_data.to_csv('relevant_data/scoring_data.csv', index=False)
+
+
+def run_measures() -> None:
+    df = data_cache.read_csv('relevant_data/scoring_data.csv')
+    accumulators = data_measures.get_result_accumulators(df)
+    data_measures.save_state(accumulators, df['Season'].unique().tolist())
+    data_measures.get_measures_data(accumulators=accumulators).to_csv('relevant_data/measures_data.csv', index=False)
+
+
+def run_scores() -> None:
+    scoring_data = data_cache.read_csv('relevant_data/scoring_data.csv')
+    for season, df in score_calculation.calculate_season_scores(scoring_data, constants.SEASONS).items():
+        df.to_csv(f'scores/{season}_scores.csv', index=False)
+
+
+def run_statistics() -> None:
+
+    # Keep the printed report so it can be shown again without rerunning the stage
+    rank_tables = score_statistics.get_rank_tables(score_statistics.load_season_scores(constants.SEASONS))
+    report = io.StringIO()
+    with contextlib.redirect_stdout(report):
+        score_statistics.print_rank_stats(rank_tables=rank_tables)
+        score_statistics.print_success_rates(rank_tables=rank_tables)
+
+    with open(STATISTICS_PATH, 'w') as file:
+        file.write(report.getvalue())
+
+
+def show_statistics() -> None:
+    with open(STATISTICS_PATH) as file:
+        print(file.read(), end='')
+
+
+def get_stages() -> list:
+
+    seasons = constants.SEASONS
+    raw_data = [data_cache.team_data_path(season, data_set, data_cache.RAW_DATA_DIR)
+                for season in seasons for data_set in ('skaters', 'goalies', 'teams')]
+    raw_data += [data_cache.standings_path(season, data_cache.RAW_DATA_DIR) for season in seasons]
+    team_data = [data_cache.team_data_path(season, data_set)
+                 for season in seasons for data_set in ('skaters', 'goalies')]
+    standings = [data_cache.standings_path(season) for season in seasons]
+    scores = [f'scores/{season}_scores.csv' for season in seasons]
+
+    # Each stage declares the files it reads and writes, the constants it depends on and the modules that run it
+    stages = [
+        {
+            'name': 'clean',
+            'run': run_clean,
+            'inputs': raw_data,
+            'outputs': team_data + standings + [data_clean.MANIFEST_PATH],
+            'constants': ['SEASONS', 'TEAM_NAME_MAP'],
+            'modules': [data_clean],
+        },
+        {
+            'name': 'relevant',
+            'run': run_relevant,
+            'inputs': team_data,
+            'outputs': ['relevant_data/scoring_data.csv'],
+            'constants': ['SEASONS', *FRANCHISE_CONSTANTS, 'TEAM_RESULTS'],
+            'modules': [data_relevant, data_cache],
+        },
+        {
+            'name': 'measures',
+            'run': run_measures,
+            'inputs': ['relevant_data/scoring_data.csv'],
+            'outputs': ['relevant_data/measures_data.csv', data_measures.STATE_PATH],
+            'constants': ['SCORE_GROUP_COLUMNS'],
+            'modules': [data_measures],
+        },
+        {
+            'name': 'scores',
+            'run': run_scores,
+            'inputs': ['relevant_data/scoring_data.csv'] + standings,
+            'outputs': scores,
+            'constants': ['SEASONS', *FRANCHISE_CONSTANTS, 'Z_STATS', 'SCORE_GROUP_COLUMNS', 'SCORE_WEIGHTS'],
+            'modules': [score_calculation, data_relevant, data_cache],
+        },
+        {
+            'name': 'statistics',
+            'run': run_statistics,
+            'inputs': scores,
+            'outputs': [STATISTICS_PATH],
+            'constants': ['SEASONS'],
+            'modules': [score_statistics],
+        },
+    ]
+
+    return stages
+
+
+
+# ====================================================================================================
+# FUNCTIONS FOR FINGERPRINTING THE INPUTS OF EACH STAGE
+# ====================================================================================================
+
+def get_file_hashes(file_paths: list, file_stats: dict) -> dict:
+
+    file_hashes = {}
+
+    for file_path in file_paths:
+        if not os.path.exists(file_path):
+            file_hashes[file_path] = None
+            continue
+
+        # Files are only hashed again once they were touched
+        file_stats[file_path] = data_cache.get_file_fingerprint(file_path, file_stats.get(file_path))
+        file_hashes[file_path] = file_stats[file_path]['sha256']
+
+    return file_hashes
+
+
+def get_constant_hash(name: str) -> str:
+    value = json.dumps(getattr(constants, name), sort_keys=True)
+    return hashlib.sha256(value.encode()).hexdigest()
+
+
+def get_fingerprint(stage: dict, file_stats: dict) -> dict:
+
+    fingerprint = {
+        'inputs': get_file_hashes(stage['inputs'], file_stats),
+        'constants': {name: get_constant_hash(name) for name in stage['constants']},
+        'modules': get_file_hashes([module.__file__ for module in stage['modules']], file_stats),
+    }
+
+    return fingerprint
+
+
+def load_state() -> dict:
+
+    if not os.path.exists(STATE_PATH):
+        return {'stages': {}, 'files': {}}
+
+    with open(STATE_PATH) as file:
+        state = json.load(file)
+
+    return state
+
+
+def save_state(state: dict) -> None:
+    data_cache.write_json(STATE_PATH, state)
+
+
+
+# ====================================================================================================
+# FUNCTION FOR RUNNING THE STAGES WHOSE INPUTS CHANGED
+# ====================================================================================================
+
+def run_pipeline(force: list = (), dry_run: bool = False) -> dict:
+
+    stages = get_stages()
+    stage_names = [stage['name'] for stage in stages]
+    unknown_stages = [name for name in force if name not in stage_names + ['all']]
+    if unknown_stages:
+        raise ValueError(f"Invalid stage(s): {', '.join(map(repr, unknown_stages))} "
+                         f"(expected one of {', '.join(stage_names)} or all)")
+
+    state = load_state()
+    file_stats = state['files']
+    ran = {}
+
+    # Files the stages that would run in a dry run could rewrite, so the stages reading them would run too
+    invalidated_files = set()
+
+    for stage in stages:
+        name = stage['name']
+        saved = state['stages'].get(name)
+
+        # A stage is skipped when its inputs, constants and code are the same as on its last run and its
+        # outputs are still the files that run wrote
+        fingerprint = get_fingerprint(stage, file_stats)
+        is_unchanged = (saved is not None and saved['fingerprint'] == fingerprint and
+                        saved['outputs'] == get_file_hashes(stage['outputs'], file_stats))
+
+        is_forced = name in force or 'all' in force
+        is_invalidated = not invalidated_files.isdisjoint(stage['inputs'])
+
+        if is_unchanged and not is_forced and not is_invalidated:
+            print(f"{name:<12} skipped (unchanged)")
+            ran[name] = False
+            continue
+
+        if dry_run:
+            reason = ' (an earlier stage could rewrite its inputs)' if is_unchanged and not is_forced else ''
+            print(f"{name:<12} would run{reason}")
+            invalidated_files.update(stage['outputs'])
+            ran[name] = True
+            continue
+
+        start = time.perf_counter()
+        for folder in {os.path.dirname(path) for path in stage['outputs']} - {''}:
+            os.makedirs(folder, exist_ok=True)
+        with instrumentation.span(f'stage.{name}'):
+            stage['run']()
+        print(f"{name:<12} ran in {time.perf_counter() - start:.3f}s")
+        ran[name] = True
+
+        # Fingerprint the stage after it ran, so anything it changed while running is part of the fingerprint
+        state['stages'][name] = {
+            'fingerprint': get_fingerprint(stage, file_stats),
+            'outputs': get_file_hashes(stage['outputs'], file_stats),
+        }
+        save_state(state)
+
+    return ran
+
+
+def parse_args() -> argparse.Namespace:
+
+    parser = argparse.ArgumentParser(description='Run the stages of the pipeline whose inputs changed.')
+    parser.add_argument('--force', nargs='*', default=None,
+                        help='stages to run even if unchanged (every stage when no names are given)')
+    parser.add_argument('--dry-run', action='store_true', help='only list the stages that would run')
+    parser.add_argument('--profile', nargs='?', const=instrumentation.DEFAULT_PROFILE_PATH, default=None,
+                        help=f'record where the time goes and write the profile to this path '
+                             f'(default: {instrumentation.DEFAULT_PROFILE_PATH})')
+
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    if args.profile is not None:
+        instrumentation.enable(args.profile)
+    instrumentation.enable_from_env()
+
+    force = [] if args.force is None else args.force or ['all']
+    run_pipeline(force, args.dry_run)
+
+    if not args.dry_run and os.path.exists(STATISTICS_PATH):
+        show_statistics()
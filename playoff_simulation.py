@@ -0,0 +1,305 @@
+# Imports
+import argparse
+import math
+import os
+import time
+import numpy as np
+import pandas as pd
+import constants
+import data_cache
+import instrumentation
+import score_update
+
+# Conferences in bracket order, whose winners meet in the Cup final
+CONFERENCES = ['East', 'West']
+
+# Seeds of each conference in bracket order, so each pair of neighbouring slots meets in the first round and the
+# winners of neighbouring pairs meet in the next round (1 plays 8, its winner plays the winner of 4 and 5, and so on)
+CONFERENCE_SEEDS = [1, 8, 4, 5, 2, 7, 3, 6]
+
+# Conference and seed of every bracket slot, the East's 8 slots first
+BRACKET_SEEDS = [(conference, seed) for conference in CONFERENCES for seed in CONFERENCE_SEEDS]
+
+# Playoff rounds, from the first round to the Cup final
+ROUND_COLUMNS = ['Won Round 1', 'Won Round 2', 'Won Round 3', 'Won Cup']
+
+# Games needed to win a series
+SERIES_WINS = 4
+
+# Change in the log odds of winning a game for every point of contender score difference (the scale calibrate_scale
+# finds for the scores in scores/, which python playoff_simulation.py --calibrate prints)
+SCORE_SCALE = 0.0087
+
+# Brackets simulated per season, and per batch so the batch arrays stay small
+NUM_SIMULATIONS = 1_000_000
+CHUNK_SIMULATIONS = 250_000
+
+# Folder the simulated probabilities of every season are saved to
+SIMULATIONS_DIR = 'simulations'
+
+
+# ====================================================================================================
+# FUNCTIONS FOR TURNING CONTENDER SCORES INTO SERIES WIN PROBABILITIES
+# ====================================================================================================
+
+def get_game_probabilities(scores: np.ndarray, scale: float = SCORE_SCALE) -> np.ndarray:
+
+    # Chance the team of each row beats the team of each column in a single game (a logistic curve of the
+    # score difference)
+    differences = scores[:, None] - scores[None, :]
+
+    return 1 / (1 + np.exp(-scale * differences))
+
+
+def get_series_probabilities(game_probabilities: np.ndarray, wins: int = SERIES_WINS) -> np.ndarray:
+
+    # Chance of winning the series: win the last game after winning wins - 1 and losing j of the games before it
+    losses = np.arange(wins)
+    ways = np.array([math.comb(wins - 1 + num_losses, num_losses) for num_losses in losses])
+    p = game_probabilities[..., None]
+
+    return (ways * p ** wins * (1 - p) ** losses).sum(axis=-1)
+
+
+def get_conference(season: str, team_abbrev: str) -> str:
+
+    # Side of the bracket the team played on in the season (teams that changed conferences are looked up by their
+    # current abbreviation, like in the scores files), taken from the lists in constants since none of the data
+    # files say which conference a team played in
+    if season in constants.DIVISION_SEASON_EAST_TEAMS:
+        return 'East' if team_abbrev in constants.DIVISION_SEASON_EAST_TEAMS[season] else 'West'
+    if season in constants.PRE_REALIGNMENT_SEASONS and team_abbrev in constants.PRE_REALIGNMENT_CONFERENCES:
+        return constants.PRE_REALIGNMENT_CONFERENCES[team_abbrev]
+
+    return 'East' if team_abbrev in constants.EAST_TEAMS else 'West'
+
+
+def get_bracket(season_scores: pd.DataFrame, scale: float = SCORE_SCALE) -> tuple:
+
+    # The 8 best teams in the standings of each conference are seeded 1 to 8 within it (ties keep the order the
+    # teams are listed in), in one fixed bracket without reseeding or division brackets
+    field = season_scores.sort_values(by='Standings Rank', kind='stable')
+    conferences = [get_conference(season, team_abbrev) for season, team_abbrev in zip(field['Season'], field['Team'])]
+    field.insert(2, 'Conference', pd.Categorical(conferences, categories=CONFERENCES))
+    field.insert(3, 'Seed', field.groupby('Conference', observed=True).cumcount() + 1)
+    field = field[field['Seed'] <= len(CONFERENCE_SEEDS)]
+    field = field.sort_values(by=['Conference', 'Seed'], kind='stable').reset_index(drop=True)
+
+    # Teams without a score are treated as an average team of the season
+    scores = field['Contender Score'].to_numpy(dtype=float)
+    scores = np.where(np.isnan(scores), np.nanmean(scores) if (~np.isnan(scores)).any() else 0, scores)
+
+    # Team of each bracket slot, with -1 for the slots of seeds the season doesn't have (byes)
+    field_positions = {(conference, seed): position
+                       for position, (conference, seed) in enumerate(zip(field['Conference'], field['Seed']))}
+    slot_teams = np.array([field_positions.get(slot, -1) for slot in BRACKET_SEEDS])
+    has_team = slot_teams >= 0
+
+    # Chance the team in each slot wins a series against the team in each other slot, with every team beating a bye
+    series_probabilities = np.zeros((len(BRACKET_SEEDS), len(BRACKET_SEEDS)))
+    team_probabilities = get_series_probabilities(get_game_probabilities(scores, scale))
+    team_slots = slot_teams[has_team]
+    series_probabilities[np.ix_(has_team, has_team)] = team_probabilities[np.ix_(team_slots, team_slots)]
+    series_probabilities[has_team[:, None] & ~has_team[None, :]] = 1
+
+    return field, slot_teams, series_probabilities
+
+
+
+# ====================================================================================================
+# FUNCTIONS FOR SIMULATING THE PLAYOFF BRACKET
+# ====================================================================================================
+
+@instrumentation.instrument
+def simulate_bracket(series_probabilities: np.ndarray, num_simulations: int = NUM_SIMULATIONS,
+                     seed: np.random.SeedSequence = None) -> np.ndarray:
+
+    rng = np.random.default_rng(seed)
+    num_slots = len(series_probabilities)
+    round_wins = np.zeros((len(ROUND_COLUMNS), num_slots), dtype=np.int64)
+
+    for start in range(0, num_simulations, CHUNK_SIMULATIONS):
+        num_brackets = min(CHUNK_SIMULATIONS, num_simulations - start)
+
+        # Slots still alive in every bracket, in bracket order (brackets x slots left)
+        alive = np.tile(np.arange(num_slots, dtype=np.int8), (num_brackets, 1))
+
+        # Play every series of a round in every bracket at once, neighbouring slots meeting each other
+        for round_index in range(len(ROUND_COLUMNS)):
+            top, bottom = alive[:, 0::2], alive[:, 1::2]
+            top_wins = rng.random(top.shape) < series_probabilities[top, bottom]
+            alive = np.where(top_wins, top, bottom)
+            round_wins[round_index] += np.bincount(alive.ravel(), minlength=num_slots)
+
+    # Chance the team in each slot wins every round (rounds x slots)
+    return round_wins / num_simulations
+
+
+def get_exact_probabilities(series_probabilities: np.ndarray, has_team: np.ndarray) -> np.ndarray:
+
+    num_slots = len(series_probabilities)
+    reach = has_team.astype(float)
+    round_probabilities = np.zeros((len(ROUND_COLUMNS), num_slots))
+
+    # A slot wins a round if it reached it and beats whichever team comes out of the other half of its block, or
+    # meets a bye when no team comes out of it (byes never reach a round, so they are always a team's win)
+    for round_index in range(len(ROUND_COLUMNS)):
+        block_size = 2 ** (round_index + 1)
+        slots = np.arange(num_slots)
+        opponents = (slots[:, None] // block_size) * block_size + np.arange(block_size)[None, :]
+        is_opponent = (opponents // (block_size // 2)) != (slots[:, None] // (block_size // 2))
+        opponent_reach = reach[opponents] * is_opponent
+        beat_opponent = ((opponent_reach * series_probabilities[slots[:, None], opponents]).sum(axis=1) +
+                         1 - opponent_reach.sum(axis=1))
+        reach = reach * beat_opponent
+        round_probabilities[round_index] = reach
+
+    return round_probabilities
+
+
+def simulate_season(season_scores: pd.DataFrame, num_simulations: int = NUM_SIMULATIONS, scale: float = SCORE_SCALE,
+                    seed: np.random.SeedSequence = None) -> pd.DataFrame:
+
+    field, slot_teams, series_probabilities = get_bracket(season_scores, scale)
+    round_probabilities = simulate_bracket(series_probabilities, num_simulations, seed)
+
+    # Put every slot's probabilities back on its team (byes are dropped)
+    has_team = slot_teams >= 0
+    simulation = field[['Season', 'Team', 'Conference', 'Seed', 'Contender Score', 'Standings Rank', 'Result']].copy()
+    for round_index, column in enumerate(ROUND_COLUMNS):
+        simulation.loc[slot_teams[has_team], column] = round_probabilities[round_index, has_team]
+
+    return simulation.sort_values(by=ROUND_COLUMNS[::-1], ascending=False, kind='stable').reset_index(drop=True)
+
+
+
+# ====================================================================================================
+# FUNCTIONS FOR SIMULATING EVERY SEASON AND THE CURRENT SEASON
+# ====================================================================================================
+
+def load_scores(season: str) -> pd.DataFrame:
+    return data_cache.read_csv(f'scores/{season}_scores.csv')
+
+
+def get_available_seasons(seasons: list = None) -> list:
+
+    if seasons is None:
+        seasons = constants.SEASONS
+
+    # Seasons with a scores file that has at least one playoff team
+    return [season for season in seasons
+            if os.path.exists(f'scores/{season}_scores.csv') and len(load_scores(season))]
+
+
+def simulate_seasons(seasons: list = None, num_simulations: int = NUM_SIMULATIONS, scale: float = SCORE_SCALE,
+                     seed: int = None) -> dict:
+
+    if seasons is None:
+        seasons = get_available_seasons()
+
+    # Every season gets its own random stream from the one seed
+    season_seeds = np.random.SeedSequence(seed).spawn(len(seasons))
+
+    return {season: simulate_season(load_scores(season), num_simulations, scale, season_seed)
+            for season, season_seed in zip(seasons, season_seeds)}
+
+
+def simulate_live_season(season: str, num_simulations: int = NUM_SIMULATIONS, scale: float = SCORE_SCALE,
+                         seed: int = None) -> pd.DataFrame:
+
+    # The current season's ranking of every team kept by score_update, whose 8 best teams in the standings of each
+    # conference make up the bracket
+    live_scores = data_cache.read_csv(score_update.live_scores_path(season))
+
+    return simulate_season(live_scores, num_simulations, scale, seed)
+
+
+def get_pseudo_log_likelihood(season_scores: dict, scale: float) -> float:
+
+    # The scores files don't say who each team actually played, so this is not the likelihood of the series that
+    # were played: it adds up the log of every team's marginal chance of winning the rounds it won in the fixed
+    # conference bracket, as if the teams' results were independent of each other
+    log_likelihood = 0.0
+
+    for scores in season_scores.values():
+        field, slot_teams, series_probabilities = get_bracket(scores, scale)
+        has_team = slot_teams >= 0
+
+        # Chance of every team winning exactly the number of rounds it won
+        num_slots = len(BRACKET_SEEDS)
+        round_probabilities = get_exact_probabilities(series_probabilities, has_team)
+        reach = np.vstack([np.ones(num_slots), round_probabilities, np.zeros(num_slots)])
+        results = field['Result'].to_numpy()[slot_teams[has_team]]
+        slots = np.flatnonzero(has_team)
+        exact_probabilities = reach[results, slots] - reach[results + 1, slots]
+        log_likelihood += np.log(np.maximum(exact_probabilities, 1e-12)).sum()
+
+    return float(log_likelihood)
+
+
+def calibrate_scale(seasons: list = None, scales: np.ndarray = np.linspace(0, 0.3, 61), refinements: int = 2) -> float:
+
+    if seasons is None:
+        seasons = get_available_seasons()
+    season_scores = {season: load_scores(season) for season in seasons}
+
+    # The scale under which the actual playoff results were most likely, by the pseudo-likelihood on the conference
+    # bracket, searched on the grid and then on finer grids around the best scale so far (scales can't go below 0)
+    for refinement in range(refinements + 1):
+        log_likelihoods = [get_pseudo_log_likelihood(season_scores, scale) for scale in scales]
+        best_scale = float(scales[int(np.argmax(log_likelihoods))])
+        step = float(np.max(np.diff(scales)))
+        scales = np.linspace(max(best_scale - step, 0), best_scale + step, 41)
+
+    return best_scale
+
+
+def save_simulations(simulations: dict) -> None:
+    os.makedirs(SIMULATIONS_DIR, exist_ok=True)
+    for season, simulation in simulations.items():
+        simulation.to_csv(os.path.join(SIMULATIONS_DIR, f'{season}_simulation.csv'), index=False)
+
+
+def parse_args() -> argparse.Namespace:
+
+    parser = argparse.ArgumentParser(description='Simulate the playoff bracket of every season from contender scores.')
+    parser.add_argument('--simulations', type=int, default=NUM_SIMULATIONS, help='brackets simulated per season')
+    parser.add_argument('--scale', type=float, default=SCORE_SCALE,
+                        help='change in the log odds of winning a game per point of contender score difference')
+    parser.add_argument('--calibrate', action='store_true',
+                        help='use the scale under which the actual playoff results were most likely (a marginal '
+                             'pseudo-likelihood of every team\'s rounds won in the conference bracket, since the '
+                             'series that were played are unknown)')
+    parser.add_argument('--seed', type=int, default=None, help='seed of the simulations')
+    parser.add_argument('--live', default=None, metavar='SEASON',
+                        help='only simulate the current season from the live scores kept by score_update')
+
+    return parser.parse_args()
+
+
+def main() -> None:
+    args = parse_args()
+    instrumentation.enable_from_env()
+
+    scale = args.scale
+    if args.calibrate:
+        scale = calibrate_scale()
+        print(f"Calibrated scale: {scale:.4f}")
+
+    start = time.perf_counter()
+    if args.live is not None:
+        simulations = {args.live: simulate_live_season(args.live, args.simulations, scale, args.seed)}
+    else:
+        simulations = simulate_seasons(None, args.simulations, scale, args.seed)
+    seconds = time.perf_counter() - start
+
+    save_simulations(simulations)
+
+    for season, simulation in simulations.items():
+        print(f"\n=== {season} ===")
+        print(simulation.to_string(index=False, float_format=lambda value: f'{value:.3f}'))
+    print(f"\nSimulated {args.simulations} brackets for {len(simulations)} season(s) in {seconds:.3f}s")
+
+
+if __name__ == '__main__':
+    main()
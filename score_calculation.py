@@ -1,111 +1,221 @@
-
 # Imports
+import argparse
+import json
+import os
+import numpy as np
 import pandas as pd
 import constants
+import data_cache
+import data_relevant
+import instrumentation
 
 
 # ====================================================================================================
 # FUNCTIONS FOR CALCULATING A TEAMS CONTENDER SCORE
 # ====================================================================================================
 
-def increase_score(score: float, value: float, type: str, weights) -> float:
-    
-    # Get z stats
-    z_stats = constants.Z_STATS
+def get_z_matrix(scoring_data: pd.DataFrame) -> np.ndarray:
+
+    # Get the mean and standard deviation of every group's stat
+    groups = list(constants.SCORE_GROUP_COLUMNS)
+    means = np.array([constants.Z_STATS[group]['mean'] for group in groups])
+    stds = np.array([constants.Z_STATS[group]['std'] for group in groups])
+
+    # Standardize every team season's group stats into z scores (team seasons x groups)
+    values = scoring_data[list(constants.SCORE_GROUP_COLUMNS.values())].to_numpy(dtype=float)
+    z_matrix = (values - means) / stds
+
+    return z_matrix
+
+
+def get_weight_vector(weights: dict) -> np.ndarray:
+    return np.array([weights[group] for group in constants.SCORE_GROUP_COLUMNS], dtype=float)
+
+
+def get_weighted_scores(z_matrix: np.ndarray, weight_vector: np.ndarray) -> np.ndarray:
+
+    # A batch of weight vectors (candidates x groups) gives one column of scores per candidate
+    weight_vector = np.asarray(weight_vector, dtype=float)
+
+    # Multiply the z scores by the weights, adding the groups one at a time in a fixed order so every
+    # team season's sum is done in the same order (and gives the same float) no matter how many are scored
+    scores = np.zeros(z_matrix.shape[:1] + weight_vector.shape[:-1])
+    for group_index in range(z_matrix.shape[1]):
+        scores += np.multiply.outer(z_matrix[:, group_index], weight_vector[..., group_index])
+
+    return scores
+
+
+def round_scores(scores: np.ndarray, decimals: int = 2) -> np.ndarray:
+
+    # The baseline rounded each NumPy float score with round, which rounds it the way np.round does
+    return np.round(scores, decimals)
+
+
+@instrumentation.instrument
+def get_contender_scores(scoring_data: pd.DataFrame, weights=None) -> np.ndarray:
+
+    if weights is None:
+        weights = constants.SCORE_WEIGHTS
+
+    # Score every team season in the scoring data at once
+    z_matrix = get_z_matrix(scoring_data)
+    scores = get_weighted_scores(z_matrix, get_weight_vector(weights))
+
+    return round_scores(scores)
+
+
+def index_scoring_data(scoring_data: pd.DataFrame) -> dict:
+
+    # Standardize every team season's group stats once and keep the row of each season and team, so single team
+    # seasons are found by hash lookups and scored from their row of z scores
+    scoring_rows = get_scoring_rows(scoring_data)
+    if len(scoring_rows) != len(scoring_data):
+        raise ValueError("Scoring data has more than one row for a season and team")
+
+    scoring_index = {
+        'rows': scoring_rows,
+        'z_matrix': get_z_matrix(scoring_data),
+        'results': scoring_data['Result'].to_numpy(),
+    }
+
+    return scoring_index
+
+
+def get_scoring_rows(scoring_data: pd.DataFrame) -> dict:
+
+    # Position of every team season in the scoring data
+    return {key: row for row, key in enumerate(zip(scoring_data['Season'], scoring_data['Team']))}
+
 
-    # Get the mean, standard deviation, and factor weight of the metric to be scored
-    mean = z_stats[type]['mean']
-    std = z_stats[type]['std']
-    factor = weights[type]
+def get_standings_ranks(standings_data: pd.DataFrame) -> dict:
 
-    # Calculate the factored z score of the value
-    z_score = (value - mean) / std
-    score += z_score * factor
+    # Standings rank of every team (the first row of a team is used if it is listed more than once)
+    standings_data = standings_data.drop_duplicates(subset='Team')
 
-    return score
+    return dict(zip(standings_data['Team'], standings_data['Rk']))
 
 
-def get_contender_score(team_abbrev: str, season: str, scoring_data: pd.DataFrame, weights=constants.SCORE_WEIGHTS) -> float:
+@instrumentation.instrument
+def get_contender_score(team_abbrev: str, season: str, scoring_data: pd.DataFrame | dict, weights=None) -> float:
+
+    if weights is None:
+        weights = constants.SCORE_WEIGHTS
+
+    # Score the team season straight from its row of z scores if the scoring data was indexed by index_scoring_data
+    if isinstance(scoring_data, dict):
+        row = scoring_data['rows'][(season, team_abbrev)]
+        z_scores = scoring_data['z_matrix'][row:row + 1]
+        score = float(round_scores(get_weighted_scores(z_scores, get_weight_vector(weights)))[0])
+
+        return score, scoring_data['results'][row]
 
     # Get the given team's scoring data for the given year
     team_data = scoring_data[
         (scoring_data['Team'] == team_abbrev) &
-        (scoring_data['Season'] == season)].iloc[0]
-    
-    # Get the average game scores for each forward and defense group as well as the goalie's GSAx/GP
-    top_f_score = team_data['1-3 F Avg Game Score']
-    top_mid_f_score = team_data['4-6 F Avg Game Score']
-    bot_mid_f_score = team_data['7-9 F Avg Game Score']
-    bot_f_score = team_data['9-12 F Avg Game Score']
-    top_d_score = team_data['1-2 D Avg Game Score']
-    mid_d_score = team_data['3-4 D Avg Game Score']
-    bot_d_score = team_data['5-6 D Avg Game Score']
-    goalie_gsax  = team_data['Starting Goalie Avg GSAx']
-
-    # Initialize the contender score
-    score = 0
-
-    # Apply z-score normalization and weightings for each group and accumulate the total contender score
-    score = increase_score(score, top_f_score, 'one_three_f', weights)
-    score = increase_score(score, top_mid_f_score, 'four_six_f', weights)
-    score = increase_score(score, bot_mid_f_score, 'seven_nine_f', weights)
-    score = increase_score(score, bot_f_score, 'ten_twelve_f', weights)
-    score = increase_score(score, top_d_score, 'one_two_d', weights)
-    score = increase_score(score, mid_d_score, 'three_four_d', weights)
-    score = increase_score(score, bot_d_score, 'five_six_d', weights)
-    score = increase_score(score, goalie_gsax, 'goalie_gsax', weights)
-
-    score = round(score, 2)
+        (scoring_data['Season'] == season)].iloc[:1]
+
+    # Score the single team season with the same calculation used for every team season
+    score = float(get_contender_scores(team_data, weights)[0])
 
     # Get the team's playoff result
-    result = team_data['Result']
+    result = team_data['Result'].iloc[0]
 
     return score, result
 
 
 
 # ====================================================================================================
-# SCRIPT TO CALCULATION CONTENDER SCORES FOR ALL TEAMS IN ALL SEASONS
+# FUNCTIONS TO CALCULATE CONTENDER SCORES FOR ALL TEAMS IN ALL SEASONS
 # ====================================================================================================
 
-# Load scoring data
-scoring_data = pd.read_csv('relevant_data/scoring_data.csv')
-
-for season in constants.SEASONS:
-    rows = []
-
-    # Load the standings data for the year
-    standings_data = pd.read_csv(f'raw_data/standings_data/{season}.csv')
-
-    for team_abbrev in constants.TEAM_ABBREVIATIONS:
-        # Account for league team changes across seasons
-        if team_abbrev == 'WPG' and season in constants.ATL_SEASONS:
-            team_abbrev = 'ATL'
-        if team_abbrev == 'VGK' and season not in constants.VGK_SEASONS:
-            continue
-        if team_abbrev == 'SEA' and season not in constants.SEA_SEASONS:
-            continue
-        if team_abbrev == 'UTA' and season not in constants.UTA_SEASONS:
-            team_abbrev = 'ARI'
-
-        # Get the contender score, playoff result, and standing rank for the team
-        contender_score, result = get_contender_score(team_abbrev, season, scoring_data)
-
-        # Get the team's standing ranking
-        team_standings_data = standings_data[standings_data['Team'] == team_abbrev].iloc[0]
-        standings_rank = team_standings_data['Rk']
-
-        # Add the team's contender score and information if they made the playoffs
-        if result != -1:
-            rows.append({
-                'Season': season,
-                'Team': team_abbrev,
-                'Contender Score': contender_score,
-                'Standings Rank': standings_rank,
-                'Result': result
-            })
-
-    # Save the CSV file
-    df = pd.DataFrame(rows)
-    df = df.sort_values(by="Contender Score", ascending=False).reset_index(drop=True)
-    df.to_csv(f'scores/{season}_scores.csv', index=False)
+@instrumentation.instrument
+def calculate_season_scores(scoring_data: pd.DataFrame, seasons: list = None, weights=None,
+                            season_frames: dict = None) -> dict:
+
+    if seasons is None:
+        seasons = constants.SEASONS
+    if weights is None:
+        weights = constants.SCORE_WEIGHTS
+
+    # Load the seasons' standings concurrently unless they were already loaded
+    if season_frames is None:
+        season_frames = data_cache.load_seasons(seasons, ['standings'])
+
+    # Score every team season at once
+    contender_scores = get_contender_scores(scoring_data, weights).tolist()
+    results = scoring_data['Result'].tolist()
+    scoring_rows = get_scoring_rows(scoring_data)
+
+    season_scores = {}
+
+    for season in seasons:
+        rows = []
+
+        # Get the standings ranks for the year
+        standings_ranks = get_standings_ranks(season_frames[season]['standings'])
+
+        for team_abbrev in data_relevant.get_season_teams(season):
+
+            # Get the contender score, playoff result, and standing rank for the team
+            row = scoring_rows[(season, team_abbrev)]
+            contender_score, result = contender_scores[row], results[row]
+            standings_rank = standings_ranks[team_abbrev]
+
+            # Add the team's contender score and information if they made the playoffs
+            if result != -1:
+                rows.append({
+                    'Season': season,
+                    'Team': team_abbrev,
+                    'Contender Score': contender_score,
+                    'Standings Rank': standings_rank,
+                    'Result': result
+                })
+
+        df = pd.DataFrame(rows)
+        season_scores[season] = df.sort_values(by="Contender Score", ascending=False, kind="stable").reset_index(drop=True)
+
+    return season_scores
+
+
+def parse_args() -> argparse.Namespace:
+
+    parser = argparse.ArgumentParser(description='Calculate contender scores for every team in every season.')
+    parser.add_argument('--store', action='store_true',
+                        help='save the scores to the consolidated score store instead of per season CSV files')
+    parser.add_argument('--config', default=None,
+                        help='name the scores are stored under (defaults to the name of the weights file, or "default")')
+    parser.add_argument('--weights', default=None, help='JSON file of factor weights (defaults to constants.SCORE_WEIGHTS)')
+
+    return parser.parse_args()
+
+
+def main() -> None:
+    args = parse_args()
+    instrumentation.enable_from_env()
+
+    # Load scoring data
+    scoring_data = data_cache.read_csv('relevant_data/scoring_data.csv')
+
+    # Load the factor weights to score with
+    weights = constants.SCORE_WEIGHTS
+    if args.weights is not None:
+        with open(args.weights) as file:
+            weights = json.load(file)
+
+    season_scores = calculate_season_scores(scoring_data, weights=weights)
+
+    if args.store:
+        # Save every season's scores under one configuration of the score store
+        import score_store
+        config = args.config or (os.path.splitext(os.path.basename(args.weights))[0] if args.weights
+                                 else score_store.DEFAULT_CONFIG)
+        score_store.write_scores(season_scores, config, weights)
+    else:
+        # Save the CSV files
+        for season, df in season_scores.items():
+            df.to_csv(f'scores/{season}_scores.csv', index=False)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,171 +1,776 @@
 
 # Imports
-import optuna
+import argparse
+import functools
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import TYPE_CHECKING
+import numpy as np
 import pandas as pd
 import constants
-from score_calculation import get_contender_score
+import data_cache
+import data_relevant
+import instrumentation
+from score_calculation import (get_contender_scores, get_scoring_rows, get_standings_ranks, get_weighted_scores,
+                               get_z_matrix, round_scores)
 
-# Load precomputed scoring data once
-scoring_data = pd.read_csv('relevant_data/scoring_data.csv')
+# Optuna is only imported by the functions that run a study, so the module can be imported without it
+if TYPE_CHECKING:
+    import optuna
 
+# Range searched for each factor weight
+WEIGHT_BOUNDS = {
+    'one_three_f': (3, 7),
+    'four_six_f': (0, 2),
+    'seven_nine_f': (0, 3),
+    'ten_twelve_f': (3, 6),
+    'one_two_d': (6, 10),
+    'three_four_d': (0, 2),
+    'five_six_d': (5, 10),
+    'goalie_gsax': (9, 10),
+}
 
-def calculate_all_scores(weights: dict) -> pd.DataFrame:
+# Journal file shared by the worker processes of a parallel study
+DEFAULT_STORAGE = 'studies/contender_weights.log'
 
-    all_rows = []
+# Counts the objective adds up over the seasons
+METRIC_NAMES = ['top1_cup_winners', 'top2_finalists', 'top4_con_finalists', 'top8_round_winners', 'cup_winner_rank_sum']
 
-    for season in constants.SEASONS:
-        standings_data = pd.read_csv(f'raw_data/standings_data/{season}.csv')
+# Evaluation index handed to worker processes when they start
+SHARED_INDEX = {'evaluation_index': None}
 
-        for team_abbrev in constants.TEAM_ABBREVIATIONS:
-            adjusted_team_abbrev = team_abbrev
 
-            # Adjust team abbreviations for franchise moves/expansion teams
-            if team_abbrev == 'WPG' and season in constants.ATL_SEASONS:
-                adjusted_team_abbrev = 'ATL'
-            if team_abbrev == 'VGK' and season not in constants.VGK_SEASONS:
-                continue
-            if team_abbrev == 'SEA' and season not in constants.SEA_SEASONS:
-                continue
-            if team_abbrev == 'UTA' and season not in constants.UTA_SEASONS:
-                adjusted_team_abbrev = 'ARI'
+def get_weight_bounds() -> tuple:
+
+    # Lows and highs of the searched ranges in the order of the z matrix's groups (the order weight vectors use)
+    bounds = np.array([WEIGHT_BOUNDS[group] for group in constants.SCORE_GROUP_COLUMNS], dtype=float)
+
+    return bounds[:, 0], bounds[:, 1]
+
+
+@functools.lru_cache(maxsize=None)
+def load_scoring_data() -> pd.DataFrame:
+
+    # Load precomputed scoring data once, the first time it is needed
+    return data_cache.read_csv('relevant_data/scoring_data.csv')
 
-            contender_score, result = get_contender_score(adjusted_team_abbrev, season, scoring_data, weights)
 
-            # Skip teams not found in standings data
-            try:
-                team_standings_data = standings_data[standings_data['Team'] == team_abbrev].iloc[0]
-                standings_rank = team_standings_data['Rk']
-            except IndexError:
+@instrumentation.instrument
+def get_evaluation_rows(season_frames: dict = None) -> pd.DataFrame:
+
+    # Load the seasons' standings concurrently unless they were already loaded
+    if season_frames is None:
+        season_frames = data_cache.load_seasons(constants.SEASONS, ['standings'])
+
+    scoring_data = load_scoring_data()
+    results = scoring_data['Result'].tolist()
+    scoring_rows = get_scoring_rows(scoring_data)
+    all_rows = []
+
+    for season in constants.SEASONS:
+        standings_ranks = get_standings_ranks(season_frames[season]['standings'])
+
+        for team_abbrev, adjusted_team_abbrev in data_relevant.get_season_abbreviations(season).items():
+            row = scoring_rows[(season, adjusted_team_abbrev)]
+            result = results[row]
+
+            # Skip teams not found in standings data (they are looked up by their current abbreviation)
+            if team_abbrev not in standings_ranks:
                 continue
 
             if result != -1:
                 all_rows.append({
                     'Season': season,
                     'Team': team_abbrev,
-                    'Contender Score': contender_score,
-                    'Standings Rank': standings_rank,
-                    'Result': result
+                    'Standings Rank': standings_ranks[team_abbrev],
+                    'Result': result,
+                    'Row': row
                 })
 
     return pd.DataFrame(all_rows)
 
 
-def objective(trial) -> float:
+@instrumentation.instrument
+def calculate_all_scores(weights: dict) -> pd.DataFrame:
+
+    evaluation_rows = get_evaluation_index()['rows'].copy()
+
+    # Score every team season at once with the given weights
+    contender_scores = get_contender_scores(load_scoring_data(), weights)
+    evaluation_rows.insert(2, 'Contender Score', contender_scores[evaluation_rows['Row']])
+
+    return evaluation_rows.drop(columns='Row')
+
 
-    # Suggest weight values within specified ranges
-    weights = {
-        'one_three_f': trial.suggest_float('one_three_f', 3, 7),
-        'four_six_f': trial.suggest_float('four_six_f', 0, 2),
-        'seven_nine_f': trial.suggest_float('seven_nine_f', 0, 3),
-        'ten_twelve_f': trial.suggest_float('ten_twelve_f', 3, 6),
-        'one_two_d': trial.suggest_float('one_two_d', 6, 10),
-        'three_four_d': trial.suggest_float('three_four_d', 0, 2),
-        'five_six_d': trial.suggest_float('five_six_d', 5, 10),
-        'goalie_gsax': trial.suggest_float('goalie_gsax', 9, 10)
-    }
 
-    df = calculate_all_scores(weights)
+# ====================================================================================================
+# FUNCTIONS FOR EVALUATING CANDIDATE WEIGHTS
+# ====================================================================================================
 
-    # Initialize metrics
-    num_top1_cup_winners = 0
-    num_top2_finalists = 0
-    num_top4_con_finalists = 0
-    num_top8_round_winners = 0
-    cup_winner_ranks = []
+@instrumentation.instrument
+def build_evaluation_index(season_frames: dict = None) -> dict:
 
-    # Evaluate model across all seasons
+    evaluation_rows = get_evaluation_rows(season_frames)
+
+    # Each season's evaluated team seasons are stored next to each other
+    season_values = evaluation_rows['Season'].to_numpy()
+    season_slices = []
     for season in constants.SEASONS:
-        season_df = df[df['Season'] == season]
-        df_sorted = season_df.sort_values(by='Contender Score', ascending=False).reset_index(drop=True)
+        positions = np.flatnonzero(season_values == season)
+        season_slices.append(slice(positions[0], positions[-1] + 1) if len(positions) else slice(0, 0))
+
+    # Lay the team seasons out season by season (seasons x most teams in a season), padded with -1
+    max_teams = max(season_slice.stop - season_slice.start for season_slice in season_slices)
+    season_rows = np.full((len(season_slices), max_teams), -1)
+    for season_index, season_slice in enumerate(season_slices):
+        season_rows[season_index, :season_slice.stop - season_slice.start] = np.arange(season_slice.start, season_slice.stop)
+
+    # Playoff results laid out the same way, with -1 for padding
+    results = evaluation_rows['Result'].to_numpy()
+    is_team = season_rows >= 0
+    season_results = np.where(is_team, results[season_rows], -1)
+
+    # Position of each season's Cup winner
+    has_cup_winner = (season_results == 4).any(axis=1)
+
+    z_matrix = get_z_matrix(load_scoring_data().iloc[evaluation_rows['Row']])
+
+    evaluation_index = {
+        'rows': evaluation_rows,
+        'z_matrix': z_matrix,
+        'results': results,
+        'season_slices': season_slices,
+        'season_rows': season_rows,
+        'is_team': is_team,
+        'season_results': season_results,
+        'cup_winner_seasons': np.flatnonzero(has_cup_winner),
+        'cup_winner_positions': (season_results == 4).argmax(axis=1)[has_cup_winner],
+    }
+
+    return evaluation_index
+
+
+@functools.lru_cache(maxsize=None)
+def get_evaluation_index() -> dict:
+
+    # Only built once, the first time it is needed, unless the process that started this worker handed it over
+    if SHARED_INDEX['evaluation_index'] is not None:
+        return SHARED_INDEX['evaluation_index']
+
+    return build_evaluation_index()
+
+
+def share_evaluation_index(evaluation_index: dict) -> None:
+
+    # Run by every worker process as it starts, so workers use the parent's evaluation index however they are
+    # started (spawned and forkserver workers start without the parent's memory)
+    SHARED_INDEX['evaluation_index'] = evaluation_index
+    get_evaluation_index.cache_clear()
+
+
+def get_season_ranks(season_scores: np.ndarray, is_scored: np.ndarray) -> np.ndarray:
+
+    # Move each season's scored teams to the front in the order they are listed (seasons x teams); teams without a
+    # score (and padding) come after them, also in the order they are listed
+    candidate_axes = (1,) * (season_scores.ndim - 2)
+    num_scored = is_scored.sum(axis=1)
+    positions = np.argsort(~is_scored, axis=1, kind='stable').reshape(is_scored.shape + candidate_axes)
+    scores = np.take_along_axis(season_scores, positions, axis=1)
 
-        # Track playoff progression success at different thresholds
-        cup_winners = season_df[season_df['Result'] == 4]
-        top1_teams = df_sorted.head(1)['Team'].tolist()
-        num_top1_cup_winners += any(row['Team'] in top1_teams for _, row in cup_winners.iterrows())
+    # Sort each season's scores from highest to lowest (season_scores is seasons x teams, with an optional
+    # candidates axis) the way pandas' default sort_values does, so teams with the same score are ordered like
+    # the per season sort: pandas sorts the reversed scores with quicksort and reverses the order it gets back
+    order = np.empty(season_scores.shape, dtype=int)
+    for num_teams in np.unique(num_scored):
+        seasons = np.flatnonzero(num_scored == num_teams)
+        reversed_scores = scores[seasons, :num_teams][:, ::-1]
+        order[seasons, :num_teams] = num_teams - 1 - np.argsort(reversed_scores, axis=1, kind='quicksort')[:, ::-1]
+        order[seasons, num_teams:] = np.arange(num_teams, season_scores.shape[1]).reshape((1, -1) + candidate_axes)
+    order = np.take_along_axis(np.broadcast_to(positions, order.shape), order, axis=1)
 
-        finalists = season_df[season_df['Result'] >= 3]
-        top2_teams = df_sorted.head(2)['Team'].tolist()
-        num_top2_finalists += sum(row['Team'] in top2_teams for _, row in finalists.iterrows())
+    # Turn the sort order into each team's 1-based rank
+    rank_values = np.arange(1, season_scores.shape[1] + 1).reshape((1, -1) + candidate_axes)
+    ranks = np.empty_like(order)
+    np.put_along_axis(ranks, order, np.broadcast_to(rank_values, order.shape), axis=1)
 
-        con_finalists = season_df[season_df['Result'] >= 2]
-        top4_teams = df_sorted.head(4)['Team'].tolist()
-        num_top4_con_finalists += sum(row['Team'] in top4_teams for _, row in con_finalists.iterrows())
+    return ranks
 
-        round_winners = season_df[season_df['Result'] >= 1]
-        top8_teams = df_sorted.head(8)['Team'].tolist()
-        num_top8_round_winners += sum(row['Team'] in top8_teams for _, row in round_winners.iterrows())
 
-        # Record the rank of the actual Cup winner
-        if not cup_winners.empty:
-            team = cup_winners.iloc[0]['Team']
-            rank = df_sorted[df_sorted['Team'] == team].index[0]
-            cup_winner_ranks.append(rank + 1)
+def evaluate_season_counts(weight_batch: np.ndarray, evaluation_index: dict) -> np.ndarray:
+
+    season_rows = evaluation_index['season_rows']
+    is_team = evaluation_index['is_team']
+    season_results = evaluation_index['season_results'][:, :, None]
+    cup_winner_seasons = evaluation_index['cup_winner_seasons']
+    cup_winner_positions = evaluation_index['cup_winner_positions']
+
+    # Score every team season for every candidate (teams x candidates)
+    scores = round_scores(get_weighted_scores(evaluation_index['z_matrix'], weight_batch))
+
+    # Rank the teams within each season for every candidate; missing scores and padding sort last
+    season_scores = scores[season_rows]
+    ranks = get_season_ranks(season_scores, is_team & ~np.isnan(season_scores).any(axis=2))
+
+    # Track playoff progression success at different thresholds in every season (seasons x counts x candidates)
+    season_counts = np.zeros((len(season_rows), len(METRIC_NAMES), len(weight_batch)), dtype=int)
+    season_counts[:, 0] = ((ranks == 1) & (season_results == 4)).any(axis=1)
+    season_counts[:, 1] = ((ranks <= 2) & (season_results >= 3)).sum(axis=1)
+    season_counts[:, 2] = ((ranks <= 4) & (season_results >= 2)).sum(axis=1)
+    season_counts[:, 3] = ((ranks <= 8) & (season_results >= 1)).sum(axis=1)
+
+    # Record the ranks of the actual Cup winners
+    season_counts[cup_winner_seasons, 4] = ranks[cup_winner_seasons, cup_winner_positions]
+
+    return season_counts
+
+
+@instrumentation.instrument
+def evaluate_weight_batch(weight_batch: np.ndarray, evaluation_index: dict = None, batch_size: int = 2048) -> dict:
+
+    if evaluation_index is None:
+        evaluation_index = get_evaluation_index()
+
+    # One row of weights per candidate, in the same group order as constants.SCORE_GROUP_COLUMNS
+    weight_batch = np.atleast_2d(np.asarray(weight_batch, dtype=float))
+    num_candidates = weight_batch.shape[0]
+
+    metrics = {name: np.zeros(num_candidates, dtype=int) for name in METRIC_NAMES}
+
+    # Add up every season's counts for each batch of candidates
+    for start in range(0, num_candidates, batch_size):
+        candidates = slice(start, start + batch_size)
+        counts = evaluate_season_counts(weight_batch[candidates], evaluation_index).sum(axis=0)
+        for name, values in zip(METRIC_NAMES, counts):
+            metrics[name][candidates] = values
+
+    return add_objective_score(metrics, len(evaluation_index['cup_winner_seasons']))
+
+
+def add_objective_score(metrics: dict, num_cup_winners: int) -> dict:
 
     # Calculate average rank of actual Cup winners
-    avg_cup_rank = round(sum(cup_winner_ranks) / len(cup_winner_ranks), 3) if cup_winner_ranks else float('inf')
+    if num_cup_winners:
+        metrics['avg_cup_rank'] = round_scores(metrics['cup_winner_rank_sum'] / num_cup_winners, 3)
+    else:
+        metrics['avg_cup_rank'] = np.full(np.shape(metrics['cup_winner_rank_sum']), float('inf'))
 
     # Weighted scoring function
-    score = (
-        num_top1_cup_winners * 1_000_000 +
-        num_top2_finalists * 10_000 +
-        num_top4_con_finalists * 100 +
-        num_top8_round_winners * 1 -
-        avg_cup_rank
+    metrics['score'] = (
+        metrics['top1_cup_winners'] * 1_000_000 +
+        metrics['top2_finalists'] * 10_000 +
+        metrics['top4_con_finalists'] * 100 +
+        metrics['top8_round_winners'] * 1 -
+        metrics['avg_cup_rank']
     )
 
-    return score
+    return metrics
 
 
-if __name__ == '__main__':
-    # Run Optuna optimization to find best weights
-    study = optuna.create_study(direction='maximize')
-    study.optimize(objective, n_trials=500)
+def evaluate_weights(weights: dict, evaluation_index: dict = None) -> dict:
 
-    print("\nBest Weights Found:")
-    for key, value in study.best_params.items():
-        print(f"'{key}': {value:.2f},")
-    print(f"\nBest Score: {study.best_value:.2f}\n")
+    # Evaluate a single weight vector as a batch of one
+    weight_vector = [weights[group] for group in constants.SCORE_GROUP_COLUMNS]
+    metrics = evaluate_weight_batch(weight_vector, evaluation_index)
 
-    # Evaluate best weights on full dataset
-    best_weights = study.best_params
-    final_df = calculate_all_scores(best_weights)
+    return {name: values[0].item() for name, values in metrics.items()}
 
-    num_top1_cup_winners = 0
-    num_top2_finalists = 0
-    num_top4_con_finalists = 0
-    num_top8_round_winners = 0
-    cup_winner_ranks = []
 
-    for season in constants.SEASONS:
-        season_df = final_df[final_df['Season'] == season]
-        df_sorted = season_df.sort_values(by='Contender Score', ascending=False).reset_index(drop=True)
+@instrumentation.instrument
+def objective(trial, evaluation_index: dict = None) -> float:
+
+    # Suggest weight values within specified ranges
+    weights = {group: trial.suggest_float(group, low, high) for group, (low, high) in WEIGHT_BOUNDS.items()}
+
+    # Every season is evaluated at once (a trial takes a fraction of a millisecond, far less than the sampler's
+    # suggestions, so stopping trials early would save nothing)
+    return evaluate_weights(weights, evaluation_index)['score']
+
+
+def random_search(num_candidates: int, batch_size: int = 2048, seed: int = None) -> tuple:
+
+    evaluation_index = get_evaluation_index()
+    rng = np.random.default_rng(seed)
+
+    # Draw candidate weights uniformly from the searched ranges
+    low, high = get_weight_bounds()
 
-        cup_winners = season_df[season_df['Result'] == 4]
-        top1_teams = df_sorted.head(1)['Team'].tolist()
-        num_top1_cup_winners += any(row['Team'] in top1_teams for _, row in cup_winners.iterrows())
+    best_weights, best_score = None, -float('inf')
+    for start in range(0, num_candidates, batch_size):
+        weight_batch = rng.uniform(low, high, size=(min(batch_size, num_candidates - start), len(low)))
+        scores = evaluate_weight_batch(weight_batch, evaluation_index, batch_size)['score']
 
-        finalists = season_df[season_df['Result'] >= 3]
-        top2_teams = df_sorted.head(2)['Team'].tolist()
-        num_top2_finalists += sum(row['Team'] in top2_teams for _, row in finalists.iterrows())
+        # Keep the best candidate seen so far
+        best_index = scores.argmax()
+        if scores[best_index] > best_score:
+            best_weights = dict(zip(constants.SCORE_GROUP_COLUMNS, weight_batch[best_index].tolist()))
+            best_score = float(scores[best_index])
 
-        con_finalists = season_df[season_df['Result'] >= 2]
-        top4_teams = df_sorted.head(4)['Team'].tolist()
-        num_top4_con_finalists += sum(row['Team'] in top4_teams for _, row in con_finalists.iterrows())
+    return best_weights, best_score
 
-        round_winners = season_df[season_df['Result'] >= 1]
-        top8_teams = df_sorted.head(8)['Team'].tolist()
-        num_top8_round_winners += sum(row['Team'] in top8_teams for _, row in round_winners.iterrows())
 
-        if not cup_winners.empty:
-            team = cup_winners.iloc[0]['Team']
-            rank = df_sorted[df_sorted['Team'] == team].index[0]
-            cup_winner_ranks.append(rank + 1)
+def print_metrics(title: str, metrics: dict, num_cup_winners: int) -> None:
 
-    avg_cup_rank = sum(cup_winner_ranks) / len(cup_winner_ranks) if cup_winner_ranks else float('inf')
+    avg_cup_rank = metrics['cup_winner_rank_sum'] / num_cup_winners if num_cup_winners else float('inf')
 
-    print("Final Evaluation of Best Weights:")
-    print(f"Top 1 Ranked Cup Winners: {num_top1_cup_winners} out of {len(constants.SEASONS)}")
-    print(f"Top 2 Ranked Finalists: {num_top2_finalists} out of {len(constants.SEASONS) * 2}")
-    print(f"Top 4 Ranked Conference Finalists: {num_top4_con_finalists} out of {len(constants.SEASONS) * 4}")
-    print(f"Top 8 Ranked Round Winners: {num_top8_round_winners} out of {len(constants.SEASONS) * 8}")
+    print(f"{title}:")
+    print(f"Top 1 Ranked Cup Winners: {metrics['top1_cup_winners']} out of {len(constants.SEASONS)}")
+    print(f"Top 2 Ranked Finalists: {metrics['top2_finalists']} out of {len(constants.SEASONS) * 2}")
+    print(f"Top 4 Ranked Conference Finalists: {metrics['top4_con_finalists']} out of {len(constants.SEASONS) * 4}")
+    print(f"Top 8 Ranked Round Winners: {metrics['top8_round_winners']} out of {len(constants.SEASONS) * 8}")
     print(f"Average Cup Winner Rank: {avg_cup_rank:.2f}")
+
+
+def print_evaluation(weights: dict) -> None:
+    num_cup_winners = len(get_evaluation_index()['cup_winner_seasons'])
+    print_metrics("Final Evaluation of Best Weights", evaluate_weights(weights), num_cup_winners)
+
+
+
+# ====================================================================================================
+# FUNCTIONS FOR SEARCHING THE WEIGHTS EXACTLY WITH BRANCH AND BOUND
+# ====================================================================================================
+
+# Score difference that guarantees an order after scores are rounded to two decimals (with room for float error).
+# This assumes the objective ranks scores rounded to 2 decimals by round_scores, and that the bound's matrix
+# products and get_weighted_scores' sums differ by less than 1e-9, which holds for z scores of a few units and
+# the weights in WEIGHT_BOUNDS (their float error is around 1e-14). Pairs closer than this are treated as able to
+# come in either order, so the bound holds however tied scores are ranked
+ROUNDING_MARGIN = 0.01 + 1e-9
+
+
+def build_pair_index(evaluation_index: dict) -> dict:
+
+    # The objective only looks at where teams that won a round rank, and a team's rank only changes when the
+    # weights cross a hyperplane where its score equals another team's score in the same season, so only the
+    # pairs (round winner, other team in the season) are needed
+    z_matrix = evaluation_index['z_matrix']
+    results = evaluation_index['results']
+    is_missing = np.isnan(z_matrix).any(axis=1)
+
+    targets, competitors = [], []
+    for season_slice in evaluation_index['season_slices']:
+        for target in range(season_slice.start, season_slice.stop):
+            if results[target] >= 1:
+                others = [team for team in range(season_slice.start, season_slice.stop) if team != target]
+                targets.extend([target] * len(others))
+                competitors.extend(others)
+    targets, competitors = np.array(targets), np.array(competitors)
+
+    # The competitor's score minus the target's score is (z_competitor - z_target) . weights
+    coefficients = np.nan_to_num(z_matrix[competitors] - z_matrix[targets])
+
+    # Teams with missing scores always sort last, in the order they are listed
+    has_missing = is_missing[competitors] | is_missing[targets]
+    listed_before = competitors < targets
+    fixed_above = has_missing & ~is_missing[competitors] | is_missing[competitors] & is_missing[targets] & listed_before
+    fixed_below = has_missing & ~fixed_above
+
+    # The pairs are grouped by target, starting at these positions
+    target_rows, target_starts = np.unique(targets, return_index=True)
+
+    pair_index = {
+        'positive_coefficients': np.maximum(coefficients, 0),
+        'negative_coefficients': np.minimum(coefficients, 0),
+        'has_missing': has_missing,
+        'fixed_above': fixed_above,
+        'fixed_below': fixed_below,
+        'target_starts': target_starts,
+        'target_results': results[target_rows],
+        'num_cup_winners': len(evaluation_index['cup_winner_seasons']),
+    }
+
+    return pair_index
+
+
+def get_best_ranks(box_lows: np.ndarray, box_highs: np.ndarray, pair_index: dict) -> tuple:
+
+    # Smallest and largest score difference of every pair over every box (boxes x pairs)
+    positive = pair_index['positive_coefficients'].T
+    negative = pair_index['negative_coefficients'].T
+    min_differences = box_lows @ positive + box_highs @ negative
+    max_differences = box_highs @ positive + box_lows @ negative
+
+    # Pairs whose order is the same everywhere in the box
+    is_measured = ~pair_index['has_missing']
+    always_above = pair_index['fixed_above'] | is_measured & (min_differences > ROUNDING_MARGIN)
+    always_below = pair_index['fixed_below'] | is_measured & (max_differences < -ROUNDING_MARGIN)
+
+    # Best rank each round winner can reach anywhere in the box
+    best_ranks = 1 + np.add.reduceat(always_above, pair_index['target_starts'], axis=1)
+
+    return best_ranks, always_above, always_below
+
+
+def get_box_bounds(box_lows: np.ndarray, box_highs: np.ndarray, pair_index: dict) -> tuple:
+
+    best_ranks, always_above, always_below = get_best_ranks(box_lows, box_highs, pair_index)
+    target_results = pair_index['target_results']
+
+    # Best possible value of every term of the objective
+    top1_cup_winners = ((best_ranks == 1) & (target_results == 4)).sum(axis=1)
+    top2_finalists = ((best_ranks <= 2) & (target_results >= 3)).sum(axis=1)
+    top4_con_finalists = ((best_ranks <= 4) & (target_results >= 2)).sum(axis=1)
+    top8_round_winners = ((best_ranks <= 8) & (target_results >= 1)).sum(axis=1)
+    if pair_index['num_cup_winners']:
+        cup_winner_rank_sum = np.where(target_results == 4, best_ranks, 0).sum(axis=1)
+        avg_cup_rank = round_scores(cup_winner_rank_sum / pair_index['num_cup_winners'], 3)
+    else:
+        avg_cup_rank = np.full(len(box_lows), float('inf'))
+
+    upper_bounds = (
+        top1_cup_winners * 1_000_000 +
+        top2_finalists * 10_000 +
+        top4_con_finalists * 100 +
+        top8_round_winners * 1 -
+        avg_cup_rank
+    )
+
+    # A box where every pair keeps its order sits inside one cell, where the objective is constant
+    in_one_cell = (always_above | always_below).all(axis=1)
+
+    return upper_bounds, in_one_cell
+
+
+@instrumentation.instrument
+def optimize_exact(max_boxes: int = 1_000_000, min_width: float = 1e-4, batch_size: int = 1024,
+                   evaluation_index: dict = None) -> dict:
+
+    if evaluation_index is None:
+        evaluation_index = get_evaluation_index()
+    pair_index = build_pair_index(evaluation_index)
+
+    # Start from the whole searched range
+    low, high = get_weight_bounds()
+    box_lows, box_highs = low[None, :], high[None, :]
+
+    # A range whose ends are equal pins its weight, so that side is never split
+    ranges = np.where(high > low, high - low, np.inf)
+    upper_bounds = np.array([float('inf')])
+
+    # The best weights found so far (the center of the searched range to start)
+    best_weights = (low + high) / 2
+    best_score = evaluate_weight_batch(best_weights, evaluation_index)['score'][0]
+
+    boxes_explored = 0
+    unresolved_bound = -float('inf')
+    while len(box_lows) and boxes_explored < max_boxes:
+
+        # Drop boxes that can't beat the best weights found so far
+        keep = upper_bounds > best_score
+        box_lows, box_highs, upper_bounds = box_lows[keep], box_highs[keep], upper_bounds[keep]
+        if not len(box_lows):
+            break
+
+        # Split the most promising boxes in half along their widest side (relative to the searched range)
+        chosen = np.argsort(-upper_bounds, kind='stable')[:batch_size]
+        remaining = np.ones(len(box_lows), dtype=bool)
+        remaining[chosen] = False
+        split_lows, split_highs = box_lows[chosen], box_highs[chosen]
+
+        widths = (split_highs - split_lows) / ranges
+        split_sides = widths.argmax(axis=1)
+        split_rows = np.arange(len(chosen))
+
+        # Boxes too small to split are left unresolved
+        too_small = widths[split_rows, split_sides] < min_width
+        if too_small.any():
+            unresolved_bound = max(unresolved_bound, upper_bounds[chosen][too_small].max())
+        split_lows, split_highs = split_lows[~too_small], split_highs[~too_small]
+        split_sides, split_rows = split_sides[~too_small], np.arange((~too_small).sum())
+
+        middles = (split_lows[split_rows, split_sides] + split_highs[split_rows, split_sides]) / 2
+        lower_halves_high = split_highs.copy()
+        lower_halves_high[split_rows, split_sides] = middles
+        upper_halves_low = split_lows.copy()
+        upper_halves_low[split_rows, split_sides] = middles
+        child_lows = np.concatenate([split_lows, upper_halves_low])
+        child_highs = np.concatenate([lower_halves_high, split_highs])
+        boxes_explored += len(child_lows)
+
+        # Evaluate the center of every new box and keep the best weights found
+        centers = (child_lows + child_highs) / 2
+        center_scores = evaluate_weight_batch(centers, evaluation_index, batch_size)['score']
+        if len(center_scores) and center_scores.max() > best_score:
+            best_score = center_scores.max()
+            best_weights = centers[center_scores.argmax()]
+
+        # Bound what every new box could reach; a box inside one cell can't do better than its center
+        child_bounds, in_one_cell = get_box_bounds(child_lows, child_highs, pair_index)
+        child_bounds = np.where(in_one_cell, center_scores, child_bounds)
+
+        box_lows = np.concatenate([box_lows[remaining], child_lows])
+        box_highs = np.concatenate([box_highs[remaining], child_highs])
+        upper_bounds = np.concatenate([upper_bounds[remaining], child_bounds])
+
+    # No weights anywhere in the searched range can score above the upper bound
+    open_bounds = upper_bounds[upper_bounds > best_score]
+    upper_bound = max([best_score, unresolved_bound] + ([open_bounds.max()] if len(open_bounds) else []))
+
+    optimization = {
+        'weights': dict(zip(constants.SCORE_GROUP_COLUMNS, best_weights.tolist())),
+        'score': float(best_score),
+        'upper_bound': float(upper_bound),
+        'is_optimal': bool(upper_bound <= best_score),
+        'boxes_explored': boxes_explored,
+    }
+
+    return optimization
+
+
+
+# ====================================================================================================
+# FUNCTIONS FOR RUNNING A STUDY ACROSS WORKER PROCESSES
+# ====================================================================================================
+
+def get_storage(storage: str):
+    import optuna
+
+    # Database URLs (e.g. sqlite:///studies.db) are passed straight to Optuna, anything else is a journal file
+    if '://' in storage:
+        return storage
+
+    os.makedirs(os.path.dirname(storage) or '.', exist_ok=True)
+    return optuna.storages.JournalStorage(optuna.storages.journal.JournalFileBackend(storage))
+
+
+def count_finished_trials(study: 'optuna.Study') -> int:
+    import optuna
+
+    states = (optuna.trial.TrialState.COMPLETE, optuna.trial.TrialState.PRUNED)
+    return len(study.get_trials(deepcopy=False, states=states))
+
+
+def fail_stale_trials(study_name: str, storage: str) -> int:
+    import optuna
+
+    # No worker is running before the workers of this run start, so trials still running are left over from
+    # an interrupted run and will never finish
+    study_storage = optuna.storages.get_storage(get_storage(storage))
+    study_id = study_storage.get_study_id_from_name(study_name)
+    stale_trials = study_storage.get_all_trials(study_id, deepcopy=False, states=(optuna.trial.TrialState.RUNNING,))
+    for trial in stale_trials:
+        trial_id = study_storage.get_trial_id_from_study_id_trial_number(study_id, trial.number)
+        study_storage.set_trial_state_values(trial_id, optuna.trial.TrialState.FAIL)
+
+    if stale_trials:
+        print(f"Marked {len(stale_trials)} trial(s) left running by an interrupted run as failed")
+
+    return len(stale_trials)
+
+
+def run_study_worker(study_name: str, storage: str, n_trials: int, seed: int) -> None:
+    import optuna
+
+    # Every worker gets its own sampler seed so they don't suggest the same weights
+    study = optuna.load_study(study_name=study_name, storage=get_storage(storage),
+                              sampler=optuna.samplers.TPESampler(seed=seed))
+
+    # Stop once the study as a whole (including trials from earlier runs) reaches the trial budget
+    if count_finished_trials(study) >= n_trials:
+        return
+
+    states = (optuna.trial.TrialState.COMPLETE, optuna.trial.TrialState.PRUNED)
+    study.optimize(objective, n_trials=n_trials,
+                   callbacks=[optuna.study.MaxTrialsCallback(n_trials, states=states)])
+
+
+def run_study(n_trials: int = 500, n_workers: int = 1, seed: int = None, storage: str = None,
+              study_name: str = 'contender_weights') -> 'optuna.Study':
+    import optuna
+
+    # A single worker without storage runs in memory like it always has
+    if n_workers == 1 and storage is None:
+        study = optuna.create_study(direction='maximize', sampler=optuna.samplers.TPESampler(seed=seed))
+        study.optimize(objective, n_trials=n_trials)
+        return study
+
+    # Create the shared study, or pick it back up if an earlier run was interrupted
+    storage = storage or DEFAULT_STORAGE
+    optuna.create_study(study_name=study_name, storage=get_storage(storage), direction='maximize', load_if_exists=True)
+    fail_stale_trials(study_name, storage)
+
+    # Build the evaluation index before starting the workers and hand it to them so they don't each rebuild it
+    with ProcessPoolExecutor(max_workers=n_workers, initializer=share_evaluation_index,
+                             initargs=(get_evaluation_index(),)) as executor:
+        futures = [
+            executor.submit(run_study_worker, study_name, storage, n_trials, None if seed is None else seed + worker)
+            for worker in range(n_workers)
+        ]
+        for future in futures:
+            future.result()
+
+    return optuna.load_study(study_name=study_name, storage=get_storage(storage))
+
+
+
+# ====================================================================================================
+# FUNCTIONS FOR CROSS-VALIDATING THE WEIGHTS ONE HELD OUT SEASON AT A TIME
+# ====================================================================================================
+
+def get_fold_index(evaluation_index: dict, seasons: list) -> dict:
+
+    # Narrow the season layout to the given seasons; the z matrix and team seasons are shared, not copied
+    season_positions = np.array([constants.SEASONS.index(season) for season in seasons], dtype=int)
+    season_results = evaluation_index['season_results'][season_positions]
+    has_cup_winner = (season_results == 4).any(axis=1)
+
+    fold_index = {
+        **evaluation_index,
+        'season_slices': [evaluation_index['season_slices'][position] for position in season_positions],
+        'season_rows': evaluation_index['season_rows'][season_positions],
+        'is_team': evaluation_index['is_team'][season_positions],
+        'season_results': season_results,
+        'cup_winner_seasons': np.flatnonzero(has_cup_winner),
+        'cup_winner_positions': (season_results == 4).argmax(axis=1)[has_cup_winner],
+    }
+
+    return fold_index
+
+
+def run_fold(season: str, method: str = 'optuna', n_trials: int = 500, max_boxes: int = 1_000_000,
+             seed: int = None) -> dict:
+
+    # Workers reuse the evaluation index built before they started
+    evaluation_index = get_evaluation_index()
+    training_index = get_fold_index(evaluation_index, [other for other in constants.SEASONS if other != season])
+
+    # Fit the weights on every other season
+    if method == 'exact':
+        optimization = optimize_exact(max_boxes, evaluation_index=training_index)
+        weights, training_score = optimization['weights'], optimization['score']
+    else:
+        import optuna
+
+        # Every fold runs a full study, so only warnings are logged
+        optuna.logging.set_verbosity(optuna.logging.WARNING)
+        study = optuna.create_study(direction='maximize', sampler=optuna.samplers.TPESampler(seed=seed))
+        study.optimize(functools.partial(objective, evaluation_index=training_index), n_trials=n_trials)
+        weights, training_score = study.best_params, study.best_value
+
+    # Grade the weights on the held out season only
+    held_out_index = get_fold_index(evaluation_index, [season])
+
+    fold = {
+        'season': season,
+        'weights': weights,
+        'training_score': training_score,
+        'metrics': evaluate_weights(weights, held_out_index),
+        'num_cup_winners': len(held_out_index['cup_winner_seasons']),
+    }
+
+    return fold
+
+
+def cross_validate(method: str = 'optuna', n_trials: int = 500, n_workers: int = 1, seed: int = None,
+                   max_boxes: int = 1_000_000) -> list:
+
+    # Every fold gets its own sampler seed, so the folds are the same however many workers run them
+    fold_args = [(season, method, n_trials, max_boxes, None if seed is None else seed + fold)
+                 for fold, season in enumerate(constants.SEASONS)]
+
+    if n_workers == 1:
+        return [run_fold(*args) for args in fold_args]
+
+    # Build the evaluation index before starting the workers and hand it to them so they don't each rebuild it
+    with ProcessPoolExecutor(max_workers=n_workers, initializer=share_evaluation_index,
+                             initargs=(get_evaluation_index(),)) as executor:
+        return list(executor.map(run_fold, *zip(*fold_args)))
+
+
+def print_cross_validation(folds: list) -> None:
+
+    print("\nLeave One Season Out Folds:")
+    print(f"{'Held Out':<12} {'Training Score':>16} {'Held Out Score':>16} {'Cup Winner Rank':>16}")
+    print("-" * 63)
+    for fold in folds:
+        metrics = fold['metrics']
+        cup_winner_rank = metrics['cup_winner_rank_sum'] if fold['num_cup_winners'] else 'N/A'
+        print(f"{fold['season']:<12} {fold['training_score']:>16.2f} {metrics['score']:>16.2f} {cup_winner_rank:>16}")
+
+    # Add up the held out seasons' results to grade the weights on seasons they were not fit to
+    metrics = {name: sum(fold['metrics'][name] for fold in folds) for name in METRIC_NAMES}
+    num_cup_winners = sum(fold['num_cup_winners'] for fold in folds)
+
+    print()
+    print_metrics("Out of Sample Evaluation of Fitted Weights", metrics, num_cup_winners)
+
+
+def parse_args() -> argparse.Namespace:
+
+    parser = argparse.ArgumentParser(description='Optimize the factor weights used for contender scores.')
+    parser.add_argument('--trials', type=int, default=500, help='total number of trials in the study')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='number of worker processes sharing the study (or running the folds with --cv)')
+    parser.add_argument('--seed', type=int, default=None, help='sampler seed (worker i uses seed + i)')
+    parser.add_argument('--storage', default=None,
+                        help=f'journal file or database URL holding the study, needed to resume it '
+                             f'(defaults to {DEFAULT_STORAGE} when using more than 1 worker)')
+    parser.add_argument('--study-name', default='contender_weights', help='name of the study in the storage')
+    parser.add_argument('--exact', action='store_true', help='search the weights with branch and bound instead of Optuna')
+    parser.add_argument('--max-boxes', type=int, default=1_000_000, help='most weight boxes the exact search explores')
+    parser.add_argument('--random', type=int, default=None, metavar='CANDIDATES',
+                        help='score this many random weight vectors in batches instead of running Optuna')
+    parser.add_argument('--profile', nargs='?', const=instrumentation.DEFAULT_PROFILE_PATH, default=None,
+                        help=f'record where the time goes and write the profile to this path '
+                             f'(default: {instrumentation.DEFAULT_PROFILE_PATH})')
+    parser.add_argument('--cv', action='store_true',
+                        help='fit the weights once per held out season and grade them on that season only')
+
+    return parser.parse_args()
+
+
+def print_trial_latencies(study: 'optuna.Study') -> None:
+
+    # Wall time of every finished trial, including the time the sampler took to suggest its weights
+    durations_ms = [trial.duration.total_seconds() * 1000 for trial in study.trials if trial.duration is not None]
+    latencies = instrumentation.get_latency_percentiles(durations_ms)
+    if latencies:
+        print(f"Trial latency: p50 {latencies['p50_ms']:.2f}ms, p90 {latencies['p90_ms']:.2f}ms, "
+              f"p99 {latencies['p99_ms']:.2f}ms, max {latencies['max_ms']:.2f}ms\n")
+
+
+def main() -> None:
+    args = parse_args()
+    if args.profile is not None:
+        instrumentation.enable(args.profile)
+    instrumentation.enable_from_env()
+
+    if args.cv:
+        # Grade the optimizer on seasons it did not see instead of the seasons it was fit to
+        folds = cross_validate('exact' if args.exact else 'optuna', args.trials, args.workers, args.seed, args.max_boxes)
+        print_cross_validation(folds)
+        return
+
+    if args.exact:
+        # Search the weight ranges exactly
+        optimization = optimize_exact(args.max_boxes)
+        best_params, best_value = optimization['weights'], optimization['score']
+    elif args.random is not None:
+        # Score random weights from the searched ranges, a batch at a time
+        best_params, best_value = random_search(args.random, seed=args.seed)
+    else:
+        # Run Optuna optimization to find best weights
+        study = run_study(args.trials, args.workers, args.seed, args.storage, args.study_name)
+        best_params, best_value = study.best_params, study.best_value
+
+    print("\nBest Weights Found:")
+    for key, value in best_params.items():
+        print(f"'{key}': {value:.2f},")
+    print(f"\nBest Score: {best_value:.2f}\n")
+
+    if args.exact:
+        # An unproven result is only the best found, so show how far above it the optimum could still be
+        gap = optimization['upper_bound'] - optimization['score']
+        status = 'proven optimal' if optimization['is_optimal'] else f"not proven optimal, up to {gap:.2f} can be gained"
+        print(f"Explored {optimization['boxes_explored']} weight boxes ({status})\n")
+    elif args.random is not None:
+        print(f"Scored {args.random} random weight vectors\n")
+    else:
+        print_trial_latencies(study)
+
+    # Evaluate best weights on full dataset
+    print_evaluation(best_params)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,270 @@
+# Imports
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+import constants
+import instrumentation
+from score_statistics import (PLAYOFF_RESULTS, SUCCESS_CONDITIONS, WEIGHT_SET_COLUMN, add_ranks, load_season_scores)
+
+# Statistics of the rank and success tables, in the order the reports print them
+STATISTICS = [
+    'Cup winner average rank',
+    *[f'Average rank, won {result} round(s)' for result in PLAYOFF_RESULTS],
+    *[f'Top {rank_cutoff} teams that won ≥{min_rounds} round(s) (%)' for rank_cutoff, min_rounds in SUCCESS_CONDITIONS],
+]
+
+# Resamples drawn by each task, so the results don't depend on the number of worker processes
+CHUNK_RESAMPLES = 10_000
+
+
+# ====================================================================================================
+# FUNCTIONS FOR LAYING OUT THE RANKS OF EVERY SEASON
+# ====================================================================================================
+
+def get_season_arrays(ranked_df: pd.DataFrame) -> dict:
+
+    # Lay a single weight set's playoff teams out season by season (seasons x most teams in a season), padded with 0 ranks and
+    # -1 results
+    season_codes, seasons = pd.factorize(ranked_df['Season'])
+    positions = ranked_df.groupby(season_codes).cumcount().to_numpy()
+    shape = (len(seasons), positions.max() + 1)
+
+    season_arrays = {'seasons': list(seasons), 'is_team': np.zeros(shape, dtype=bool)}
+    season_arrays['is_team'][season_codes, positions] = True
+    for column in ['Score Rank', 'Standings Rank', 'Standings Rank Actual', 'Result']:
+        season_arrays[column] = np.full(shape, -1 if column == 'Result' else 0)
+        season_arrays[column][season_codes, positions] = ranked_df[column].to_numpy()
+
+    return season_arrays
+
+
+def get_season_totals(average_ranks: np.ndarray, success_ranks: np.ndarray, season_arrays: dict) -> tuple:
+
+    results, is_team = season_arrays['Result'], season_arrays['is_team']
+    numerators, denominators = [], []
+
+    # Every statistic is a ratio of sums over the seasons, so each season's share of the sums is kept
+    # (seasons x statistics)
+    cup_winners = is_team & (results == 4)
+    numerators.append((average_ranks * cup_winners).sum(axis=1))
+    denominators.append(cup_winners.sum(axis=1))
+
+    for result in PLAYOFF_RESULTS:
+        teams = is_team & (results == result)
+        numerators.append((average_ranks * teams).sum(axis=1))
+        denominators.append(teams.sum(axis=1))
+
+    for rank_cutoff, min_rounds in SUCCESS_CONDITIONS:
+        top_teams = is_team & (success_ranks <= rank_cutoff)
+        numerators.append(100 * (top_teams & (results >= min_rounds)).sum(axis=1))
+        denominators.append(top_teams.sum(axis=1))
+
+    return np.stack(numerators, axis=1).astype(float), np.stack(denominators, axis=1).astype(float)
+
+
+def get_ranking_totals(season_arrays: dict) -> tuple:
+
+    score_ranks = season_arrays['Score Rank']
+    standings_ranks = season_arrays['Standings Rank']
+    playoff_standings_ranks = season_arrays['Standings Rank Actual']
+
+    # Totals of the contender score ranks, of the standings ranks as the reports use them (league ranks for the
+    # averages, ranks among playoff teams for the success rates), and of the standings ranks among playoff teams
+    # only, which are compared with the contender score ranks on the same scale (rankings x seasons x statistics)
+    totals = [
+        get_season_totals(score_ranks, score_ranks, season_arrays),
+        get_season_totals(standings_ranks, playoff_standings_ranks, season_arrays),
+        get_season_totals(playoff_standings_ranks, playoff_standings_ranks, season_arrays),
+    ]
+    numerators = np.stack([numerator for numerator, _ in totals])
+    denominators = np.stack([denominator for _, denominator in totals])
+
+    return numerators, denominators
+
+
+def divide_totals(numerators: np.ndarray, denominators: np.ndarray) -> np.ndarray:
+
+    # Statistics without any teams to average over are undefined
+    return np.divide(numerators, denominators, out=np.full(np.broadcast(numerators, denominators).shape, np.nan),
+                     where=denominators > 0)
+
+
+
+# ====================================================================================================
+# FUNCTIONS FOR RESAMPLING SEASONS AND RANKINGS
+# ====================================================================================================
+
+def bootstrap_chunk(numerators: np.ndarray, denominators: np.ndarray, num_resamples: int,
+                    seed: np.random.SeedSequence) -> np.ndarray:
+
+    rng = np.random.default_rng(seed)
+    num_seasons = numerators.shape[1]
+
+    # Draw seasons with replacement, as the number of times each season is drawn (resamples x seasons)
+    draws = rng.multinomial(num_seasons, np.full(num_seasons, 1 / num_seasons), size=num_resamples).astype(float)
+
+    # Every resample's statistics for every ranking at once (rankings x resamples x statistics)
+    return divide_totals(draws @ numerators, draws @ denominators)
+
+
+def permutation_chunk(differences: np.ndarray, total_denominators: np.ndarray, observed: np.ndarray,
+                      num_resamples: int, seed: np.random.SeedSequence) -> np.ndarray:
+
+    rng = np.random.default_rng(seed)
+
+    # Swap the contender score and standings rankings of each season at random, which flips the sign of the
+    # season's share of the difference (resamples x seasons)
+    signs = rng.integers(0, 2, size=(num_resamples, differences.shape[0])) * 2.0 - 1.0
+    permuted = divide_totals(signs @ differences, total_denominators)
+
+    # Count the resamples with a difference at least as large as the observed one, with a tolerance for the
+    # rounding of equal sums added up in a different order
+    return (np.abs(permuted) >= np.abs(observed) - 1e-9).sum(axis=0)
+
+
+def run_chunks(function, chunk_args: list, workers: int = None) -> list:
+
+    # A single worker draws every chunk itself without starting any processes
+    if workers == 1 or len(chunk_args) < 2:
+        return [function(*args) for args in chunk_args]
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(function, *zip(*chunk_args)))
+
+
+def get_chunk_sizes(num_resamples: int) -> list:
+    return [min(CHUNK_RESAMPLES, num_resamples - start) for start in range(0, num_resamples, CHUNK_RESAMPLES)]
+
+
+
+# ====================================================================================================
+# FUNCTION FOR TESTING THE DIFFERENCE BETWEEN CONTENDER SCORE AND STANDINGS RANKINGS
+# ====================================================================================================
+
+def get_significance_table(scores_df: pd.DataFrame, num_resamples: int = 100_000, confidence: float = 0.95,
+                           seed: int = None, workers: int = None) -> pd.DataFrame:
+
+    ranked_df = add_ranks(scores_df)
+    weight_sets = ranked_df[WEIGHT_SET_COLUMN].unique()
+
+    # Every weight set is tested on its own, resampled with the same seed so the weight sets are compared on the
+    # same resamples of seasons
+    significance_tables = [
+        get_weight_set_significance(ranked_df[ranked_df[WEIGHT_SET_COLUMN] == weight_set], num_resamples,
+                                    confidence, seed, workers)
+        for weight_set in weight_sets
+    ]
+
+    return pd.concat(significance_tables, keys=weight_sets, names=[WEIGHT_SET_COLUMN])
+
+
+def get_weight_set_significance(ranked_df: pd.DataFrame, num_resamples: int, confidence: float, seed: int,
+                                workers: int) -> pd.DataFrame:
+
+    numerators, denominators = get_ranking_totals(get_season_arrays(ranked_df))
+    total_numerators, total_denominators = numerators.sum(axis=1), denominators.sum(axis=1)
+
+    # Point estimates over every season, the same numbers the reports print
+    estimates = divide_totals(total_numerators, total_denominators)
+    observed = estimates[0] - estimates[2]
+
+    # Seeds of every chunk come from the one seed, so the results only depend on the seed and resample count
+    chunk_sizes = get_chunk_sizes(num_resamples)
+    bootstrap_seeds, permutation_seeds = np.random.SeedSequence(seed).spawn(2)
+    bootstrap_seeds = bootstrap_seeds.spawn(len(chunk_sizes))
+    permutation_seeds = permutation_seeds.spawn(len(chunk_sizes))
+
+    # Bootstrap the seasons to get confidence intervals of every ranking's statistics and of their difference
+    bootstrap_stats = np.concatenate(run_chunks(bootstrap_chunk, [
+        (numerators, denominators, chunk_size, chunk_seed)
+        for chunk_size, chunk_seed in zip(chunk_sizes, bootstrap_seeds)], workers), axis=1)
+    bootstrap_stats = np.concatenate([bootstrap_stats, bootstrap_stats[:1] - bootstrap_stats[2:]])
+    tail = 100 * (1 - confidence) / 2
+    with np.errstate(invalid='ignore'):
+        lows, highs = np.nanpercentile(bootstrap_stats, [tail, 100 - tail], axis=1)
+
+    # Permute the rankings within each season to test whether the difference could come from chance alone
+    # (every season's ranks of the same teams have the same denominators, so only the numerators differ)
+    differences = numerators[0] - numerators[2]
+    extreme_counts = sum(run_chunks(permutation_chunk, [
+        (differences, total_denominators[0], observed, chunk_size, chunk_seed)
+        for chunk_size, chunk_seed in zip(chunk_sizes, permutation_seeds)], workers))
+    p_values = (extreme_counts + 1) / (num_resamples + 1)
+
+    significance_table = pd.DataFrame({
+        'Contender Score': estimates[0],
+        'Contender Score Low': lows[0],
+        'Contender Score High': highs[0],
+        'Standings': estimates[1],
+        'Standings Low': lows[1],
+        'Standings High': highs[1],
+        'Playoff Standings': estimates[2],
+        'Playoff Standings Low': lows[2],
+        'Playoff Standings High': highs[2],
+        'Difference': observed,
+        'Difference Low': lows[3],
+        'Difference High': highs[3],
+        'P-Value': np.where(np.isnan(observed), np.nan, p_values),
+    }, index=pd.Index(STATISTICS, name='Statistic'))
+
+    return significance_table
+
+
+def print_significance_table(significance_table: pd.DataFrame, num_resamples: int, confidence: float) -> None:
+
+    print(f"\n=== SIGNIFICANCE OF CONTENDER SCORE VS STANDINGS ({num_resamples} resamples) ===")
+    print(f"Intervals are {100 * confidence:.0f}% bootstrap intervals over seasons; Standings uses the standings ranks "
+          f"the reports use, Playoff Standings ranks only the playoff teams")
+    print("Difference is Contender Score minus Playoff Standings, the same scale its p-value tests")
+
+    weight_sets = significance_table.index.unique(WEIGHT_SET_COLUMN)
+    for weight_set in weight_sets:
+        if len(weight_sets) > 1:
+            print(f"\n--- Weight Set {weight_set} ---")
+        print_weight_set_significance(significance_table.loc[weight_set])
+
+
+def print_weight_set_significance(significance_table: pd.DataFrame) -> None:
+
+    print(f"{'Statistic':<44} {'Contender Score':>24} {'Standings':>24} {'Playoff Standings':>24} {'Difference':>24} "
+          f"{'P-Value':>9}")
+    print("-" * 154)
+
+    for statistic, row in significance_table.iterrows():
+        estimates = [
+            f"{row[column]:.2f} [{row[f'{column} Low']:.2f}, {row[f'{column} High']:.2f}]"
+            if pd.notna(row[column]) else 'N/A'
+            for column in ['Contender Score', 'Standings', 'Playoff Standings', 'Difference']
+        ]
+        p_value = f"{row['P-Value']:.4f}" if pd.notna(row['P-Value']) else 'N/A'
+        print(f"{statistic:<44} {estimates[0]:>24} {estimates[1]:>24} {estimates[2]:>24} {estimates[3]:>24} "
+              f"{p_value:>9}")
+
+
+def parse_args() -> argparse.Namespace:
+
+    parser = argparse.ArgumentParser(description='Test whether contender score ranks teams better than standings.')
+    parser.add_argument('--resamples', type=int, default=100_000, help='number of bootstrap and permutation resamples')
+    parser.add_argument('--confidence', type=float, default=0.95, help='confidence level of the intervals')
+    parser.add_argument('--seed', type=int, default=None, help='seed of the resampling')
+    parser.add_argument('--workers', type=int, default=None,
+                        help='number of worker processes drawing resamples (default: one per processor)')
+    parser.add_argument('--config', default=None,
+                        help='read the scores of this score store configuration instead of the per season CSV files')
+
+    return parser.parse_args()
+
+
+def main() -> None:
+    args = parse_args()
+    instrumentation.enable_from_env()
+
+    scores_df = load_season_scores(constants.SEASONS, args.config)
+    significance_table = get_significance_table(scores_df, args.resamples, args.confidence, args.seed, args.workers)
+
+    print_significance_table(significance_table, args.resamples, args.confidence)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,132 +1,257 @@
 
 # Imports
+import argparse
+import numpy as np
 import pandas as pd
 import constants
-from collections import defaultdict
+import data_cache
+import instrumentation
+import score_store
+from score_calculation import (calculate_season_scores, get_scoring_rows, get_weight_vector, get_weighted_scores,
+                               get_z_matrix, round_scores)
 
+# Column that tells apart the scores of different weight sets
+WEIGHT_SET_COLUMN = 'Weight Set'
+
+# Each tuple represents (maximum rank, minimum playoff rounds won)
+SUCCESS_CONDITIONS = [
+    (8, 1),   # Top 8 teams, won ≥1 round
+    (4, 2),   # Top 4 teams, won ≥2 rounds
+    (2, 3),   # Top 2 teams, won ≥3 rounds
+    (1, 4)    # Top 1 team, won the Cup
+]
+
+# Playoff results, from losing in the first round (0) to winning the Cup (4)
+PLAYOFF_RESULTS = range(5)
 
-# Track Cup winners' ranks by contender score and standings
-cup_winner_score_ranks = []
-cup_winner_standings_ranks = []
 
-# Track average ranks by playoff round (0 to 4)
-score_ranks_by_round = defaultdict(list)
-standings_ranks_by_round = defaultdict(list)
+# ====================================================================================================
+# FUNCTIONS FOR LOADING AND RANKING THE SCORES OF EVERY SEASON
+# ====================================================================================================
 
+def load_season_scores(seasons: list = None, config: str = None) -> pd.DataFrame:
 
-# Loop
-for season in constants.SEASONS:
-    file_path = f'scores/{season}_scores.csv'
-    df = pd.read_csv(file_path)
+    if seasons is None:
+        seasons = constants.SEASONS
 
-    # Sort teams by contender score and standings rank
-    score_sorted = df.sort_values(by='Contender Score', ascending=False).reset_index(drop=True)
-    standings_sorted = df.sort_values(by='Standings Rank').reset_index(drop=True)
+    # Read the seasons of a configuration straight from the score store when one is given
+    if config is not None:
+        return score_store.read_scores([config], seasons).drop(columns='Config')
 
-    # Add contender score rank to the DataFrame
-    df['Score Rank'] = df['Team'].apply(lambda t: score_sorted[score_sorted['Team'] == t].index[0] + 1)
+    # Read every season's scores a single time into one frame
+    return pd.concat([data_cache.read_csv(f'scores/{season}_scores.csv') for season in seasons], ignore_index=True)
 
-    # Cup winners
-    cup_winners = df[df['Result'] == 4]
-    for _, row in cup_winners.iterrows():
-        cup_winner_score_ranks.append(row['Score Rank'])
-        cup_winner_standings_ranks.append(row['Standings Rank'])
 
-    # Average ranks by round
-    for result in range(5):
-        subset = df[df['Result'] == result]
-        score_ranks_by_round[result].extend(subset['Score Rank'].tolist())
-        standings_ranks_by_round[result].extend(subset['Standings Rank'].tolist())
+def get_weight_set_scores(scoring_data: pd.DataFrame, weight_sets: list,
+                          seasons: list = None) -> pd.DataFrame:
 
+    if seasons is None:
+        seasons = constants.SEASONS
 
-# Cup winners averages
-avg_cup_score_rank = sum(cup_winner_score_ranks) / len(cup_winner_score_ranks)
-avg_cup_standings_rank = sum(cup_winner_standings_ranks) / len(cup_winner_standings_ranks)
+    # Get the playoff teams of every season, put back in the order they are listed in the scoring data so
+    # ties in every weight set's ranking are broken the same way the scores files break them
+    playoff_teams = pd.concat(calculate_season_scores(scoring_data, seasons).values(), ignore_index=True)
+    scoring_rows = get_scoring_rows(scoring_data)
+    rows = np.array([scoring_rows[key] for key in zip(playoff_teams['Season'], playoff_teams['Team'])])
+    order = np.argsort(rows, kind='stable')
+    playoff_teams, rows = playoff_teams.iloc[order].reset_index(drop=True), rows[order]
 
+    # Score the playoff teams with every weight set at once (playoff teams x weight sets)
+    weight_batch = np.array([get_weight_vector(weights) for weights in weight_sets])
+    scores = round_scores(get_weighted_scores(get_z_matrix(scoring_data)[rows], weight_batch))
 
-# === Print Cup Winners Stats ===
-print("\n=== CUP WINNER STATS ===")
-print(f"Average contender score rank of Cup winners: {avg_cup_score_rank:.2f}")
-print(f"Average standings rank of Cup winners: {avg_cup_standings_rank:.2f}")
+    # Stack the weight sets' scores into one long frame
+    weight_set_scores = pd.concat([playoff_teams] * len(weight_sets), ignore_index=True)
+    weight_set_scores.insert(0, WEIGHT_SET_COLUMN, np.repeat(np.arange(len(weight_sets)), len(playoff_teams)))
+    weight_set_scores['Contender Score'] = scores.T.ravel()
 
+    return weight_set_scores
 
-# === Print Average Ranks by Playoff Result ===
-print("\n=== AVERAGE RANKS BY PLAYOFF RESULT ===")
-print(f"{'Rounds':<10} {'Avg Score Rank':>18} {'Avg Standings Rank':>22}")
-print("-" * 52)
 
-for result in range(5):
-    score_ranks = score_ranks_by_round[result]
-    standings_ranks = standings_ranks_by_round[result]
+def add_ranks(scores_df: pd.DataFrame) -> pd.DataFrame:
 
-    if score_ranks and standings_ranks:
-        avg_score = sum(score_ranks) / len(score_ranks)
-        avg_standings = sum(standings_ranks) / len(standings_ranks)
-        print(f"{result:<10} {avg_score:>18.2f} {avg_standings:>22.2f}")
+    # Scores without a weight set column all belong to a single weight set
+    if WEIGHT_SET_COLUMN not in scores_df:
+        scores_df = scores_df.assign(**{WEIGHT_SET_COLUMN: 0})
     else:
-        print(f"{result:<10} {'N/A':>18} {'N/A':>22}")
+        scores_df = scores_df.copy()
 
+    # Rank the teams of each season by contender score and by standings, breaking ties by the order the teams
+    # are listed in (the same order a stable sort keeps them in)
+    seasons = scores_df.groupby([WEIGHT_SET_COLUMN, 'Season'], sort=False)
+    scores_df['Score Rank'] = seasons['Contender Score'].rank(method='first', ascending=False,
+                                                              na_option='bottom').astype(int)
+    scores_df['Standings Rank Actual'] = seasons['Standings Rank'].rank(method='first', na_option='bottom').astype(int)
 
-# === Rank Cutoff and Playoff Success Conditions ===
+    return scores_df
 
-# Each tuple represents (maximum rank, minimum playoff rounds won)
-score_conditions = [
-    (8, 1),   # Top 8 teams, won ≥1 round
-    (4, 2),   # Top 4 teams, won ≥2 rounds
-    (2, 3),   # Top 2 teams, won ≥3 rounds
-    (1, 4)    # Top 1 team, won the Cup
-]
 
-standings_conditions = [
-    (8, 1),
-    (4, 2),
-    (2, 3),
-    (1, 4)
-]
 
-# Initialize counters for each condition
-score_results = {cond: {'count': 0, 'qualified': 0} for cond in score_conditions}
-standings_results = {cond: {'count': 0, 'qualified': 0} for cond in standings_conditions}
+# ====================================================================================================
+# FUNCTIONS FOR BUILDING THE RANK AND SUCCESS TABLES OF EVERY WEIGHT SET
+# ====================================================================================================
+
+def get_cup_winner_stats(ranked_df: pd.DataFrame) -> pd.DataFrame:
+
+    # Average ranks of the Cup winners by contender score and standings
+    cup_winners = ranked_df[ranked_df['Result'] == 4]
+
+    return cup_winners.groupby(WEIGHT_SET_COLUMN)[['Score Rank', 'Standings Rank']].mean()
+
+
+def get_round_stats(ranked_df: pd.DataFrame) -> pd.DataFrame:
+
+    # Average ranks by playoff result, with every result listed even if no team finished with it
+    round_stats = ranked_df.groupby([WEIGHT_SET_COLUMN, 'Result'])[['Score Rank', 'Standings Rank']].mean()
+    round_stats = round_stats.reindex(pd.MultiIndex.from_product(
+        [ranked_df[WEIGHT_SET_COLUMN].unique(), PLAYOFF_RESULTS], names=[WEIGHT_SET_COLUMN, 'Result']))
+
+    return round_stats
+
+
+def get_success_rates(ranked_df: pd.DataFrame, rank_column: str,
+                      conditions: list = SUCCESS_CONDITIONS) -> pd.DataFrame:
+
+    weight_sets, weight_set_codes = np.unique(ranked_df[WEIGHT_SET_COLUMN].to_numpy(), return_inverse=True)
+    ranks = ranked_df[rank_column].to_numpy()
+    results = ranked_df['Result'].to_numpy()
+    max_rank = max(ranks.max(), max(rank for rank, _ in conditions))
+
+    # Count the teams with every rank and playoff result (weight sets x ranks x results)
+    counts = np.bincount(np.ravel_multi_index((weight_set_codes, ranks - 1, results),
+                                              (len(weight_sets), max_rank, len(PLAYOFF_RESULTS))),
+                         minlength=len(weight_sets) * max_rank * len(PLAYOFF_RESULTS))
+    counts = counts.reshape(len(weight_sets), max_rank, len(PLAYOFF_RESULTS))
+
+    # Running totals give the number of teams ranked at or above every cutoff that won at least every number of rounds
+    counts = counts.cumsum(axis=1)[:, :, ::-1].cumsum(axis=2)[:, :, ::-1]
+
+    success_rates = []
+    for rank_cutoff, min_rounds in conditions:
+        total = counts[:, rank_cutoff - 1, 0]
+        qualified = counts[:, rank_cutoff - 1, min_rounds]
+        success_rates.append(pd.DataFrame({
+            WEIGHT_SET_COLUMN: weight_sets,
+            'Rank Cutoff': rank_cutoff,
+            'Min Rounds': min_rounds,
+            'Qualified': qualified,
+            'Count': total,
+            'Success Rate': np.divide(100 * qualified, total, out=np.zeros(len(total)), where=total > 0),
+        }))
+
+    success_rates = pd.concat(success_rates, ignore_index=True)
+    success_rates = success_rates.sort_values(by=WEIGHT_SET_COLUMN, kind='stable')
+
+    return success_rates.set_index([WEIGHT_SET_COLUMN, 'Rank Cutoff', 'Min Rounds'])
+
+
+@instrumentation.instrument
+def get_rank_tables(scores_df: pd.DataFrame) -> dict:
+
+    # Rank every season once and build every table from the ranked frame
+    ranked_df = add_ranks(scores_df)
+
+    rank_tables = {
+        'cup_winners': get_cup_winner_stats(ranked_df),
+        'rounds': get_round_stats(ranked_df),
+        'score_success': get_success_rates(ranked_df, 'Score Rank'),
+        'standings_success': get_success_rates(ranked_df, 'Standings Rank Actual'),
+    }
+
+    return rank_tables
+
+
+
+# ====================================================================================================
+# FUNCTION FOR COMPARING THE RANKS OF TEAMS BY CONTENDER SCORE AND STANDINGS
+# ====================================================================================================
+
+def print_rank_stats(seasons: list = None, rank_tables: dict = None) -> None:
+
+    if seasons is None:
+        seasons = constants.SEASONS
+
+    if rank_tables is None:
+        rank_tables = get_rank_tables(load_season_scores(seasons))
+
+    # Cup winners averages
+    cup_winner_stats = rank_tables['cup_winners'].iloc[0]
+    avg_cup_score_rank = cup_winner_stats['Score Rank']
+    avg_cup_standings_rank = cup_winner_stats['Standings Rank']
+
+
+    # === Print Cup Winners Stats ===
+    print("\n=== CUP WINNER STATS ===")
+    print(f"Average contender score rank of Cup winners: {avg_cup_score_rank:.2f}")
+    print(f"Average standings rank of Cup winners: {avg_cup_standings_rank:.2f}")
+
+
+    # === Print Average Ranks by Playoff Result ===
+    print("\n=== AVERAGE RANKS BY PLAYOFF RESULT ===")
+    print(f"{'Rounds':<10} {'Avg Score Rank':>18} {'Avg Standings Rank':>22}")
+    print("-" * 52)
+
+    round_stats = rank_tables['rounds']
+    round_stats = round_stats.loc[round_stats.index.get_level_values(0)[0]]
+
+    for result in PLAYOFF_RESULTS:
+        avg_score = round_stats.loc[result, 'Score Rank']
+        avg_standings = round_stats.loc[result, 'Standings Rank']
+
+        if pd.notna(avg_score) and pd.notna(avg_standings):
+            print(f"{result:<10} {avg_score:>18.2f} {avg_standings:>22.2f}")
+        else:
+            print(f"{result:<10} {'N/A':>18} {'N/A':>22}")
+
+
+
+# ====================================================================================================
+# FUNCTION FOR COMPARING THE PLAYOFF SUCCESS OF TOP RANKED TEAMS
+# ====================================================================================================
+
+def print_success_rates(seasons: list = None, rank_tables: dict = None) -> None:
+
+    if seasons is None:
+        seasons = constants.SEASONS
+
+    if rank_tables is None:
+        rank_tables = get_rank_tables(load_season_scores(seasons))
+
+    # === Print Contender Score Success Rates ===
+    print("\n=== CONTENDER SCORE RANKINGS ===")
+    success_rates = rank_tables['score_success']
+    for (_, rank, rounds), qualified, total, pct in zip(success_rates.index, success_rates['Qualified'],
+                                                        success_rates['Count'], success_rates['Success Rate']):
+        print(f"Top {rank:<2} teams — % that won ≥{rounds} round(s): {pct:.2f}% ({qualified}/{total})")
+
+
+    # === Print Standings Rank Success Rates ===
+    print("\n=== STANDINGS RANKINGS ===")
+    success_rates = rank_tables['standings_success']
+    for (_, rank, rounds), qualified, total, pct in zip(success_rates.index, success_rates['Qualified'],
+                                                        success_rates['Count'], success_rates['Success Rate']):
+        print(f"Top {rank:<2} teams — % that won ≥{rounds} round(s): {pct:.2f}% ({qualified}/{total})")
 
 
-# === Loop Through Seasons for Rank-Based Playoff Success Analysis ===
-for season in constants.SEASONS:
-    df = pd.read_csv(f'scores/{season}_scores.csv')
+def parse_args() -> argparse.Namespace:
 
-    # Add Score Rank
-    df_score_sorted = df.sort_values(by='Contender Score', ascending=False).reset_index(drop=True)
-    df['Score Rank'] = df['Team'].apply(lambda t: df_score_sorted[df_score_sorted['Team'] == t].index[0] + 1)
+    parser = argparse.ArgumentParser(description='Compare contender score and standings ranks.')
+    parser.add_argument('--config', default=None,
+                        help='read the scores of this score store configuration instead of the per season CSV files')
 
-    # Add Standings Rank (recomputed for consistency)
-    df_standings_sorted = df.sort_values(by='Standings Rank').reset_index(drop=True)
-    df['Standings Rank Actual'] = df['Team'].apply(lambda t: df_standings_sorted[df_standings_sorted['Team'] == t].index[0] + 1)
+    return parser.parse_args()
 
-    # Evaluate contender score conditions
-    for rank_cutoff, min_rounds in score_conditions:
-        top_score_teams = df[df['Score Rank'] <= rank_cutoff]
-        score_results[(rank_cutoff, min_rounds)]['count'] += len(top_score_teams)
-        score_results[(rank_cutoff, min_rounds)]['qualified'] += (top_score_teams['Result'] >= min_rounds).sum()
 
-    # Evaluate standings conditions
-    for rank_cutoff, min_rounds in standings_conditions:
-        top_standings_teams = df[df['Standings Rank Actual'] <= rank_cutoff]
-        standings_results[(rank_cutoff, min_rounds)]['count'] += len(top_standings_teams)
-        standings_results[(rank_cutoff, min_rounds)]['qualified'] += (top_standings_teams['Result'] >= min_rounds).sum()
+def main() -> None:
+    args = parse_args()
+    instrumentation.enable_from_env()
 
+    # Load and rank every season's scores once for both reports
+    rank_tables = get_rank_tables(load_season_scores(config=args.config))
 
-# === Print Contender Score Success Rates ===
-print("\n=== CONTENDER SCORE RANKINGS ===")
-for (rank, rounds), data in score_results.items():
-    total = data['count']
-    qualified = data['qualified']
-    pct = 100 * qualified / total if total else 0
-    print(f"Top {rank:<2} teams — % that won ≥{rounds} round(s): {pct:.2f}% ({qualified}/{total})")
+    print_rank_stats(rank_tables=rank_tables)
+    print_success_rates(rank_tables=rank_tables)
 
 
-# === Print Standings Rank Success Rates ===
-print("\n=== STANDINGS RANKINGS ===")
-for (rank, rounds), data in standings_results.items():
-    total = data['count']
-    qualified = data['qualified']
-    pct = 100 * qualified / total if total else 0
-    print(f"Top {rank:<2} teams — % that won ≥{rounds} round(s): {pct:.2f}% ({qualified}/{total})")
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,240 @@
+# Imports
+import argparse
+import contextlib
+import json
+import os
+import uuid
+import numpy as np
+import pandas as pd
+import constants
+import data_cache
+
+# Folder that holds the scores of every weight configuration, one folder per configuration
+STORE_DIR = 'score_store'
+
+# Configuration the scores of the weights in constants are stored under
+DEFAULT_CONFIG = 'default'
+
+# Columns stored for every team season (the season is found from the rows it spans in the index)
+SCORE_COLUMNS = ['Team', 'Contender Score', 'Standings Rank', 'Result']
+
+# Every configuration keeps all of its seasons in one scores file, given a new unique name on every write so a
+# new file never replaces one that is memory mapped, and an index of that file's name and the rows of each season
+INDEX_NAME = 'index.json'
+
+
+# ====================================================================================================
+# FUNCTIONS FOR GETTING THE PATHS AND INDEXES OF STORED SCORES
+# ====================================================================================================
+
+def config_path(config: str) -> str:
+
+    if not config or os.sep in config or config.startswith('.'):
+        raise ValueError(f"Invalid configuration name: {config!r}")
+
+    return os.path.join(STORE_DIR, f'config={config}')
+
+
+def list_configs() -> list:
+
+    if not os.path.isdir(STORE_DIR):
+        return []
+
+    return sorted(name.split('=', 1)[1] for name in os.listdir(STORE_DIR)
+                  if name.startswith('config=') and os.path.exists(os.path.join(STORE_DIR, name, INDEX_NAME)))
+
+
+def load_index(config: str) -> dict:
+
+    index_path = os.path.join(config_path(config), INDEX_NAME)
+    if not os.path.exists(index_path):
+        return None
+
+    with open(index_path) as file:
+        index = json.load(file)
+
+    return index
+
+
+def order_seasons(seasons) -> list:
+
+    # Seasons are listed in the same order as constants.SEASONS, with any others after them
+    order = {season: position for position, season in enumerate(constants.SEASONS)}
+
+    return sorted(seasons, key=lambda season: (order.get(season, len(order)), season))
+
+
+def list_seasons(config: str) -> list:
+
+    index = load_index(config)
+    if index is None:
+        return []
+
+    return order_seasons(index['seasons'])
+
+
+
+# ====================================================================================================
+# FUNCTIONS FOR WRITING SCORES TO THE STORE
+# ====================================================================================================
+
+def get_records(scores_df: pd.DataFrame) -> np.ndarray:
+
+    # One record per team season, with text columns stored as fixed width strings so the whole file can be
+    # memory mapped
+    arrays = [scores_df[column].to_numpy() if pd.api.types.is_numeric_dtype(scores_df[column])
+              else scores_df[column].to_numpy(dtype=str) for column in SCORE_COLUMNS]
+    records = np.empty(len(scores_df), dtype=[(column, array.dtype) for column, array in zip(SCORE_COLUMNS, arrays)])
+    for column, array in zip(SCORE_COLUMNS, arrays):
+        records[column] = array
+
+    return records
+
+
+def write_scores(season_scores: dict, config: str = DEFAULT_CONFIG, weights: dict = None) -> None:
+
+    folder = config_path(config)
+
+    # Keep the weights the configuration was scored with next to its scores
+    if weights is not None:
+        data_cache.write_json(os.path.join(folder, 'weights.json'), weights)
+
+    # The stored seasons that are not written again keep their rows
+    previous_index = load_index(config)
+    stored_seasons = [season for season in list_seasons(config) if season not in season_scores]
+    season_frames = read_season_scores(config, stored_seasons, mmap=False) if stored_seasons else {}
+    season_frames.update(season_scores)
+    seasons = order_seasons(season_frames)
+
+    # Every season's rows follow each other in one file, with the rows each season spans kept in the index
+    scores_df = pd.concat([season_frames[season][SCORE_COLUMNS] for season in seasons], ignore_index=True)
+    stops = np.cumsum([len(season_frames[season]) for season in seasons]).tolist()
+    index = {
+        'scores': f'scores.{uuid.uuid4().hex}.npy',
+        'columns': SCORE_COLUMNS,
+        'seasons': {season: [stop - len(season_frames[season]), stop] for season, stop in zip(seasons, stops)},
+    }
+
+    # The scores file is written before the index that points to it, so readers always find a complete file
+    with data_cache.atomic_write(os.path.join(folder, index['scores'])) as tmp_path:
+        np.save(tmp_path, get_records(scores_df))
+    data_cache.write_json(os.path.join(folder, INDEX_NAME), index)
+
+    # Remove only the scores file the previous index named (readers that mapped it keep it until they close it),
+    # so a write running at the same time never loses the file its own index points to
+    if previous_index is not None:
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(os.path.join(folder, previous_index['scores']))
+
+
+def load_weights(config: str) -> dict:
+
+    weights_path = os.path.join(config_path(config), 'weights.json')
+    if not os.path.exists(weights_path):
+        return None
+
+    with open(weights_path) as file:
+        weights = json.load(file)
+
+    return weights
+
+
+
+# ====================================================================================================
+# FUNCTIONS FOR READING SCORES FROM THE STORE
+# ====================================================================================================
+
+def load_records(config: str, mmap: bool = True) -> tuple:
+
+    index = load_index(config)
+    if index is None:
+        raise FileNotFoundError(f"No scores stored for configuration {config!r}")
+
+    # A single file holds every season of the configuration, memory mapped unless asked otherwise
+    records = np.load(os.path.join(config_path(config), index['scores']), mmap_mode='r' if mmap else None)
+
+    return index, records
+
+
+def get_season_arrays(index: dict, records: np.ndarray, season: str, columns: list = SCORE_COLUMNS) -> dict:
+
+    if season not in index['seasons']:
+        raise FileNotFoundError(f"No scores stored for season {season!r}")
+
+    # Slicing a column of the records gives a view, so nothing is copied out of a memory mapped file
+    start, stop = index['seasons'][season]
+
+    return {column: records[column][start:stop] for column in columns}
+
+
+def read_partition_arrays(config: str, season: str, columns: list = SCORE_COLUMNS, mmap: bool = True) -> dict:
+    index, records = load_records(config, mmap)
+    return get_season_arrays(index, records, season, columns)
+
+
+def get_season_frame(season: str, arrays: dict, columns: list) -> pd.DataFrame:
+
+    # The frame holds its own copy of the columns (pandas consolidates them into blocks), so callers that only
+    # need the memory mapped arrays should use read_partition_arrays
+    return pd.DataFrame({'Season': season, **arrays}, columns=['Season'] + list(columns))
+
+
+def read_partition(config: str, season: str, columns: list = SCORE_COLUMNS, mmap: bool = True) -> pd.DataFrame:
+    return get_season_frame(season, read_partition_arrays(config, season, columns, mmap), columns)
+
+
+def read_scores(configs: list = None, seasons: list = None, columns: list = SCORE_COLUMNS,
+                mmap: bool = True) -> pd.DataFrame:
+
+    # Each configuration's scores file is opened once and only the rows of the requested seasons are read
+    configs = list_configs() if configs is None else configs
+    frames = []
+    for config in configs:
+        index, records = load_records(config, mmap)
+        config_seasons = order_seasons(index['seasons']) if seasons is None else seasons
+        for season in config_seasons:
+            season_arrays = get_season_arrays(index, records, season, columns)
+            frames.append(get_season_frame(season, season_arrays, columns).assign(Config=config))
+
+    if not frames:
+        return pd.DataFrame(columns=['Season'] + list(columns) + ['Config'])
+
+    return pd.concat(frames, ignore_index=True)
+
+
+def read_season_scores(config: str = DEFAULT_CONFIG, seasons: list = None, mmap: bool = True) -> dict:
+
+    # Stored scores of a configuration in the same form calculate_season_scores returns them
+    index, records = load_records(config, mmap)
+    seasons = order_seasons(index['seasons']) if seasons is None else seasons
+
+    return {season: get_season_frame(season, get_season_arrays(index, records, season), SCORE_COLUMNS)
+            for season in seasons}
+
+
+
+# ====================================================================================================
+# FUNCTION FOR EXPORTING STORED SCORES TO PER SEASON CSV FILES
+# ====================================================================================================
+
+def export_csvs(config: str = DEFAULT_CONFIG, seasons: list = None, folder: str = 'scores') -> None:
+
+    os.makedirs(folder, exist_ok=True)
+
+    for season, scores_df in read_season_scores(config, seasons, mmap=False).items():
+        scores_df.to_csv(os.path.join(folder, f'{season}_scores.csv'), index=False)
+
+
+def parse_args() -> argparse.Namespace:
+
+    parser = argparse.ArgumentParser(description='Export stored contender scores to per season CSV files.')
+    parser.add_argument('--config', default=DEFAULT_CONFIG, help='weight configuration to export')
+    parser.add_argument('--seasons', nargs='*', default=None, help='seasons to export (defaults to every stored season)')
+    parser.add_argument('--folder', default='scores', help='folder the CSV files are written to')
+
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    export_csvs(args.config, args.seasons, args.folder)
@@ -0,0 +1,165 @@
+# Imports
+import argparse
+import hashlib
+import json
+import os
+import time
+import numpy as np
+import pandas as pd
+import constants
+import data_cache
+import data_clean
+import instrumentation
+from data_relevant import get_franchise_abbreviations, get_teams_scoring_data
+from score_calculation import get_contender_scores, get_standings_ranks
+
+# Hashes of every team's rows in the last snapshot that was scored, and the season they belong to
+LIVE_STATE_PATH = 'relevant_data/live_state.json'
+
+
+def live_scores_path(season: str) -> str:
+
+    # Current ranking of every team in the season being updated
+    return f'relevant_data/{season}_live_scores.csv'
+
+
+# ====================================================================================================
+# FUNCTIONS FOR DETECTING WHICH TEAMS CHANGED BETWEEN SNAPSHOTS
+# ====================================================================================================
+
+def load_snapshot(season: str) -> tuple:
+
+    # Normalize the snapshot's raw files (a no-op for files that did not change)
+    data_clean.fix_team_abbreviations([season])
+    data_clean.abbreviate_standings_teams([season])
+
+    # Only the all situations rows are used for scoring
+    skaters_df = data_cache.read_skaters(season)
+    goalies_df = data_cache.read_goalies(season)
+    skaters_df = skaters_df[skaters_df['situation'] == 'all'].assign(Season=season)
+    goalies_df = goalies_df[goalies_df['situation'] == 'all'].assign(Season=season)
+
+    return skaters_df, goalies_df
+
+
+def get_team_hashes(skaters_df: pd.DataFrame, goalies_df: pd.DataFrame) -> dict:
+
+    team_hashes = {}
+
+    # Hash every team's rows in the order they are listed, since the order breaks ties when players are ranked,
+    # with the columns in a fixed order so the hashes don't depend on the order the columns were read in
+    for data_set, df in (('skaters', skaters_df), ('goalies', goalies_df)):
+        row_hashes = pd.util.hash_pandas_object(df[sorted(df.columns.drop('Season'))], index=False).to_numpy()
+        for team_abbrev, rows in df.groupby('team', sort=False, observed=True).indices.items():
+            team_hash = team_hashes.setdefault(team_abbrev, hashlib.sha256())
+            team_hash.update(data_set.encode())
+            team_hash.update(row_hashes[rows].tobytes())
+
+    return {team_abbrev: team_hash.hexdigest() for team_abbrev, team_hash in team_hashes.items()}
+
+
+def load_live_state(season: str) -> dict:
+
+    # A missing state or a state of another season means every team has to be scored
+    if not os.path.exists(LIVE_STATE_PATH):
+        return {}
+
+    with open(LIVE_STATE_PATH) as file:
+        state = json.load(file)
+
+    return state['hashes'] if state['season'] == season else {}
+
+
+def save_live_state(season: str, team_hashes: dict) -> None:
+    data_cache.write_json(LIVE_STATE_PATH, {'season': season, 'hashes': team_hashes})
+
+
+
+# ====================================================================================================
+# FUNCTION FOR RESCORING THE TEAMS THAT CHANGED AND UPDATING THE SEASON'S RANKING
+# ====================================================================================================
+
+def update_season_scores(season: str, weights=None) -> dict:
+
+    if weights is None:
+        weights = constants.SCORE_WEIGHTS
+
+    start = time.perf_counter()
+    team_abbrevs = list(get_franchise_abbreviations([season])[season].values())
+
+    # Find the teams whose raw data rows changed since the last snapshot
+    skaters_df, goalies_df = load_snapshot(season)
+    team_hashes = get_team_hashes(skaters_df, goalies_df)
+    saved_hashes = load_live_state(season)
+    scores_path = live_scores_path(season)
+    if not os.path.exists(scores_path):
+        saved_hashes = {}
+    changed_teams = [team_abbrev for team_abbrev in team_abbrevs
+                     if team_hashes.get(team_abbrev) != saved_hashes.get(team_abbrev)]
+
+    # Load the previous scoring data (parsing floats exactly so the rows that are kept are written back unchanged)
+    scoring_data = data_cache.read_csv('relevant_data/scoring_data.csv', float_precision='round_trip')
+
+    if changed_teams:
+        # Recompute the line and goalie scores of only the changed teams
+        is_changed = skaters_df['team'].isin(changed_teams)
+        changed_data = get_teams_scoring_data([(season, team_abbrev) for team_abbrev in changed_teams],
+                                              skaters_df[is_changed],
+                                              goalies_df[goalies_df['team'].isin(changed_teams)])
+
+        # Replace the changed teams' rows of the scoring data in place, adding any the season did not have yet
+        scoring_rows = scoring_data.set_index(['Season', 'Team']).index
+        changed_keys = pd.MultiIndex.from_frame(changed_data[['Season', 'Team']])
+        is_known = changed_keys.isin(scoring_rows)
+        positions = scoring_rows.get_indexer(changed_keys[is_known])
+        for column in changed_data.columns:
+            scoring_data.iloc[positions, scoring_data.columns.get_loc(column)] = changed_data.loc[is_known, column].to_numpy()
+        scoring_data = pd.concat([scoring_data, changed_data[~is_known]], ignore_index=True)
+        scoring_data.to_csv('relevant_data/scoring_data.csv', index=False)
+
+    # Only the line and goalie scores are kept between snapshots: every team of the season is scored again from
+    # its scoring data rows (a single vectorized pass), so changed weights or z score constants reach every team
+    season_data = scoring_data[scoring_data['Season'] == season]
+    contender_scores = dict(zip(season_data['Team'], get_contender_scores(season_data, weights).tolist()))
+
+    # Rank every team of the season, breaking ties in league order like the scores files do
+    standings_ranks = get_standings_ranks(data_cache.read_standings(season))
+    season_results = constants.TEAM_RESULTS.get(season, {})
+    live_scores = pd.DataFrame({
+        'Season': season,
+        'Team': team_abbrevs,
+        'Contender Score': [contender_scores.get(team_abbrev, np.nan) for team_abbrev in team_abbrevs],
+        'Standings Rank': [standings_ranks.get(team_abbrev, np.nan) for team_abbrev in team_abbrevs],
+        'Result': [season_results.get(team_abbrev, -1) for team_abbrev in team_abbrevs],
+    })
+    live_scores = live_scores.sort_values(by='Contender Score', ascending=False, kind='stable').reset_index(drop=True)
+    live_scores.to_csv(scores_path, index=False)
+
+    save_live_state(season, team_hashes)
+
+    update = {
+        'season': season,
+        'changed_teams': changed_teams,
+        'scores': live_scores,
+        'seconds': time.perf_counter() - start,
+    }
+
+    return update
+
+
+def parse_args() -> argparse.Namespace:
+
+    parser = argparse.ArgumentParser(description='Rescore the teams whose data changed in the latest snapshot.')
+    parser.add_argument('--season', default=constants.SEASONS[0], help='season of the snapshot')
+
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    instrumentation.enable_from_env()
+    update = update_season_scores(args.season)
+
+    print(f"Rebuilt the scoring data of {len(update['changed_teams'])} changed team(s) and rescored every team in "
+          f"{update['seconds']:.3f}s: {', '.join(update['changed_teams']) or 'none'}")
+    print(update['scores'].to_string(index=False))
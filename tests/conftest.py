@@ -0,0 +1,21 @@
+# Imports
+import os
+import sys
+import pytest
+
+# The modules are scripts at the top of the repo, so the tests import them from there
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import benchmark
+import data_clean
+
+
+@pytest.fixture
+def league(tmp_path):
+
+    # Run every test in its own small synthetic league with its raw data already normalized
+    league = benchmark.generate_league(str(tmp_path), num_seasons=4, num_teams=20)
+    with benchmark.use_league(str(tmp_path), league):
+        data_clean.fix_team_abbreviations(league['seasons'])
+        data_clean.abbreviate_standings_teams(league['seasons'])
+        yield league
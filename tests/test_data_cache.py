@@ -0,0 +1,97 @@
+# Imports
+import os
+import pandas as pd
+import data_cache
+
+
+def test_cache_miss_and_hit_give_the_same_frame(league):
+
+    file_path = data_cache.team_data_path(league['seasons'][0], 'skaters')
+
+    # A first read builds the cache, a second read with other columns rebuilds it keeping the first read's columns
+    data_cache.read_raw_csv(file_path, ['gameScore', 'team'])
+    for columns in (['games_played', 'team'], ['gameScore', 'situation', 'team']):
+        miss_df = data_cache.read_raw_csv(file_path, columns)
+        hit_df = data_cache.read_raw_csv(file_path, columns)
+
+        assert list(miss_df.columns) == columns
+        pd.testing.assert_frame_equal(miss_df, hit_df, check_exact=True)
+
+
+def test_interrupted_write_keeps_the_old_file(tmp_path):
+
+    file_path = str(tmp_path / 'state.json')
+    data_cache.write_json(file_path, {'version': 1})
+
+    # A writer that fails part way through leaves neither a broken file nor its temporary file behind
+    try:
+        with data_cache.atomic_write(file_path) as write_path:
+            with open(write_path, 'w') as file:
+                file.write('{"version": ')
+            raise KeyboardInterrupt
+    except KeyboardInterrupt:
+        pass
+
+    with open(file_path) as file:
+        assert file.read() == '{\n    "version": 1\n}'
+    assert os.listdir(tmp_path) == ['state.json']
+
+
+def test_fingerprint_rehashes_only_touched_files(tmp_path, monkeypatch):
+
+    file_path = str(tmp_path / 'data.csv')
+    with open(file_path, 'w') as file:
+        file.write('a,b\n1,2\n')
+    fingerprint = data_cache.get_file_fingerprint(file_path)
+
+    # An untouched file reuses its saved hash, a touched one is hashed again
+    monkeypatch.setattr(data_cache, 'get_file_hash', lambda file_path: 'rehashed')
+    assert data_cache.get_file_fingerprint(file_path, fingerprint) == fingerprint
+    os.utime(file_path, ns=(fingerprint['mtime_ns'] + 1, fingerprint['mtime_ns'] + 1))
+    assert data_cache.get_file_fingerprint(file_path, fingerprint)['sha256'] == 'rehashed'
+
+
+def test_writes_at_the_same_time_use_their_own_temporary_files(tmp_path):
+
+    # Two writes of the same file in one process (like two loader threads) never share a temporary file
+    file_path = str(tmp_path / 'columns.npz')
+    with data_cache.atomic_write(file_path) as first_path, data_cache.atomic_write(file_path) as second_path:
+        assert first_path != second_path
+        assert first_path.endswith('.npz') and second_path.endswith('.npz')
+
+
+def test_load_times_leave_the_cache_alone(league):
+
+    # The timed loads build and drop their own caches, so the cache already built keeps its files
+    data_cache.load_seasons(league['seasons'], workers=1)
+    cache_files = {name: os.stat(os.path.join(data_cache.CACHE_DIR, name, 'columns.npz')).st_mtime_ns
+                   for name in os.listdir(data_cache.CACHE_DIR)}
+
+    data_cache.report_load_times(league['seasons'], workers=2)
+
+    assert {name: os.stat(os.path.join(data_cache.CACHE_DIR, name, 'columns.npz')).st_mtime_ns
+            for name in os.listdir(data_cache.CACHE_DIR)} == cache_files
+    assert not [name for name in os.listdir('.') if name.startswith('load_times.')]
+
+
+def test_concurrent_loads_match_serial_load(league, tmp_path):
+
+    serial_frames = data_cache.load_seasons(league['seasons'], workers=1)
+
+    for executor in data_cache.LOAD_EXECUTORS:
+        # A cold load, where the workers parse the files and write the cache, then a warm load from that cache
+        with data_cache.use_cache_dir(str(tmp_path / executor)):
+            for _ in range(2):
+                frames = data_cache.load_seasons(league['seasons'], workers=4, executor=executor)
+
+                assert list(frames) == list(serial_frames)
+                for season, season_frames in serial_frames.items():
+                    assert list(frames[season]) == list(season_frames)
+                    for data_set, df in season_frames.items():
+                        pd.testing.assert_frame_equal(frames[season][data_set], df, check_exact=True)
+
+            # The workers wrote their cached copies to the cache folder in use
+            assert os.listdir(str(tmp_path / executor))
+
+        # The parity check the command line runs agrees
+        data_cache.check_load_parity(league['seasons'], workers=4, executor=executor)
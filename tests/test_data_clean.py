@@ -0,0 +1,55 @@
+# Imports
+import glob
+import os
+import pandas as pd
+import benchmark
+import data_cache
+import data_clean
+
+
+def read_raw_files() -> dict:
+
+    raw_files = {}
+    for file_path in sorted(glob.glob(os.path.join(data_cache.RAW_DATA_DIR, '**', '*.csv'), recursive=True)):
+        with open(file_path, 'rb') as file:
+            raw_files[file_path] = file.read()
+
+    return raw_files
+
+
+def test_normalization_runs_once_per_raw_file(tmp_path):
+
+    league = benchmark.generate_league(str(tmp_path), num_seasons=2, num_teams=6)
+    with benchmark.use_league(str(tmp_path), league):
+        seasons = league['seasons']
+
+        # Give one team the inconsistent abbreviation of the MoneyPuck exports
+        skaters_path = data_cache.team_data_path(seasons[0], 'skaters', data_cache.RAW_DATA_DIR)
+        skaters_df = pd.read_csv(skaters_path, dtype=str, keep_default_na=False)
+        skaters_df['team'] = skaters_df['team'].replace({'T03': 'L.A'})
+        skaters_df.to_csv(skaters_path, index=False)
+        raw_files = read_raw_files()
+
+        # The first run normalizes every raw file, and a second run finds nothing left to do
+        assert len(data_clean.fix_team_abbreviations(seasons)) == 3 * len(seasons)
+        assert len(data_clean.abbreviate_standings_teams(seasons)) == len(seasons)
+        assert data_clean.fix_team_abbreviations(seasons) == []
+        assert data_clean.abbreviate_standings_teams(seasons) == []
+
+        # The raw files are only read, and the normalized files hold the replacements
+        assert read_raw_files() == raw_files
+        normalized_df = data_cache.read_skaters(seasons[0])
+        assert 'LAK' in set(normalized_df['team']) and 'L.A' not in set(normalized_df['team'])
+        standings_df = data_cache.read_standings(seasons[0])
+        assert set(standings_df['Team']) == set(league['teams'])
+
+        # Editing a raw file normalizes only that file again
+        goalies_path = data_cache.team_data_path(seasons[1], 'goalies', data_cache.RAW_DATA_DIR)
+        last_row = raw_files[goalies_path].splitlines(keepends=True)[-1]
+        with open(goalies_path, 'ab') as file:
+            file.write(last_row)
+        assert data_clean.fix_team_abbreviations(seasons) == [goalies_path]
+        assert data_clean.fix_team_abbreviations(seasons) == []
+        assert data_clean.abbreviate_standings_teams(seasons) == []
+        with open(data_cache.team_data_path(seasons[1], 'goalies'), 'rb') as file:
+            assert file.read() == raw_files[goalies_path] + last_row
@@ -0,0 +1,30 @@
+# Imports
+import numpy as np
+import pandas as pd
+import constants
+import data_measures
+import data_relevant
+
+
+def test_add_seasons_matches_full_rebuild(league, monkeypatch):
+
+    # The newest season is left out of constants.SEASONS so it is genuinely new when it is added
+    new_season, *old_seasons = league['seasons']
+    monkeypatch.setattr(constants, 'SEASONS', old_seasons)
+    data_relevant.get_season_abbreviations.cache_clear()
+
+    # Save the measures of the older seasons, then merge the new season into them
+    old_data = data_relevant.get_all_scoring_data(old_seasons)
+    data_measures.save_state(data_measures.get_result_accumulators(old_data), old_seasons)
+    accumulators, seasons = data_measures.add_seasons([new_season])
+
+    # Accumulate every season from scratch
+    full_data = data_relevant.get_all_scoring_data(league['seasons'])
+    full_accumulators = data_measures.get_result_accumulators(full_data)
+
+    assert seasons == old_seasons + [new_season]
+    assert data_measures.load_state()[1] == seasons
+    for key, values in full_accumulators.items():
+        np.testing.assert_allclose(accumulators[key], values, rtol=1e-12, atol=1e-12)
+    pd.testing.assert_frame_equal(data_measures.get_measures_data(accumulators=accumulators),
+                                  data_measures.get_measures_data(full_data))
@@ -0,0 +1,41 @@
+# Imports
+import pandas as pd
+import constants
+import data_cache
+import data_relevant
+
+
+def test_all_scoring_data_matches_per_team(league):
+
+    # The synthetic rosters have many players tied on games played, so the tie order is checked as well
+    per_team_data = pd.concat([data_relevant.get_season_scoring_data(season) for season in league['seasons']],
+                              ignore_index=True)
+    all_at_once_data = data_relevant.get_all_scoring_data(league['seasons'])
+
+    pd.testing.assert_frame_equal(all_at_once_data, per_team_data, check_exact=True)
+
+
+def test_new_season_keeps_current_teams():
+
+    # A season after the last one in constants.SEASONS is played by every current team under its own name
+    season = f'{int(constants.SEASONS[0][:4]) + 1}-{int(constants.SEASONS[0][:4]) + 2}'
+
+    assert data_relevant.get_season_teams(season) == constants.TEAM_ABBREVIATIONS
+
+
+def test_per_team_path_matches_raw_csv_reads(league):
+
+    # The baseline read each team's players straight from the raw files, so ties were sorted as parsed from them
+    season = league['seasons'][0]
+    skaters_df = pd.read_csv(data_cache.team_data_path(season, 'skaters'), usecols=data_cache.SKATER_COLUMNS)
+    goalies_df = pd.read_csv(data_cache.team_data_path(season, 'goalies'), usecols=data_cache.GOALIE_COLUMNS)
+    raw_season_data = {
+        'skaters': dict(tuple(skaters_df[skaters_df['situation'] == 'all'].groupby('team'))),
+        'goalies': dict(tuple(goalies_df[goalies_df['situation'] == 'all'].groupby('team'))),
+    }
+    season_data = data_relevant.load_season_data(season)
+
+    for team_abbrev in league['teams']:
+        pd.testing.assert_series_equal(data_relevant.get_scoring_data(season, team_abbrev, season_data),
+                                       data_relevant.get_scoring_data(season, team_abbrev, raw_season_data),
+                                       check_exact=True)
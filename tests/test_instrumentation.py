@@ -0,0 +1,56 @@
+# Imports
+import numpy as np
+import pandas as pd
+import pytest
+import data_cache
+import instrumentation
+import pipeline
+
+
+@pytest.fixture
+def profile():
+
+    # Record into a fresh profile and turn the instrumentation off again afterwards
+    instrumentation.enable()
+    yield instrumentation.PROFILE
+    instrumentation.disable()
+
+
+def test_enabling_leaves_pandas_alone(league, profile):
+
+    # Only the repo's own read helpers count the CSV files they parse
+    assert pd.read_csv.__module__.startswith('pandas')
+    pd.read_csv(data_cache.standings_path(league['seasons'][0]))
+    assert profile['counters'].get('csv_reads', 0) == 0
+
+    data_cache.read_standings(league['seasons'][0])
+    assert profile['counters']['csv_reads'] == 1
+
+
+def test_scoring_data_and_scores_reads_are_counted(league, profile):
+
+    # Once the raw files are cached, the stages after clean and relevant only parse the scoring data (once for
+    # the measures and once for the scores) and every season's scores file
+    pipeline.run_pipeline()
+    profile['counters'].clear()
+    pipeline.run_pipeline(['measures', 'scores', 'statistics'])
+
+    assert profile['counters']['csv_reads'] == 2 + len(league['seasons'])
+
+
+def test_binned_percentiles_match_exact_ones(profile):
+
+    # Durations of many calls spread over a few orders of magnitude, kept in a fixed number of bins
+    durations_ns = np.random.default_rng(0).lognormal(mean=13, sigma=1.5, size=50_000).astype(np.int64)
+    for duration_ns in durations_ns:
+        instrumentation.add_duration('span', int(duration_ns))
+    durations = profile['durations']['span']
+    assert durations['bins'].shape == (instrumentation.NUM_BINS,)
+
+    # Every percentile is within the width of half a bin of the exact one, and the calls and longest call are exact
+    binned = instrumentation.get_binned_percentiles(durations)
+    exact = instrumentation.get_latency_percentiles(durations_ns / 1e6)
+    for key in ('p50_ms', 'p90_ms', 'p99_ms'):
+        assert binned[key] == pytest.approx(exact[key], rel=2 ** (0.5 / instrumentation.BINS_PER_DOUBLING) - 1 + 1e-3)
+    assert binned['max_ms'] == exact['max_ms']
+    assert durations['calls'] == len(durations_ns) and durations['total_ns'] == durations_ns.sum()
@@ -0,0 +1,75 @@
+# Imports
+import copy
+import os
+import pandas as pd
+import pytest
+import constants
+import data_cache
+import pipeline
+
+STAGES = ['clean', 'relevant', 'measures', 'scores', 'statistics']
+
+
+def get_ran_stages(force: list = ()) -> list:
+    return [name for name, ran in pipeline.run_pipeline(force).items() if ran]
+
+
+def test_unchanged_stages_are_skipped(league):
+
+    # The first run runs every stage, and a second run with nothing changed runs none of them
+    assert get_ran_stages() == STAGES
+    assert get_ran_stages() == []
+
+    # Forcing a stage runs only that stage when its outputs come out the same
+    assert get_ran_stages(['measures']) == ['measures']
+    assert get_ran_stages(['all']) == STAGES
+
+
+def test_changed_input_file_reruns_stages(league):
+
+    get_ran_stages()
+
+    # A changed raw file is normalized again, and every stage reading what that changed runs again
+    skaters_path = data_cache.team_data_path(league['seasons'][0], 'skaters', data_cache.RAW_DATA_DIR)
+    skaters_df = pd.read_csv(skaters_path, float_precision='round_trip')
+    skaters_df.loc[skaters_df['team'] == 'T03', 'gameScore'] += 1.0
+    skaters_df.to_csv(skaters_path, index=False)
+
+    assert get_ran_stages() == STAGES
+    assert get_ran_stages() == []
+
+
+def test_changed_constant_reruns_stages(league, monkeypatch):
+
+    get_ran_stages()
+
+    # Only the stages that depend on the weights run, and statistics runs again because the scores changed
+    weights = {group: weight * 2 for group, weight in constants.SCORE_WEIGHTS.items()}
+    monkeypatch.setattr(constants, 'SCORE_WEIGHTS', weights)
+
+    assert get_ran_stages() == ['scores', 'statistics']
+    assert get_ran_stages() == []
+
+
+def test_changed_upstream_output_reruns_downstream_stages(league, monkeypatch):
+
+    get_ran_stages()
+
+    # The results don't change the measures stage's constants, but they change the scoring data it reads
+    team_results = copy.deepcopy(constants.TEAM_RESULTS)
+    season = league['seasons'][0]
+    team_abbrev = next(team_abbrev for team_abbrev, result in team_results[season].items() if result == 4)
+    team_results[season][team_abbrev] = 3
+    monkeypatch.setattr(constants, 'TEAM_RESULTS', team_results)
+
+    assert get_ran_stages() == ['relevant', 'measures', 'scores', 'statistics']
+    assert get_ran_stages() == []
+
+
+def test_unknown_forced_stage_is_rejected(league):
+
+    with pytest.raises(ValueError, match="'cleen'"):
+        pipeline.run_pipeline(['clean', 'cleen'])
+
+    # Nothing ran before the stage names were checked
+    assert not os.path.exists(pipeline.STATE_PATH)
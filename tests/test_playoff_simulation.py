@@ -0,0 +1,46 @@
+# Imports
+import numpy as np
+import pandas as pd
+import pytest
+import playoff_simulation
+
+
+def get_season_scores(num_teams: int, seed: int = 0) -> pd.DataFrame:
+
+    # Playoff teams of both conferences with random scores and standings ranks
+    rng = np.random.default_rng(seed)
+    teams = ['BOS', 'BUF', 'CAR', 'DET', 'FLA', 'MTL', 'NJD', 'NYI', 'NYR', 'OTT',
+             'ANA', 'CGY', 'CHI', 'COL', 'DAL', 'EDM', 'LAK', 'MIN', 'NSH', 'SJS']
+    season_scores = pd.DataFrame({
+        'Season': '2018-2019',
+        'Team': rng.choice(teams, size=num_teams, replace=False),
+        'Contender Score': np.round(rng.normal(20, 15, size=num_teams), 2),
+        'Standings Rank': rng.permutation(num_teams) + 1,
+        'Result': 0,
+    })
+
+    return season_scores
+
+
+@pytest.mark.parametrize('num_teams', [20, 11])
+def test_simulation_matches_exact_probabilities(num_teams):
+
+    # With fewer teams than bracket slots some seeds are byes, which every team beats
+    _, slot_teams, series_probabilities = playoff_simulation.get_bracket(get_season_scores(num_teams), scale=0.05)
+    has_team = slot_teams >= 0
+    assert has_team.sum() == min(num_teams, len(playoff_simulation.BRACKET_SEEDS))
+
+    # The simulated probabilities of every team agree with the exact ones up to five standard errors of the most
+    # uncertain probability
+    num_simulations = 400_000
+    simulated = playoff_simulation.simulate_bracket(series_probabilities, num_simulations, seed=0)
+    exact = playoff_simulation.get_exact_probabilities(series_probabilities, has_team)
+    np.testing.assert_allclose(simulated[:, has_team], exact[:, has_team], rtol=0,
+                               atol=5 * np.sqrt(0.25 / num_simulations))
+
+    # With a full bracket exactly one team wins each series, so the teams' chances of winning each round add up
+    # to the number of series played in it
+    if not has_team.all():
+        return
+    num_series = len(playoff_simulation.BRACKET_SEEDS) // 2 ** np.arange(1, len(playoff_simulation.ROUND_COLUMNS) + 1)
+    np.testing.assert_allclose(exact.sum(axis=1), num_series)
@@ -0,0 +1,58 @@
+# Imports
+import os
+import numpy as np
+import pandas as pd
+import constants
+import data_relevant
+import score_calculation
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def test_saved_scores_match_scoring_data():
+
+    # The saved contender scores must be the ones the current code gives from the saved scoring data
+    scoring_data = pd.read_csv(os.path.join(ROOT, 'relevant_data', 'scoring_data.csv'))
+    scoring_data['Expected Score'] = score_calculation.get_contender_scores(scoring_data)
+
+    for season in constants.SEASONS:
+        season_scores = pd.read_csv(os.path.join(ROOT, 'scores', f'{season}_scores.csv'))
+        merged = season_scores.merge(scoring_data, on=['Season', 'Team'], suffixes=('', ' Scoring Data'))
+
+        assert len(merged) == len(season_scores)
+        assert (merged['Contender Score'] == merged['Expected Score']).all()
+        assert (merged['Result'] == merged['Result Scoring Data']).all()
+        assert merged['Contender Score'].is_monotonic_decreasing
+
+
+def test_default_seasons_follow_constants(league):
+
+    # Functions called without seasons use constants.SEASONS as it is when they run (the league's seasons here)
+    scoring_data = data_relevant.get_all_scoring_data()
+    season_scores = score_calculation.calculate_season_scores(scoring_data)
+
+    assert scoring_data['Season'].unique().tolist() == league['seasons']
+    assert list(season_scores) == league['seasons']
+
+
+def test_indexed_contender_score_matches_scoring_data():
+
+    # Scoring a team season from the scoring index gives the same score and result as from the scoring data
+    scoring_data = pd.read_csv(os.path.join(ROOT, 'relevant_data', 'scoring_data.csv'))
+    scoring_index = score_calculation.index_scoring_data(scoring_data)
+    weights = {group: weight + 0.5 for group, weight in constants.SCORE_WEIGHTS.items()}
+
+    for season, team_abbrev in zip(scoring_data['Season'], scoring_data['Team']):
+        for team_weights in (None, weights):
+            assert (score_calculation.get_contender_score(team_abbrev, season, scoring_index, team_weights) ==
+                    score_calculation.get_contender_score(team_abbrev, season, scoring_data, team_weights))
+
+
+def test_scores_are_rounded_like_the_baseline():
+
+    # Python rounds these floats to the other side of the half way point than NumPy does, and the baseline rounded
+    # NumPy floats (the values of a scoring data row), so the scores have to follow NumPy
+    scores = np.array([0.015, 0.025, 0.155, -0.075, 1.2345])
+    assert [round(float(score), 2) for score in scores] != [round(score, 2) for score in scores]
+
+    assert score_calculation.round_scores(scores).tolist() == [round(score, 2) for score in scores]
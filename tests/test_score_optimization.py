@@ -0,0 +1,202 @@
+# Imports
+import os
+import numpy as np
+import pandas as pd
+import pytest
+import constants
+import data_relevant
+import score_optimization
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@pytest.fixture
+def evaluation_index(monkeypatch):
+
+    # Evaluate the saved scoring data, with standings that list every team (the raw standings aren't checked in)
+    monkeypatch.chdir(ROOT)
+    score_optimization.load_scoring_data.cache_clear()
+    season_frames = {
+        season: {'standings': pd.DataFrame({'Rk': np.arange(1, len(constants.TEAM_ABBREVIATIONS) + 1),
+                                            'Team': constants.TEAM_ABBREVIATIONS})}
+        for season in constants.SEASONS
+    }
+    yield score_optimization.build_evaluation_index(season_frames)
+    score_optimization.load_scoring_data.cache_clear()
+
+
+@pytest.fixture
+def league_index(league):
+
+    # Evaluate the synthetic league's scoring data
+    data_relevant.get_all_scoring_data(league['seasons']).to_csv('relevant_data/scoring_data.csv', index=False)
+    score_optimization.load_scoring_data.cache_clear()
+    yield score_optimization.build_evaluation_index()
+    score_optimization.load_scoring_data.cache_clear()
+
+
+def get_weight_batch(num_candidates: int, seed: int = 0) -> np.ndarray:
+
+    # Random weights in the searched ranges
+    low, high = score_optimization.get_weight_bounds()
+
+    return np.random.default_rng(seed).uniform(low, high, size=(num_candidates, len(low)))
+
+
+def get_baseline_score(weights: dict, evaluation_rows: pd.DataFrame, scoring_data: pd.DataFrame) -> float:
+
+    # The original objective: every team is scored on its own, adding its groups' weighted z scores one at a time
+    scores = []
+    for row in evaluation_rows['Row']:
+        score = 0
+        for group, column in constants.SCORE_GROUP_COLUMNS.items():
+            z_score = (scoring_data[column].iloc[row] - constants.Z_STATS[group]['mean']) / constants.Z_STATS[group]['std']
+            score += z_score * weights[group]
+        scores.append(round(score, 2))
+    df = evaluation_rows.assign(**{'Contender Score': scores})
+
+    # Each season is sorted with pandas' default sort and the playoff teams are counted by team name
+    counts = {'top1': 0, 'top2': 0, 'top4': 0, 'top8': 0}
+    cup_winner_ranks = []
+    for season in constants.SEASONS:
+        season_df = df[df['Season'] == season]
+        df_sorted = season_df.sort_values(by='Contender Score', ascending=False).reset_index(drop=True)
+
+        cup_winners = season_df[season_df['Result'] == 4]
+        counts['top1'] += any(team in df_sorted.head(1)['Team'].tolist() for team in cup_winners['Team'])
+        for count, num_teams, result in (('top2', 2, 3), ('top4', 4, 2), ('top8', 8, 1)):
+            top_teams = df_sorted.head(num_teams)['Team'].tolist()
+            counts[count] += sum(team in top_teams for team in season_df[season_df['Result'] >= result]['Team'])
+
+        if not cup_winners.empty:
+            cup_winner_ranks.append(df_sorted[df_sorted['Team'] == cup_winners.iloc[0]['Team']].index[0] + 1)
+
+    avg_cup_rank = round(sum(cup_winner_ranks) / len(cup_winner_ranks), 3) if cup_winner_ranks else float('inf')
+
+    return (counts['top1'] * 1_000_000 + counts['top2'] * 10_000 + counts['top4'] * 100 + counts['top8'] -
+            avg_cup_rank)
+
+
+def test_weight_batch_matches_baseline_objective(evaluation_index):
+
+    # Random weights, weights that tie every team (all zero), and weights with some groups left out
+    weight_batch = np.concatenate([
+        get_weight_batch(40),
+        np.zeros((1, len(constants.SCORE_GROUP_COLUMNS))),
+        get_weight_batch(10, seed=1) * (np.random.default_rng(2).random((10, len(constants.SCORE_GROUP_COLUMNS))) < 0.5),
+        np.eye(len(constants.SCORE_GROUP_COLUMNS)),
+    ])
+    scores = score_optimization.evaluate_weight_batch(weight_batch, evaluation_index, batch_size=16)['score']
+
+    scoring_data = score_optimization.load_scoring_data()
+    for weight_vector, score in zip(weight_batch, scores):
+        weights = dict(zip(constants.SCORE_GROUP_COLUMNS, weight_vector.tolist()))
+        assert score == get_baseline_score(weights, evaluation_index['rows'], scoring_data)
+
+
+def test_random_search_finds_best_candidate(evaluation_index, monkeypatch):
+
+    # The search draws the same candidates as a direct draw with its seed and keeps the best of them
+    monkeypatch.setattr(score_optimization, 'get_evaluation_index', lambda: evaluation_index)
+    best_weights, best_score = score_optimization.random_search(500, batch_size=128, seed=3)
+
+    low, high = score_optimization.get_weight_bounds()
+    rng = np.random.default_rng(3)
+    weight_batch = np.concatenate([rng.uniform(low, high, size=(size, len(low))) for size in (128, 128, 128, 116)])
+    scores = score_optimization.evaluate_weight_batch(weight_batch, evaluation_index)['score']
+
+    assert best_score == scores.max()
+    assert score_optimization.evaluate_weights(best_weights, evaluation_index)['score'] == best_score
+
+
+def test_stale_trials_are_failed(tmp_path):
+    optuna = pytest.importorskip('optuna')
+
+    # A trial that was asked for but never told is left running, like one whose worker was interrupted
+    storage = str(tmp_path / 'study.log')
+    study = optuna.create_study(study_name='stale', storage=score_optimization.get_storage(storage))
+    study.ask()
+    study.tell(study.ask(), 1.0)
+
+    assert score_optimization.fail_stale_trials('stale', storage) == 1
+    assert [trial.state for trial in study.get_trials()] == [optuna.trial.TrialState.FAIL,
+                                                             optuna.trial.TrialState.COMPLETE]
+
+
+def test_exact_bound_holds_for_sampled_weights(league_index):
+
+    # However little of the range is explored, no weights in it score above the upper bound
+    optimization = score_optimization.optimize_exact(max_boxes=2000, batch_size=256, evaluation_index=league_index)
+    scores = score_optimization.evaluate_weight_batch(get_weight_batch(20000), league_index)['score']
+
+    assert optimization['upper_bound'] >= scores.max()
+    assert optimization['score'] == score_optimization.evaluate_weights(optimization['weights'], league_index)['score']
+
+
+def test_exact_search_finds_brute_force_optimum(league_index):
+
+    low, high = score_optimization.get_weight_bounds()
+    for free, free_group in enumerate(constants.SCORE_GROUP_COLUMNS):
+
+        # Pin every weight but one to the middle of its range, so the whole range of that weight can be brute forced
+        pinned = np.where(np.arange(len(low)) == free, 0, (low + high) / 2)
+        with pytest.MonkeyPatch.context() as monkeypatch:
+            for group, weight in zip(constants.SCORE_GROUP_COLUMNS, pinned):
+                if group != free_group:
+                    monkeypatch.setitem(score_optimization.WEIGHT_BOUNDS, group, (weight, weight))
+            optimization = score_optimization.optimize_exact(max_boxes=10_000, evaluation_index=league_index)
+
+        # Rounded scores (and so the ranks) only change where a team's score crosses the middle of two hundredths,
+        # so scoring those points and the points halfway between them scores every value the objective takes
+        z_matrix = league_index['z_matrix'][~np.isnan(league_index['z_matrix']).any(axis=1)]
+        offsets = z_matrix @ pinned
+        slopes = z_matrix[:, free]
+        crossings = [low[free], high[free]]
+        for offset, slope in zip(offsets[slopes != 0], slopes[slopes != 0]):
+            ends = np.sort([offset + slope * low[free], offset + slope * high[free]])
+            middles = np.arange(np.floor(ends[0] * 100), np.ceil(ends[1] * 100) + 1) / 100 + 0.005
+            crossings.extend((middles - offset) / slope)
+        crossings = np.unique(np.clip(crossings, low[free], high[free]))
+        weight_batch = np.tile(pinned, (2 * len(crossings) - 1, 1))
+        weight_batch[:, free] = np.concatenate([crossings, (crossings[1:] + crossings[:-1]) / 2])
+        scores = score_optimization.evaluate_weight_batch(weight_batch, league_index)['score']
+
+        # The search runs out of boxes before it runs out of budget and finds the best score (pairs of teams that
+        # stay within the rounding margin of each other can leave it unable to prove that, but never above the bound)
+        assert optimization['boxes_explored'] < 10_000
+        assert optimization['score'] == scores.max()
+        assert optimization['upper_bound'] >= scores.max()
+
+
+def get_index_seasons(evaluation_index: dict) -> list:
+    seasons = evaluation_index['rows']['Season'].to_numpy()
+    return sorted(set(seasons[evaluation_index['season_rows'][evaluation_index['is_team']]]))
+
+
+def test_cross_validation_holds_out_each_season_once(league_index, monkeypatch):
+
+    # Record the seasons every fold is fit to
+    training_seasons = []
+    optimize_exact = score_optimization.optimize_exact
+
+    def record_training_seasons(max_boxes, evaluation_index):
+        training_seasons.append(get_index_seasons(evaluation_index))
+        return optimize_exact(max_boxes, evaluation_index=evaluation_index)
+
+    monkeypatch.setattr(score_optimization, 'get_evaluation_index', lambda: league_index)
+    monkeypatch.setattr(score_optimization, 'optimize_exact', record_training_seasons)
+    folds = score_optimization.cross_validate('exact', max_boxes=500)
+
+    # Every season is held out by exactly one fold, and each fold is fit to every other season
+    seasons = list(constants.SEASONS)
+    assert [fold['season'] for fold in folds] == seasons
+    assert training_seasons == [sorted(set(seasons) - {fold['season']}) for fold in folds]
+
+    # Each held out score is the score of that season alone, as if it were the only season
+    for fold in folds:
+        with monkeypatch.context() as season_patch:
+            season_patch.setattr(constants, 'SEASONS', [fold['season']])
+            season_index = score_optimization.build_evaluation_index()
+        assert get_index_seasons(season_index) == [fold['season']]
+        assert fold['metrics'] == score_optimization.evaluate_weights(fold['weights'], season_index)
+        assert fold['num_cup_winners'] == len(season_index['cup_winner_seasons'])
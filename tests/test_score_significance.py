@@ -0,0 +1,58 @@
+# Imports
+import numpy as np
+import pandas as pd
+import score_significance
+
+# Rounds won by the 16 playoff teams of a season
+PLAYOFF_ROUNDS_WON = [4, 3, 2, 2, 1, 1, 1, 1, 0, 0, 0, 0, 0, 0, 0, 0]
+
+
+def get_scores_df(num_seasons: int, seed: int = 0) -> pd.DataFrame:
+
+    rng = np.random.default_rng(seed)
+    weight_set_frames = []
+
+    for season_number in range(num_seasons):
+        # The standings rank the teams that went furthest in the playoffs last
+        results = np.array(PLAYOFF_ROUNDS_WON)
+        standings_ranks = 1 + np.argsort(np.argsort(results, kind='stable'), kind='stable')
+        season_df = pd.DataFrame({
+            'Season': f'{2000 + season_number}{2001 + season_number}',
+            'Team': [f'T{number:02d}' for number in rng.permutation(len(results))],
+            'Standings Rank': standings_ranks,
+            'Result': results,
+        })
+
+        # Weight set 0 ranks the teams exactly like the standings, and weight sets 1 and 2 are the same weights,
+        # which rank the teams in the order they went in the playoffs
+        weight_set_frames += [
+            season_df.assign(**{'Weight Set': 0, 'Contender Score': -standings_ranks.astype(float)}),
+            season_df.assign(**{'Weight Set': 1, 'Contender Score': results + rng.random(len(results))}),
+        ]
+        weight_set_frames.append(weight_set_frames[-1].assign(**{'Weight Set': 2}))
+
+    return pd.concat(weight_set_frames, ignore_index=True)
+
+
+def test_significance_of_ranking_differences():
+
+    significance_table = score_significance.get_significance_table(get_scores_df(20), num_resamples=5000, seed=0,
+                                                                   workers=1)
+
+    # Ranking exactly like the standings gives no difference at all, which every resample matches
+    same_as_standings = significance_table.loc[0]
+    assert (same_as_standings['Difference'] == 0).all()
+    assert (same_as_standings['P-Value'] == 1).all()
+
+    # Ranking every season's playoff teams in order beats the reversed standings in every resample
+    dominating = significance_table.loc[1]
+    assert (dominating['P-Value'] < 0.001).all()
+    assert (dominating['Difference Low'] * dominating['Difference High'] > 0).all()
+
+    # The same weights give the same table, since every weight set is resampled with the same seed
+    pd.testing.assert_frame_equal(significance_table.loc[2], dominating)
+
+    # The same seed gives the same table again
+    pd.testing.assert_frame_equal(
+        score_significance.get_significance_table(get_scores_df(20), num_resamples=5000, seed=0, workers=1),
+        significance_table)
@@ -0,0 +1,82 @@
+# Imports
+import os
+import numpy as np
+import pandas as pd
+import constants
+import score_store
+
+
+def get_season_scores(seasons: list, seed: int = 0) -> dict:
+
+    # Scores of a few playoff teams per season, in the form calculate_season_scores returns them
+    rng = np.random.default_rng(seed)
+    season_scores = {}
+    for season in seasons:
+        num_teams = int(rng.integers(4, 9))
+        season_scores[season] = pd.DataFrame({
+            'Season': season,
+            'Team': [f'T{team}' for team in rng.choice(30, size=num_teams, replace=False)],
+            'Contender Score': np.round(rng.normal(size=num_teams), 2),
+            'Standings Rank': rng.choice(np.arange(1, 33), size=num_teams, replace=False),
+            'Result': rng.integers(0, 5, size=num_teams),
+        })
+
+    return season_scores
+
+
+def test_write_read_and_export_round_trip(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+
+    # A first write stores two seasons, a second rewrites one of them and adds another
+    season_scores = get_season_scores(['2018-2019', '2019-2020'])
+    score_store.write_scores(season_scores, 'trial', {'Weight': 1.5})
+    season_scores.update(get_season_scores(['2019-2020', '2020-2021'], seed=1))
+    score_store.write_scores({season: season_scores[season] for season in ['2020-2021', '2019-2020']}, 'trial')
+
+    # Every season of a configuration is kept in a single scores file next to its index and weights
+    assert score_store.list_configs() == ['trial']
+    assert score_store.list_seasons('trial') == [season for season in constants.SEASONS if season in season_scores]
+    assert len(os.listdir(score_store.config_path('trial'))) == 3
+    assert score_store.load_weights('trial') == {'Weight': 1.5}
+
+    # Memory mapped and loaded reads both give back the frames that were written
+    for mmap in (True, False):
+        for season, scores_df in score_store.read_season_scores('trial', mmap=mmap).items():
+            pd.testing.assert_frame_equal(scores_df, season_scores[season], check_dtype=False)
+    arrays = score_store.read_partition_arrays('trial', '2019-2020', ['Contender Score'])
+    assert isinstance(arrays['Contender Score'].base, np.memmap)
+
+    all_scores = score_store.read_scores(['trial'], ['2020-2021', '2018-2019'])
+    expected_df = pd.concat([season_scores['2020-2021'], season_scores['2018-2019']], ignore_index=True)
+    pd.testing.assert_frame_equal(all_scores.drop(columns='Config'), expected_df, check_dtype=False)
+
+    # The exported CSV files read back as the written frames
+    score_store.export_csvs('trial', folder='exported')
+    for season, scores_df in season_scores.items():
+        csv_df = pd.read_csv(os.path.join('exported', f'{season}_scores.csv'))
+        pd.testing.assert_frame_equal(csv_df, scores_df, check_dtype=False)
+
+
+def test_second_write_replaces_only_the_indexed_file(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+
+    season_scores = get_season_scores(['2018-2019', '2019-2020'])
+    score_store.write_scores(season_scores, 'trial')
+    first_index = score_store.load_index('trial')
+
+    # A scores file written by another writer at the same time, which its own index may still point to
+    folder = score_store.config_path('trial')
+    other_name = 'scores.123.npy'
+    np.save(os.path.join(folder, other_name), score_store.get_records(season_scores['2018-2019']))
+
+    # A second write of one season keeps the other season's rows and only removes the file the old index named
+    new_scores = get_season_scores(['2019-2020'], seed=2)
+    score_store.write_scores(new_scores, 'trial')
+    second_index = score_store.load_index('trial')
+
+    assert second_index['scores'] != first_index['scores']
+    assert sorted(os.listdir(folder)) == sorted([score_store.INDEX_NAME, second_index['scores'], other_name])
+    pd.testing.assert_frame_equal(score_store.read_partition('trial', '2019-2020'), new_scores['2019-2020'],
+                                  check_dtype=False)
+    pd.testing.assert_frame_equal(score_store.read_partition('trial', '2018-2019'), season_scores['2018-2019'],
+                                  check_dtype=False)
@@ -0,0 +1,54 @@
+# Imports
+import os
+import pandas as pd
+import data_cache
+import data_relevant
+import score_update
+
+
+def test_only_changed_teams_are_rescored(league):
+
+    season = league['seasons'][0]
+    data_relevant.get_all_scoring_data(league['seasons']).to_csv('relevant_data/scoring_data.csv', index=False)
+
+    # The first snapshot scores every team, and the same snapshot again changes none of them
+    assert score_update.update_season_scores(season)['changed_teams'] == league['teams']
+    assert score_update.update_season_scores(season)['changed_teams'] == []
+
+    # Changing one team's game scores only rescores that team, once
+    skaters_path = data_cache.team_data_path(season, 'skaters', data_cache.RAW_DATA_DIR)
+    skaters_df = pd.read_csv(skaters_path, float_precision='round_trip')
+    skaters_df.loc[skaters_df['team'] == 'T03', 'gameScore'] += 1.0
+    skaters_df.to_csv(skaters_path, index=False)
+
+    assert score_update.update_season_scores(season)['changed_teams'] == ['T03']
+    assert score_update.update_season_scores(season)['changed_teams'] == []
+
+
+def test_update_matches_full_rebuild(league):
+
+    season = league['seasons'][0]
+    data_relevant.get_all_scoring_data(league['seasons']).to_csv('relevant_data/scoring_data.csv', index=False)
+    score_update.update_season_scores(season)
+
+    # Change one team's skaters and another team's goalies between snapshots
+    for data_set, team_abbrev, column in (('skaters', 'T03', 'gameScore'), ('goalies', 'T07', 'xGoals')):
+        data_path = data_cache.team_data_path(season, data_set, data_cache.RAW_DATA_DIR)
+        data_df = pd.read_csv(data_path, float_precision='round_trip')
+        data_df.loc[data_df['team'] == team_abbrev, column] += 1.0
+        data_df.to_csv(data_path, index=False)
+    update = score_update.update_season_scores(season)
+    assert update['changed_teams'] == ['T03', 'T07']
+
+    # The updated scoring data equals the scoring data built again from every raw file
+    updated_data = pd.read_csv('relevant_data/scoring_data.csv', float_precision='round_trip')
+    rebuilt_data = data_relevant.get_all_scoring_data(league['seasons'])
+    pd.testing.assert_frame_equal(updated_data, rebuilt_data, check_dtype=False)
+
+    # The live scores equal the ones scored from the rebuilt data with no saved snapshot
+    rebuilt_data.to_csv('relevant_data/scoring_data.csv', index=False)
+    os.remove(score_update.LIVE_STATE_PATH)
+    rebuilt = score_update.update_season_scores(season)
+    assert rebuilt['changed_teams'] == league['teams']
+    pd.testing.assert_frame_equal(update['scores'], rebuilt['scores'])
+    pd.testing.assert_frame_equal(pd.read_csv(score_update.live_scores_path(season)), rebuilt['scores'])